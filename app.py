@@ -1,63 +1,74 @@
-import os
-import random
-import time
 import base64
+import os
 import uuid
 
 import pandas as pd
-import requests
 import streamlit as st
 from sqlalchemy import create_engine, text
 
+from config import DB_URL, INSTANCES, REMINDER_AFTER_DAYS, REMINDER_MAX, discover_public_domain
+from dashboard import (
+    DELIVERY_TARGETS,
+    OLD_PENDING_WHERE,
+    PAGE_SIZE,
+    REQUEST_STATUSES,
+    build_request_filters,
+    fetch_campaign_stats,
+    fetch_page,
+    fetch_status_counts,
+    rollup_status_counts,
+)
+from evolution import DEFAULT_TEMPLATE, get_evolution_qr, send_whatsapp_message
+from export import export_csv_gz, export_parquet
+from ingest import CSV_DTYPES, csv_columns, ingest_file, normalize_phones, send_report
+from message_templates import DEFAULT_LANGUAGE, save_campaign_templates, validate_templates
+from send_queue import (
+    campaign_progress,
+    enqueue_requests,
+    interrupted_count,
+    log_send_result,
+    resume_campaign,
+)
+from status_monitor import StatusMonitor, recent_state_changes
+from telemetry import TELEMETRY_WINDOW_MINUTES, campaign_telemetry
+
+# Debe ser el primer comando de Streamlit (antes de los recursos cacheados y sus spinners)
+st.set_page_config(page_title="Habeas Data Manager", layout="wide")
 
-# Configuración
-DB_URL = os.getenv("DATABASE_URL")
-EVO_URL = os.getenv("EVOLUTION_API_URL")
-EVO_KEY = os.getenv("EVOLUTION_API_KEY")
-INSTANCE = os.getenv("WA_INSTANCE_NAME")
-PUBLIC_DOMAIN = os.getenv("PUBLIC_DOMAIN")
 
 # --- Autodescubrimiento de Ngrok (Automatización Local) ---
-if not PUBLIC_DOMAIN:
-    try:
-        # Ngrok expone una API local en el puerto 4040. Intentamos consultarla.
-        # host.docker.internal apunta a tu máquina anfitriona desde Docker.
-        resp = requests.get("http://host.docker.internal:4040/api/tunnels", timeout=1)
-        if resp.status_code == 200:
-            data = resp.json()
-            # Buscamos el túnel que sea HTTPS
-            public_url = next((t["public_url"] for t in data["tunnels"] if t["proto"] == "https"), None)
-            if public_url:
-                PUBLIC_DOMAIN = public_url
-                print(f"✅ Ngrok detectado automáticamente: {PUBLIC_DOMAIN}")
-    except Exception:
-        pass  # Si falla, simplemente seguimos y mostramos el error abajo
+# Streamlit re-ejecuta este script en cada interacción: la configuración y el
+# engine se resuelven una sola vez por proceso.
+@st.cache_resource
+def get_public_domain():
+    return discover_public_domain()
+
+
+@st.cache_resource
+def get_engine():
+    return create_engine(DB_URL, pool_pre_ping=True)
+
+
+PUBLIC_DOMAIN = get_public_domain()
 
 if not PUBLIC_DOMAIN:
     st.error("⚠️ CRÍTICO: La variable PUBLIC_DOMAIN no está configurada. Los enlaces enviados serán inválidos (None/auth/...). Configure esto en su archivo .env o panel de Fly.io.")
 if PUBLIC_DOMAIN and not PUBLIC_DOMAIN.startswith("https://"):
     st.warning("PUBLIC_DOMAIN no es HTTPS. Se recomienda usar siempre HTTPS para enlaces de consentimiento.")
 
-engine = create_engine(DB_URL)
+engine = get_engine()
 
-st.set_page_config(page_title="Habeas Data Manager", layout="wide")
-st.title("🔐 Gestor de Autorizaciones Habeas Data")
 
-# --- Auto-Migración de Base de Datos ---
-# Esto ajusta la estructura de la DB automáticamente si ya existía con la versión anterior
-def run_db_migrations():
-    with engine.connect() as conn:
-        try:
-            # Intentar eliminar la restricción única antigua (solo teléfono)
-            conn.execute(text("ALTER TABLE habeas_requests DROP CONSTRAINT IF EXISTS habeas_requests_phone_key"))
-            # Asegurar que existe la nueva restricción compuesta (teléfono + campaña)
-            conn.execute(text("ALTER TABLE habeas_requests ADD CONSTRAINT habeas_requests_phone_campaign_id_key UNIQUE (phone, campaign_id)"))
-            conn.commit()
-        except Exception as e:
-            # Si falla (ej. ya existe), lo ignoramos silenciosamente o lo logueamos
-            print(f"Nota de migración: {e}")
+@st.cache_resource
+def get_status_monitor():
+    return StatusMonitor(engine, INSTANCES).start()
+
+
+status_monitor = get_status_monitor()
+
+st.title("🔐 Gestor de Autorizaciones Habeas Data")
 
-run_db_migrations()
+# Las migraciones de esquema corren una vez al arrancar el contenedor (migrate.py), no en cada rerun.
 
 # --- Funciones Auxiliares ---
 
@@ -90,108 +101,64 @@ def get_or_create_campaign(conn, name: str):
     return result.fetchone()[0]
 
 
-def log_send_result(conn, request_id: int, status_code: int | None, body: str | None):
-    conn.execute(
-        text(
-            "INSERT INTO send_logs (request_id, response_status, response_body) "
-            "VALUES (:request_id, :status, :body)"
-        ),
-        {"request_id": request_id, "status": status_code, "body": body},
-    )
-    conn.commit()
-
-
-def send_whatsapp_message(phone, name, token, message_template):
-    """Envía mensaje usando Evolution API con simulación humana"""
-    url = f"{EVO_URL}/message/sendText/{INSTANCE}"
-    headers = {"apikey": EVO_KEY, "Content-Type": "application/json"}
-
-    auth_link = f"{PUBLIC_DOMAIN}/auth/{token}"
-    
-    try:
-        message_body = message_template.format(name=name, auth_link=auth_link)
-    except Exception as e:
-        return None, f"Error en plantilla de mensaje: {str(e)}"
-
-    payload = {
-        "number": phone,
-        "options": {"delay": 1200, "presence": "composing"},  # Simula escritura
-        "textMessage": {"text": message_body},
-    }
-
-    try:
-        response = requests.post(url, json=payload, headers=headers)
-        return response.status_code, response.text
-    except Exception as e:
-        st.error(f"Error enviando a {phone}: {e}")
-        return None, str(e)
-
-
-DEFAULT_TEMPLATE = (
-    "Hola *{name}*,\n\n"
-    "Para continuar brindándote nuestro servicio, necesitamos actualizar tu autorización de tratamiento de datos.\n\n"
-    "Por favor, acepta los términos aquí: {auth_link}\n\n"
-    "Gracias."
-)
-
-# --- Funciones de Gestión Evolution API ---
-def check_evolution_status():
-    """Verifica el estado de la instancia de WhatsApp"""
-    try:
-        url = f"{EVO_URL}/instance/connectionState/{INSTANCE}"
-        headers = {"apikey": EVO_KEY}
-        resp = requests.get(url, headers=headers, timeout=2)
-        if resp.status_code == 200:
-            return resp.json().get("instance", {}).get("state", "unknown")
-    except Exception:
-        return "error"
-    return "unknown"
-
-def get_evolution_qr():
-    """Obtiene el QR si la instancia no está conectada"""
-    try:
-        # 1. Asegurar que la instancia existe
-        create_url = f"{EVO_URL}/instance/create"
-        headers = {"apikey": EVO_KEY, "Content-Type": "application/json"}
-        requests.post(create_url, json={"instanceName": INSTANCE}, headers=headers)
-
-        # 2. Obtener QR
-        connect_url = f"{EVO_URL}/instance/connect/{INSTANCE}"
-        resp = requests.get(connect_url, headers=headers)
-        if resp.status_code == 200:
-            return resp.json().get("base64")
-    except Exception as e:
-        st.sidebar.error(f"Error obteniendo QR: {e}")
-    return None
-
 # --- Sidebar: Panel de Pruebas Rápidas ---
 with st.sidebar:
     st.header("📱 Estado WhatsApp")
     
-    # Verificación de estado
-    wa_status = check_evolution_status()
-    
-    if wa_status == "open":
-        st.success(f"🟢 Conectado: {INSTANCE}")
-    elif wa_status == "close":
-        st.warning("🔴 Desconectado")
-        if st.button("Generar Código QR"):
-            qr_code = get_evolution_qr()
-            if qr_code:
-                # El base64 a veces viene con prefijo, a veces no. Limpiamos.
-                if "," in qr_code:
-                    qr_code = qr_code.split(",")[1]
+    # Estado de cada instancia del pool, leído del monitor en segundo plano (sin esperar a la API)
+    latest_states, latency_history = status_monitor.snapshot()
+    if st.button("🔄 Actualizar estado"):
+        status_monitor.poll_now()
+        latest_states, latency_history = status_monitor.snapshot()
+
+    for instance in INSTANCES:
+        if instance not in latest_states:
+            st.info(f"⏳ Consultando estado: {instance}")
+            continue
+        wa_status, checked_at, latency_ms = latest_states[instance]
+        checked_caption = f"Verificado {checked_at:%H:%M:%S} · {latency_ms} ms"
+
+        if wa_status == "open":
+            st.success(f"🟢 Conectado: {instance}")
+        elif wa_status == "close":
+            st.warning(f"🔴 Desconectado: {instance}")
+            if st.button("Generar Código QR", key=f"qr_{instance}"):
                 try:
-                    image_bytes = base64.b64decode(qr_code)
-                    st.image(image_bytes, caption="Escanea con WhatsApp", width=200)
-                    st.info("Recarga la página después de escanear.")
-                except Exception:
-                    st.error("No se pudo decodificar el QR.")
-    elif wa_status == "connecting":
-        st.info("🟡 Conectando...")
-    else:
-        st.error("❌ Error de conexión con API")
-        st.caption("Verifica que el contenedor 'evolution-api' esté corriendo.")
+                    qr_code = get_evolution_qr(instance)
+                except Exception as e:
+                    qr_code = None
+                    st.error(f"Error obteniendo QR: {e}")
+                if qr_code:
+                    # El base64 a veces viene con prefijo, a veces no. Limpiamos.
+                    if "," in qr_code:
+                        qr_code = qr_code.split(",")[1]
+                    try:
+                        image_bytes = base64.b64decode(qr_code)
+                        st.image(image_bytes, caption=f"Escanea con WhatsApp ({instance})", width=200)
+                        st.info("Pulsa \"Actualizar estado\" después de escanear.")
+                    except Exception:
+                        st.error("No se pudo decodificar el QR.")
+        elif wa_status == "connecting":
+            st.info(f"🟡 Conectando: {instance}")
+        else:
+            st.error(f"❌ Error de conexión con API: {instance}")
+            st.caption("Verifica que el contenedor 'evolution-api' esté corriendo.")
+        st.caption(checked_caption)
+
+    with st.expander("Historial de conexión"):
+        latency_df = pd.DataFrame(
+            {
+                name: pd.Series({ts: ms for ts, ms, _ in samples}, dtype="float64")
+                for name, samples in latency_history.items()
+            }
+        )
+        if not latency_df.empty:
+            st.caption("Latencia de connectionState (ms)")
+            st.line_chart(latency_df)
+        with get_db_connection() as conn:
+            changes = recent_state_changes(conn)
+        for name, previous, state, changed_at in changes:
+            st.caption(f"{changed_at:%Y-%m-%d %H:%M:%S} · {name}: {previous} → {state}")
 
     st.divider()
     st.header("🧪 Prueba Rápida")
@@ -200,6 +167,7 @@ with st.sidebar:
     # Pre-llenado con el número solicitado (incluyendo código país 57)
     test_phone = st.text_input("Teléfono (con código país)", value="573004289163")
     test_name = st.text_input("Nombre", value="Usuario de Prueba")
+    test_instance = st.selectbox("Instancia", options=INSTANCES)
     
     test_template = st.text_area(
         "Mensaje de Prueba", 
@@ -210,11 +178,17 @@ with st.sidebar:
     
     if st.button("Enviar Mensaje de Prueba", type="secondary"):
         with get_db_connection() as conn:
-            # 1. Validar términos
+            # 1. Validar términos y teléfono (misma normalización que las campañas)
             terms_version = get_current_terms_version(conn)
+            test_phones, test_reasons = normalize_phones(pd.Series([test_phone]))
             if not terms_version:
                 st.error("⚠️ No hay términos legales en la base de datos.")
+            elif pd.notna(test_reasons.iloc[0]):
+                st.error(f"Teléfono inválido: {test_reasons.iloc[0]}")
+            elif test_template_errors := validate_templates({DEFAULT_LANGUAGE: test_template}):
+                st.error(f"Plantilla inválida: {test_template_errors[DEFAULT_LANGUAGE]}")
             else:
+                test_phone = test_phones.iloc[0]
                 # 2. Preparar datos
                 campaign_id = get_or_create_campaign(conn, "Campaña de Prueba")
                 token = str(uuid.uuid4())
@@ -242,8 +216,10 @@ with st.sidebar:
 
                     # 4. Enviar Mensaje
                     with st.spinner("Enviando..."):
-                        status, body = send_whatsapp_message(test_phone, test_name, token, test_template)
-                        log_send_result(conn, request_id, status, body)
+                        status, body = send_whatsapp_message(
+                            test_phone, test_name, token, test_template, PUBLIC_DOMAIN, test_instance
+                        )
+                        log_send_result(conn, request_id, status, body, test_instance)
                     
                     if status == 201:
                         st.success("✅ Mensaje enviado exitosamente.")
@@ -277,8 +253,17 @@ with col_left:
         "Plantilla del mensaje de WhatsApp",
         value=DEFAULT_TEMPLATE,
         height=150,
-        help="Variables obligatorias: {name} (Nombre del usuario) y {auth_link} (Enlace único)."
+        help="Variables: {name} (Nombre del usuario) y {auth_link} (Enlace único, obligatoria)."
     )
+    # Variantes por idioma: se usan con los contactos cuya columna language coincide
+    campaign_templates = {DEFAULT_LANGUAGE: campaign_template}
+    with st.expander("Variantes por idioma"):
+        extra_languages = st.multiselect("Idiomas adicionales", options=["en", "pt", "fr"])
+        for language in extra_languages:
+            campaign_templates[language] = st.text_area(f"Plantilla ({language})", height=150, key=f"template_{language}")
+    template_errors = validate_templates(campaign_templates)
+    for language, error in template_errors.items():
+        st.error(f"Plantilla ({language}): {error}")
 
 with col_right:
     st.info(
@@ -314,21 +299,47 @@ with col_right:
                     st.warning("Complete ambos campos.")
 
 if uploaded_file:
-    df = pd.read_csv(uploaded_file)
+    # El archivo se procesa por trozos (ingest.CSV_CHUNK_ROWS); aquí solo se lee el encabezado
+    columns = csv_columns(uploaded_file)
 
     # Validación básica
-    if "phone" not in df.columns or "name" not in df.columns:
+    if "phone" not in columns or "name" not in columns:
         st.error("El CSV debe tener las columnas 'phone' y 'name'")
     else:
-        st.dataframe(df.head())
-
-        if st.button("EJECUTAR ENVÍO MASIVO", type="primary"):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-
-            total = len(df)
-            success_count = 0
+        st.dataframe(pd.read_csv(uploaded_file, nrows=5, dtype=CSV_DTYPES))
 
+        # --- Reporte previo al envío ---
+        # Recorrer el archivo completo es costoso: se calcula una vez por archivo y campaña
+        report_key = (uploaded_file.file_id, campaign_name)
+        if st.session_state.get("send_plan_key") != report_key:
+            report_progress = st.progress(0.0, text="Analizando archivo...")
+            with get_db_connection() as conn:
+                report_campaign = conn.execute(
+                    text("SELECT id FROM campaigns WHERE name = :name"), {"name": campaign_name}
+                ).fetchone()
+                st.session_state["send_plan"] = send_report(
+                    conn, uploaded_file, report_campaign[0] if report_campaign else None,
+                    on_progress=lambda done: report_progress.progress(done, text=f"Analizando archivo... {done:.0%}"),
+                )
+            st.session_state["send_plan_key"] = report_key
+            report_progress.empty()
+        send_plan = st.session_state["send_plan"]
+
+        st.markdown("### 🔎 Reporte previo al envío")
+        p1, p2, p3, p4 = st.columns(4)
+        p1.metric("Filas en el archivo", send_plan["total"])
+        p2.metric("Teléfonos inválidos", send_plan["invalid"])
+        p3.metric("Duplicados en el archivo", send_plan["duplicates_in_file"])
+        p4.metric("Ya en la campaña", send_plan["already_in_campaign"])
+        st.info(f"Se enviarán **{send_plan['to_send']}** mensajes.")
+        if send_plan["invalid"]:
+            with st.expander("Filas descartadas"):
+                st.dataframe(send_plan["invalid_by_reason"].rename("filas"))
+                st.caption(f"Primeras {len(send_plan['rejected_sample'])} filas descartadas:")
+                st.dataframe(send_plan["rejected_sample"], hide_index=True)
+
+        if st.button("EJECUTAR ENVÍO MASIVO", type="primary", disabled=bool(template_errors)):
+            # El envío lo hace dispatcher.py; aquí solo registramos y encolamos.
             with get_db_connection() as conn:
                 terms_version = get_current_terms_version(conn)
                 if not terms_version:
@@ -337,90 +348,113 @@ if uploaded_file:
                     )
                 else:
                     campaign_id = get_or_create_campaign(conn, campaign_name)
+                    try:
+                        # Plantillas ya validadas: se guardan antes de registrar contactos
+                        save_campaign_templates(conn, campaign_id, campaign_templates)
+                        ingest_progress = st.progress(0.0, text="Registrando contactos...")
+                        report = ingest_file(
+                            conn, uploaded_file, campaign_id, terms_version,
+                            int(token_valid_days),
+                            on_progress=lambda done: ingest_progress.progress(
+                                done, text=f"Registrando contactos... {done:.0%}"
+                            ),
+                        )
+                        # Un CSV repetido: los ya registrados que nunca se enviaron se recuperan aquí
+                        resumed = resume_campaign(conn, campaign_id)
+                    except Exception as e:
+                        st.error(f"Error DB al registrar la campaña: {e}")
+                    else:
+                        # El reporte ya no refleja la campaña: se recalcula en el próximo rerun
+                        st.session_state.pop("send_plan_key", None)
+                        r1, r2, r3 = st.columns(3)
+                        r1.metric("Encolados", report["inserted"])
+                        r2.metric("Recuperados sin enviar", resumed["enqueued"])
+                        r3.metric("Ya existentes", report["duplicates"])
+                        st.success(
+                            f"Campaña encolada: {report['inserted'] + resumed['enqueued']} mensajes. El despachador los enviará en segundo plano; puede cerrar esta pestaña."
+                        )
 
-                    for index, row in df.iterrows():
-                        phone = str(row["phone"]).strip()
-                        name = row["name"]
-                        language = row.get("language", "es")
 
-                        # 1. Generar Token
-                        token = str(uuid.uuid4())
+@st.fragment(run_every=10)
+def show_campaign_progress(name: str):
+    """Progreso y telemetría de la cola de envío de la campaña (se refresca solo)"""
+    with get_db_connection() as conn:
+        campaign = conn.execute(
+            text("SELECT id FROM campaigns WHERE name = :name"), {"name": name}
+        ).fetchone()
+        if not campaign:
+            return
+        progress = campaign_progress(conn, campaign[0])
+        stats = campaign_telemetry(conn, campaign[0])
+
+    total = sum(progress.values())
+    if total == 0:
+        return
+    # Mensajes originales de la campaña en estado final (los reintentos vuelven a 'queued')
+    done = progress["sent"] + progress["failed"]
+    st.markdown(f"### 🚚 Progreso de envío: {name}")
+    st.progress(min(1.0, done / total), text=f"{done}/{total} mensajes procesados")
+    q1, q2, q3, q4 = st.columns(4)
+    q1.metric("En cola", progress["queued"])
+    q2.metric("Enviando", progress["sending"])
+    q3.metric("Enviados ✅", progress["sent"])
+    q4.metric("Fallidos ❌", progress["failed"])
+
+    if not stats["attempts"]:
+        return
+    pending = progress["queued"] + progress["sending"]
+    rate = stats["sent_per_minute"]
+    eta = f"{pending / rate:.0f} min" if rate and pending else "—"
+    st.caption(f"Últimos {TELEMETRY_WINDOW_MINUTES} minutos (tablas agregadas de telemetría)")
+    t1, t2, t3, t4, t5 = st.columns(5)
+    t1.metric("Mensajes/min", f"{rate:.1f}")
+    t2.metric("ETA", eta)
+    t3.metric("Tasa de error", f"{stats['error_rate']:.1%}")
+    t4.metric("Evolution p50", f"{stats['p50_ms']} ms" if stats["p50_ms"] is not None else "—")
+    t5.metric("Evolution p95", f"{stats['p95_ms']} ms" if stats["p95_ms"] is not None else "—")
+    st.caption(
+        f"Promedio por mensaje: HTTP {stats['avg_http_ms']:.0f} ms · "
+        f"espera por cupo {stats['avg_wait_ms']:.0f} ms · DB {stats['avg_db_ms']:.1f} ms"
+    )
+    if stats["per_minute"]:
+        st.line_chart(
+            pd.DataFrame(stats["per_minute"], columns=["minuto", "enviados", "errores"])
+            .set_index("minuto")
+            .fillna(0)
+        )
+    if stats["errors_by_status"]:
+        st.dataframe(
+            pd.Series(stats["errors_by_status"], name="mensajes").rename_axis("código HTTP (0 = sin respuesta)"),
+        )
 
-                        # 2. Calcular expiración
-                        expires_query = text(
-                            "SELECT NOW() + (:days || ' days')::interval"
-                        )
-                        expires_at = conn.execute(
-                            expires_query, {"days": int(token_valid_days)}
-                        ).fetchone()[0]
-
-                        # 3. Insertar en DB (Pending)
-                        try:
-                            insert_q = text(
-                                """
-                                INSERT INTO habeas_requests (
-                                    phone, name, token, status, expires_at,
-                                    terms_version, campaign_id, language
-                                )
-                                VALUES (
-                                    :phone, :name, :token, 'pending', :expires_at,
-                                    :terms_version, :campaign_id, :language
-                                )
-                                ON CONFLICT (phone, campaign_id) DO NOTHING
-                                RETURNING id
-                                """
-                            )
-                            result = conn.execute(
-                                insert_q,
-                                {
-                                    "phone": phone,
-                                    "name": name,
-                                    "token": token,
-                                    "expires_at": expires_at,
-                                    "terms_version": terms_version,
-                                    "campaign_id": campaign_id,
-                                    "language": language,
-                                },
-                            )
-                            row_db = result.fetchone()
-                            conn.commit()
-                            if not row_db:
-                                st.warning(
-                                    f"Registro duplicado o ya existente para {phone}, no se reenviará en esta ejecución."
-                                )
-                                continue
-                            request_id = row_db[0]
-                        except Exception:
-                            st.warning(f"Error DB para {phone}")
-                            continue
-
-                        # 4. Enviar Mensaje
-                        status_text.text(f"Enviando a {name} ({phone})...")
-                        status_code, body = send_whatsapp_message(phone, name, token, campaign_template)
-
-                        if status_code == 201:
-                            success_count += 1
-                        else:
-                            # Marcar como failed si no fue exitoso
-                            conn.execute(
-                                text(
-                                    "UPDATE habeas_requests SET status = 'failed' WHERE id = :id"
-                                ),
-                                {"id": request_id},
-                            )
-                            conn.commit()
-
-                        log_send_result(conn, request_id, status_code, body)
-
-                        # 5. Rate Limiting (Espera aleatoria entre 5 y 15 segundos)
-                        time.sleep(random.uniform(5, 15))
-
-                        # Actualizar barra
-                        progress_bar.progress((index + 1) / total)
 
-            st.success(
-                f"Proceso finalizado. Mensajes enviados exitosamente: {success_count}/{total}"
+show_campaign_progress(campaign_name)
+
+with st.expander("Reanudar campaña"):
+    # Lo enviado o en cola no se toca; los interrumpidos pudieron haberse entregado
+    with get_db_connection() as conn:
+        resume_campaign_row = conn.execute(
+            text("SELECT id FROM campaigns WHERE name = :name"), {"name": campaign_name}
+        ).fetchone()
+        if not resume_campaign_row:
+            st.caption("La campaña aún no existe.")
+        else:
+            interrupted = interrupted_count(conn, resume_campaign_row[0])
+            st.caption(
+                "Encola los contactos de la campaña que nunca llegaron a enviarse. "
+                f"Interrumpidos sin confirmación de entrega: **{interrupted}**."
+            )
+            include_interrupted = st.checkbox(
+                "Incluir interrumpidos (puede duplicar mensajes ya entregados)", value=False
             )
+            if st.button("Reanudar campaña"):
+                resumed = resume_campaign(
+                    conn, resume_campaign_row[0], include_interrupted=include_interrupted
+                )
+                st.success(
+                    f"Se encolaron {resumed['enqueued']} contactos sin enviar"
+                    f" y {resumed['requeued']} interrumpidos."
+                )
 
 
 # --- Visualización de Estado y reenvíos ---
@@ -439,103 +473,124 @@ with col_filtros:
     date_to = st.date_input("Hasta (sent_at)", value=None)
 
 with col_acciones:
-    export_button = st.button("Exportar evidencia (CSV)")
+    export_format = st.radio("Formato de evidencia", ["CSV (gzip)", "Parquet"], horizontal=True)
+    export_button = st.button("Exportar evidencia")
+    resend_target = st.selectbox(
+        "Destinatarios del reenvío",
+        list(DELIVERY_TARGETS),
+        help="Según las confirmaciones de entrega del webhook de Evolution API. "
+        "Los envíos anteriores al webhook no tienen confirmación y cuentan como nunca entregados.",
+    )
     resend_pending_button = st.button("Reenviar pendientes de campaña actual")
 
 with get_db_connection() as conn:
-    base_query = "SELECT * FROM habeas_requests WHERE 1=1"
-    params = {}
-
-    if status_filter:
-        base_query += " AND status = ANY(:statuses)"
-        params["statuses"] = status_filter
-
-    if date_from:
-        base_query += " AND sent_at::date >= :date_from"
-        params["date_from"] = date_from
-
-    if date_to:
-        base_query += " AND sent_at::date <= :date_to"
-        params["date_to"] = date_to
+    where, params = build_request_filters(status_filter, date_from, date_to)
 
-    df_state = pd.read_sql(base_query + " ORDER BY sent_at DESC", conn, params=params)
-    
     # --- KPIs y Gráficos ---
     st.markdown("### 📊 Estadísticas de Campaña")
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
-    
-    total_kpi = len(df_state)
-    accepted_kpi = len(df_state[df_state["status"] == "accepted"])
-    rejected_kpi = len(df_state[df_state["status"] == "rejected"])
-    pending_kpi = len(df_state[df_state["status"] == "pending"])
-    
+
+    # Sin filtro de fechas los conteos salen del resumen por campaña (campaign_stats)
+    if date_from or date_to:
+        status_counts = fetch_status_counts(conn, where, params)
+    else:
+        status_counts = rollup_status_counts(conn, status_filter)
+
+    total_kpi = int(status_counts.sum())
+    accepted_kpi = int(status_counts.get("accepted", 0))
+    rejected_kpi = int(status_counts.get("rejected", 0))
+    pending_kpi = int(status_counts.get("pending", 0))
+
     kpi1.metric("Total Registros", total_kpi)
     kpi2.metric("Aceptados ✅", accepted_kpi, f"{((accepted_kpi/total_kpi)*100):.1f}%" if total_kpi > 0 else "0%")
     kpi3.metric("Rechazados ❌", rejected_kpi, f"{((rejected_kpi/total_kpi)*100):.1f}%" if total_kpi > 0 else "0%")
     kpi4.metric("Pendientes ⏳", pending_kpi)
 
     if total_kpi > 0:
-        st.bar_chart(df_state["status"].value_counts())
-
-    st.dataframe(df_state)
-
-    if export_button and not df_state.empty:
-        export_cols = [
-            "phone",
-            "name",
-            "status",
-            "sent_at",
-            "accepted_at",
-            "ip_address",
-            "user_agent",
-            "terms_version",
-        ]
-        available_cols = [c for c in export_cols if c in df_state.columns]
-        export_df = df_state[available_cols]
-        st.download_button(
-            label="Descargar evidencia CSV",
-            data=export_df.to_csv(index=False).encode("utf-8"),
-            file_name="habeas_evidencia.csv",
-            mime="text/csv",
+        st.bar_chart(status_counts)
+
+    # --- Resumen por campaña ---
+    st.markdown("### 🗂️ Por campaña")
+    campaign_stats = fetch_campaign_stats(conn)
+    if campaign_stats.empty:
+        st.caption("Aún no hay campañas con solicitudes.")
+    else:
+        st.dataframe(
+            campaign_stats[["campaign", "total", *REQUEST_STATUSES, "accepted_pct", "sends_ok", "sends_failed", "last_activity_at"]],
+            hide_index=True,
+            column_config={"accepted_pct": st.column_config.NumberColumn("% aceptación", format="%.1f%%")},
         )
+        drill_index = st.selectbox(
+            "Detalle de campaña", campaign_stats.index, format_func=lambda i: campaign_stats.at[i, "campaign"]
+        )
+        drill = campaign_stats.loc[drill_index]
+        d1, d2, d3, d4, d5 = st.columns(5)
+        d1.metric("Total", int(drill["total"]))
+        d2.metric("Aceptados ✅", int(drill["accepted"]), f"{drill['accepted_pct']:.1f}%")
+        d3.metric("Rechazados ❌", int(drill["rejected"]))
+        d4.metric("Pendientes ⏳", int(drill["pending"]))
+        d5.metric("Fallidos", int(drill["failed"]))
+        st.caption(
+            f"Envíos: {int(drill['sends_ok'])} exitosos · {int(drill['sends_failed'])} fallidos · "
+            f"primera actividad {drill['first_activity_at']} · última {drill['last_activity_at']}"
+        )
+        st.bar_chart(drill[REQUEST_STATUSES].astype("int64"))
+
+    # --- Tabla paginada ---
+    # La pila de cursores permite volver atrás; se reinicia si cambian los filtros.
+    filters_key = (tuple(status_filter), date_from, date_to)
+    if st.session_state.get("page_filters") != filters_key:
+        st.session_state["page_filters"] = filters_key
+        st.session_state["page_cursors"] = [None]
+    cursors = st.session_state["page_cursors"]
+
+    df_page, has_next = fetch_page(conn, where, params, cursors[-1])
+    st.dataframe(df_page, hide_index=True)
+
+    nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+    if nav_prev.button("⬅️ Anterior", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    nav_info.caption(f"Página {len(cursors)} · {PAGE_SIZE} registros por página")
+    if nav_next.button("Siguiente ➡️", disabled=not has_next):
+        last = df_page.iloc[-1]
+        cursors.append((last["sent_at"].to_pydatetime(), int(last["id"])))
+        st.rerun()
+
+    if export_button:
+        # Se escribe por trozos a disco (EXPORT_DIR) y se ofrece el archivo comprimido
+        try:
+            with st.spinner("Generando evidencia..."):
+                if export_format == "Parquet":
+                    export_path, export_rows = export_parquet(conn, where, params)
+                    export_mime = "application/vnd.apache.parquet"
+                else:
+                    export_path, export_rows = export_csv_gz(conn, where, params)
+                    export_mime = "application/gzip"
+        except Exception as e:
+            st.error(f"Error exportando evidencia: {e}")
+        else:
+            st.caption(f"{export_rows} filas · {os.path.getsize(export_path) / 1e6:.1f} MB · {export_path}")
+            with open(export_path, "rb") as export_file:
+                st.download_button(
+                    label="Descargar evidencia",
+                    data=export_file,
+                    file_name=os.path.basename(export_path),
+                    mime=export_mime,
+                )
 
     if resend_pending_button:
-        if "id" not in df_state.columns:
-            st.error("No se puede reenviar: falta columna id en la consulta.")
+        pending_ids = conn.execute(
+            text(f"SELECT id FROM habeas_requests {where} AND status = 'pending'{DELIVERY_TARGETS[resend_target]}"),
+            params,
+        ).scalars().all()
+        if not pending_ids:
+            st.info("No hay registros pendientes para reenviar con los filtros actuales.")
         else:
-            pending = df_state[df_state["status"] == "pending"]
-            if pending.empty:
-                st.info("No hay registros pendientes para reenviar con los filtros actuales.")
-            else:
-                progress = st.progress(0)
-                total_p = len(pending)
-                sent_ok = 0
-
-                for idx, row in pending.iterrows():
-                    phone = row["phone"]
-                    name = row["name"]
-                    token = row["token"]
-                    request_id = row["id"]
-
-                    status_code, body = send_whatsapp_message(phone, name, token, campaign_template)
-                    if status_code == 201:
-                        sent_ok += 1
-                    else:
-                        conn.execute(
-                            text(
-                                "UPDATE habeas_requests SET status = 'failed' WHERE id = :id"
-                            ),
-                            {"id": request_id},
-                        )
-                        conn.commit()
-
-                    log_send_result(conn, request_id, status_code, body)
-                    time.sleep(random.uniform(5, 15))
-                    progress.progress((sent_ok) / total_p)
-
-                st.success(
-                    f"Reenvío completado. Mensajes reenviados exitosamente: {sent_ok}/{total_p}"
-                )
+            queued = enqueue_requests(conn, pending_ids)
+            st.success(
+                f"Reenvío encolado: {queued}/{len(pending_ids)} mensajes. El despachador los enviará en segundo plano."
+            )
 
     # --- Automatización de Reintentos (> 5 días) ---
     st.divider()
@@ -543,44 +598,25 @@ with get_db_connection() as conn:
     
     with st.expander("Reenviar solicitudes antiguas (> 5 días sin respuesta)"):
         # Consulta para buscar pendientes con más de 5 días
-        old_pending_query = text("""
-            SELECT * FROM habeas_requests 
-            WHERE status = 'pending' 
-            AND sent_at < NOW() - INTERVAL '5 days'
-        """)
-        df_old = pd.read_sql(old_pending_query, conn)
-        count_old = len(df_old)
+        old_where = OLD_PENDING_WHERE + DELIVERY_TARGETS[resend_target]
+        count_old = conn.execute(
+            text(f"SELECT COUNT(*) FROM habeas_requests {old_where}")
+        ).scalar_one()
         
-        st.write(f"Solicitudes pendientes antiguas encontradas: **{count_old}**")
+        st.write(f"Solicitudes pendientes antiguas encontradas ({resend_target.lower()}): **{count_old}**")
+        st.caption(
+            f"El despachador envía recordatorios automáticamente cada {REMINDER_AFTER_DAYS} días sin respuesta "
+            f"(máximo {REMINDER_MAX} por solicitud) y reintenta los fallos transitorios con backoff; "
+            "este botón solo adelanta el recordatorio."
+        )
         
         if count_old > 0:
             st.info("Esta acción reenviará el mensaje a los usuarios que no han respondido en 5 días y actualizará la fecha de envío a 'hoy'.")
             if st.button("Ejecutar Reenvío Automático (> 5 días)", type="primary"):
-                progress_old = st.progress(0)
-                sent_old_ok = 0
-                
-                for idx, row in df_old.iterrows():
-                    phone = row["phone"]
-                    name = row["name"]
-                    token = row["token"]
-                    request_id = row["id"]
-                    
-                    # Usamos la plantilla actual configurada en la UI
-                    status_code, body = send_whatsapp_message(phone, name, token, campaign_template)
-                    
-                    if status_code == 201:
-                        sent_old_ok += 1
-                        # Actualizamos sent_at para reiniciar el contador de días
-                        conn.execute(
-                            text("UPDATE habeas_requests SET sent_at = NOW() WHERE id = :id"),
-                            {"id": request_id}
-                        )
-                        conn.commit()
-                        
-                    log_send_result(conn, request_id, status_code, body)
-                    time.sleep(random.uniform(5, 15)) # Rate limit
-                    progress_old.progress((idx + 1) / count_old)
-                
-                st.success(f"Se reenviaron {sent_old_ok} solicitudes exitosamente.")
-                time.sleep(2)
-                st.rerun()
\ No newline at end of file
+                # Cada solicitud usa la plantilla guardada de su campaña; el despachador
+                # actualiza sent_at tras cada envío exitoso.
+                old_ids = conn.execute(
+                    text(f"SELECT id FROM habeas_requests {old_where}")
+                ).scalars().all()
+                queued = enqueue_requests(conn, old_ids, kind="reminder")
+                st.success(f"Se encolaron {queued} solicitudes para reenvío.")
@@ -0,0 +1,200 @@
+"""Benchmark de las consultas del panel de administración.
+
+Siembra millones de solicitudes sintéticas (con su historial en send_logs), ejecuta
+ANALYZE y reporta EXPLAIN ANALYZE de cada consulta del panel y de los reintentos:
+tiempo de ejecución (mediana de --repeat corridas) e índices usados.
+
+    python bench/bench_admin_queries.py --seed 3000000
+    python bench/bench_admin_queries.py            # reutiliza lo sembrado
+    python bench/bench_admin_queries.py --cleanup  # borra los datos sintéticos
+"""
+import argparse
+import os
+import statistics
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard import (  # noqa: E402
+    CAMPAIGN_STATS_QUERY,
+    OLD_PENDING_WHERE,
+    build_request_filters,
+    page_params,
+    page_query,
+    status_counts_query,
+)
+
+BENCH_CAMPAIGN_PREFIX = "Bench Panel"
+
+
+def seed(conn, rows: int, campaigns: int):
+    campaign_ids = [
+        conn.execute(
+            text("INSERT INTO campaigns (name, description) VALUES (:n, 'Datos sintéticos de bench/') RETURNING id"),
+            {"n": f"{BENCH_CAMPAIGN_PREFIX} {i + 1}"},
+        ).scalar_one()
+        for i in range(campaigns)
+    ]
+    terms = conn.execute(text("SELECT version FROM legal_terms ORDER BY valid_from DESC LIMIT 1")).scalar()
+    # Distribución aproximada de una campaña real: mayoría pendientes/aceptadas
+    conn.execute(
+        text(
+            """
+            INSERT INTO habeas_requests (
+                phone, name, token, status, sent_at, accepted_at, expires_at,
+                terms_version, campaign_id, language
+            )
+            SELECT 'b' || g, 'Bench ' || g, gen_random_uuid(), status,
+                   sent_at,
+                   CASE WHEN status IN ('accepted', 'rejected') THEN sent_at + INTERVAL '1 hour' END,
+                   sent_at + INTERVAL '7 days',
+                   :terms, (CAST(:campaign_ids AS int[]))[1 + g % :campaigns], 'es'
+            FROM (
+                SELECT g,
+                       CASE
+                           WHEN r < 0.45 THEN 'pending'
+                           WHEN r < 0.85 THEN 'accepted'
+                           WHEN r < 0.95 THEN 'rejected'
+                           ELSE 'failed'
+                       END::request_status AS status,
+                       NOW() - age_days * INTERVAL '1 day' AS sent_at
+                FROM (
+                    SELECT g, random() AS r, random() * 365 AS age_days
+                    FROM generate_series(1, :rows) AS g
+                ) AS rnd
+            ) AS src
+            """
+        ),
+        {"rows": rows, "terms": terms, "campaign_ids": campaign_ids, "campaigns": campaigns},
+    )
+    # Uno o dos intentos de envío por solicitud (send_logs necesita la partición de cada mes)
+    conn.execute(
+        text(
+            "SELECT create_send_logs_partition(month::date) "
+            "FROM generate_series(date_trunc('month', NOW() - INTERVAL '366 days'), NOW(), INTERVAL '1 month') AS month"
+        )
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO send_logs (request_id, response_status, message_id, response, created_at)
+            SELECT h.id, 201, 'BENCH' || h.id || '-' || n, '{"status": "PENDING"}', h.sent_at + n * INTERVAL '5 days'
+            FROM habeas_requests h
+            CROSS JOIN generate_series(0, 1) AS n
+            WHERE h.campaign_id = ANY(:campaign_ids) AND (n = 0 OR h.id % 3 = 0)
+            """
+        ),
+        {"campaign_ids": campaign_ids},
+    )
+    conn.execute(text("ANALYZE habeas_requests"))
+    conn.execute(text("ANALYZE send_logs"))
+
+
+def cleanup(conn):
+    bench = "SELECT id FROM campaigns WHERE name LIKE :prefix"
+    params = {"prefix": f"{BENCH_CAMPAIGN_PREFIX} %"}
+    conn.execute(
+        text(f"DELETE FROM send_logs WHERE request_id IN (SELECT id FROM habeas_requests WHERE campaign_id IN ({bench}))"),
+        params,
+    )
+    conn.execute(text(f"DELETE FROM habeas_requests WHERE campaign_id IN ({bench})"), params)
+    conn.execute(text("DELETE FROM campaigns WHERE name LIKE :prefix"), params)
+
+
+def admin_queries(conn):
+    """(nombre, sql, parámetros) de cada consulta que hace el panel"""
+    default_where, default_params = build_request_filters(["pending", "accepted"], None, None)
+    today = date.today()
+    range_where, range_params = build_request_filters(["pending"], today - timedelta(days=30), today)
+
+    # Cursor a mitad de la tabla para medir una página profunda
+    middle = conn.execute(
+        text("SELECT sent_at, id FROM habeas_requests ORDER BY sent_at DESC, id DESC OFFSET 100000 LIMIT 1")
+    ).fetchone()
+    sample_request = conn.execute(text("SELECT request_id FROM send_logs ORDER BY id DESC LIMIT 1")).scalar()
+    sample_campaign = conn.execute(text("SELECT MAX(campaign_id) FROM habeas_requests")).scalar()
+
+    queries = [
+        ("KPIs (pending+accepted)", status_counts_query(default_where), default_params),
+        ("KPIs (pending, últimos 30 días)", status_counts_query(range_where), range_params),
+        ("KPIs (resumen campaign_stats)", "SELECT SUM(pending), SUM(accepted), SUM(rejected), SUM(failed) FROM campaign_stats", {}),
+        ("Resumen por campaña", CAMPAIGN_STATS_QUERY.format(where=""), {}),
+        (
+            "Detalle de una campaña (resumen)",
+            CAMPAIGN_STATS_QUERY.format(where="WHERE s.campaign_id = :campaign_id"),
+            {"campaign_id": sample_campaign},
+        ),
+        ("Tabla: primera página", page_query(default_where, False), page_params(default_params, None)),
+        ("Tabla: primera página (30 días)", page_query(range_where, False), page_params(range_params, None)),
+        ("Pendientes > 5 días (conteo)", f"SELECT COUNT(*) FROM habeas_requests {OLD_PENDING_WHERE}", {}),
+        ("Pendientes > 5 días (ids)", f"SELECT id FROM habeas_requests {OLD_PENDING_WHERE}", {}),
+        (
+            "Historial send_logs de una solicitud",
+            "SELECT * FROM send_logs WHERE request_id = :id ORDER BY created_at",
+            {"id": sample_request},
+        ),
+        (
+            "Estados de una campaña",
+            "SELECT status, COUNT(*) FROM habeas_requests WHERE campaign_id = :id GROUP BY status",
+            {"id": sample_campaign},
+        ),
+    ]
+    if middle:
+        queries.insert(
+            3,
+            ("Tabla: página profunda (keyset)", page_query(default_where, True), page_params(default_params, tuple(middle))),
+        )
+    return queries
+
+
+def used_indexes(plan: dict) -> set[str]:
+    found = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        found |= used_indexes(child)
+    return found
+
+
+def explain(conn, sql: str, params: dict, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        result = conn.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql), params).scalar()
+        timings.append(result[0]["Execution Time"])
+    plan = result[0]["Plan"]
+    return statistics.median(timings), plan["Node Type"], used_indexes(plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="Solicitudes sintéticas a insertar")
+    parser.add_argument("--campaigns", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cleanup", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+
+    if args.cleanup:
+        with engine.begin() as conn:
+            cleanup(conn)
+        print("Datos sintéticos eliminados.")
+        return
+
+    if args.seed:
+        print(f"Sembrando {args.seed} solicitudes en {args.campaigns} campañas...")
+        with engine.begin() as conn:
+            seed(conn, args.seed, args.campaigns)
+
+    with engine.connect() as conn:
+        total = conn.execute(text("SELECT COUNT(*) FROM habeas_requests")).scalar_one()
+        print(f"habeas_requests: {total} filas\n")
+        print(f"{'Consulta':<40} {'ms (mediana)':>12}  {'Nodo raíz':<18} Índices")
+        for name, sql, params in admin_queries(conn):
+            elapsed, node, indexes = explain(conn, sql, params, args.repeat)
+            print(f"{name:<40} {elapsed:>12.2f}  {node:<18} {', '.join(sorted(indexes)) or '(seq scan)'}")
+
+
+if __name__ == "__main__":
+    main()
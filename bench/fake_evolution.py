@@ -0,0 +1,217 @@
+"""Servidor falso de Evolution API para probar el despachador y el webhook de entregas.
+
+Responde sendText con 201 y un key.id nuevo, connectionState con "open", y tras un
+retardo envía a la landing los eventos messages.update (SERVER_ACK, DELIVERY_ACK,
+READ) de cada mensaje, con las probabilidades indicadas. Los eventos enviados se
+pueden grabar (--record) y volver a reproducir contra el webhook (--replay), por
+ejemplo para medir la ingesta con el mismo tráfico antes y después de un cambio.
+
+    python bench/fake_evolution.py --port 8081 --webhook-url "http://localhost:8000/webhooks/evolution?secret=..."
+    EVOLUTION_API_URL=http://localhost:8081 python dispatcher.py
+    python bench/fake_evolution.py --replay bench/events.jsonl --webhook-url ... --rate 2000
+"""
+import argparse
+import heapq
+import json
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+SEND_TEXT = re.compile(r"^/message/sendText/([^/?]+)")
+CONNECTION_STATE = re.compile(r"^/instance/connectionState/([^/?]+)")
+
+
+def receipt_event(instance: str, message_id: str, remote_jid: str, status: str) -> dict:
+    """Evento messages.update con la forma que envía Evolution API v2"""
+    return {
+        "event": "messages.update",
+        "instance": instance,
+        "data": {
+            "keyId": message_id,
+            "remoteJid": remote_jid,
+            "fromMe": True,
+            "status": status,
+            "instanceId": instance,
+        },
+        "date_time": datetime.now(timezone.utc).isoformat(),
+        "sender": remote_jid,
+    }
+
+
+class WebhookSender:
+    """Programa eventos y los envía al webhook desde varios hilos"""
+
+    def __init__(self, webhook_url: str, workers: int, record_path: str | None = None):
+        self.webhook_url = webhook_url
+        self.scheduled = []  # heap de (due, seq, evento)
+        self.seq = 0
+        self.lock = threading.Condition()
+        self.outbox = queue.Queue()
+        self.record = open(record_path, "a", encoding="utf-8") if record_path else None
+        self.record_lock = threading.Lock()
+        self.stats = {"sent": 0, "failed": 0}
+        threading.Thread(target=self._scheduler, daemon=True).start()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def schedule(self, delay: float, event: dict):
+        with self.lock:
+            self.seq += 1
+            heapq.heappush(self.scheduled, (time.monotonic() + delay, self.seq, event))
+            self.lock.notify()
+
+    def _scheduler(self):
+        while True:
+            with self.lock:
+                while not self.scheduled or self.scheduled[0][0] > time.monotonic():
+                    timeout = self.scheduled[0][0] - time.monotonic() if self.scheduled else None
+                    self.lock.wait(timeout)
+                _, _, event = heapq.heappop(self.scheduled)
+            self.outbox.put(event)
+
+    def _worker(self):
+        with httpx.Client(timeout=10) as client:
+            while True:
+                event = self.outbox.get()
+                self.post(client, event)
+
+    def post(self, client: httpx.Client, event: dict):
+        try:
+            response = client.post(self.webhook_url, json=event)
+            ok = response.status_code < 300
+        except httpx.HTTPError:
+            ok = False
+        with self.record_lock:
+            self.stats["sent" if ok else "failed"] += 1
+            if ok and self.record:
+                self.record.write(json.dumps(event) + "\n")
+                self.record.flush()
+
+
+def make_handler(args, sender: WebhookSender | None):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *_):
+            pass
+
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            match = CONNECTION_STATE.match(self.path)
+            if match:
+                self._reply(200, {"instance": {"instanceName": match.group(1), "state": "open"}})
+            else:
+                self._reply(404, {"error": "Not Found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._reply(400, {"error": "invalid json"})
+                return
+            match = SEND_TEXT.match(self.path)
+            if not match:
+                self._reply(404, {"error": "Not Found"})
+                return
+            if random.random() < args.error_rate:
+                self._reply(500, {"status": 500, "error": "Internal Server Error"})
+                return
+            instance = match.group(1)
+            message_id = uuid.uuid4().hex[:20].upper()
+            remote_jid = f"{payload.get('number', '')}@s.whatsapp.net"
+            self._reply(201, {
+                "key": {"remoteJid": remote_jid, "fromMe": True, "id": message_id},
+                "message": {"conversation": payload.get("text", "")},
+                "messageTimestamp": int(time.time()),
+                "status": "PENDING",
+            })
+            if sender:
+                schedule_receipts(args, sender, instance, message_id, remote_jid)
+
+    return Handler
+
+
+def schedule_receipts(args, sender: WebhookSender, instance: str, message_id: str, remote_jid: str):
+    """SERVER_ACK siempre; DELIVERY_ACK con prob. --delivered y READ con prob. --read de los entregados"""
+    delay = random.uniform(0, args.max_delay)
+    sender.schedule(delay, receipt_event(instance, message_id, remote_jid, "SERVER_ACK"))
+    if random.random() >= args.delivered:
+        return
+    delay += random.uniform(0, args.max_delay)
+    sender.schedule(delay, receipt_event(instance, message_id, remote_jid, "DELIVERY_ACK"))
+    if random.random() < args.duplicate_rate:
+        # Evolution reintenta si el webhook tarda; el receptor debe ignorar el duplicado
+        sender.schedule(delay, receipt_event(instance, message_id, remote_jid, "DELIVERY_ACK"))
+    if random.random() < args.read:
+        sender.schedule(delay + random.uniform(0, args.max_delay), receipt_event(instance, message_id, remote_jid, "READ"))
+
+
+def replay(args):
+    """Reenvía al webhook los eventos grabados a --rate eventos/segundo y reporta el resultado"""
+    with open(args.replay, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    sender = WebhookSender(args.webhook_url, workers=args.workers)
+    started = time.perf_counter()
+    for i, event in enumerate(events):
+        sender.outbox.put(event)
+        if args.rate:
+            wait = started + (i + 1) / args.rate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+    while sender.stats["sent"] + sender.stats["failed"] < len(events):
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    print(f"{len(events)} eventos en {elapsed:.2f}s ({len(events) / elapsed:.0f}/s): "
+          f"{sender.stats['sent']} aceptados, {sender.stats['failed']} fallidos")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--webhook-url", help="URL del webhook de la landing (con ?secret=...)")
+    parser.add_argument("--delivered", type=float, default=0.9, help="Probabilidad de DELIVERY_ACK")
+    parser.add_argument("--read", type=float, default=0.5, help="Probabilidad de READ entre los entregados")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Probabilidad de repetir un DELIVERY_ACK")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de responder 500 a sendText")
+    parser.add_argument("--max-delay", type=float, default=2.0, help="Segundos máximos entre estados")
+    parser.add_argument("--workers", type=int, default=8, help="Hilos que envían al webhook")
+    parser.add_argument("--record", help="Agrega a este JSONL los eventos aceptados por el webhook")
+    parser.add_argument("--replay", help="Reproduce un JSONL de eventos contra --webhook-url y termina")
+    parser.add_argument("--rate", type=float, default=0, help="Eventos por segundo al reproducir (0 = sin límite)")
+    args = parser.parse_args()
+
+    if args.replay:
+        if not args.webhook_url:
+            parser.error("--replay requiere --webhook-url")
+        replay(args)
+        return
+
+    sender = WebhookSender(args.webhook_url, args.workers, args.record) if args.webhook_url else None
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args, sender))
+    print(f"Evolution API falsa en http://{args.host}:{args.port}"
+          + (f", eventos a {args.webhook_url}" if sender else " (sin webhook)"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if sender:
+            print(f"Eventos enviados: {sender.stats['sent']}, fallidos: {sender.stats['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Prueba de carga de la landing de consentimiento (GET y POST /auth/{token}).
+
+Siembra solicitudes de prueba en la base de datos (o usa tokens de un archivo) y
+lanza peticiones concurrentes, reportando peticiones/segundo y latencias p50/p95/p99.
+Ejecútalo antes y después de un cambio con etiquetas distintas para comparar:
+
+    python bench/load_landing.py --base-url http://localhost:8000 --seed 2000 --label antes
+    python bench/load_landing.py --base-url http://localhost:8000 --seed 2000 --label despues
+
+Cada petición llega con una IP distinta en --ip-header (por defecto X-Forwarded-For),
+como los destinatarios reales de una campaña, para no medir el cupo por IP de la landing.
+
+Los resultados se agregan como JSON a --results (por defecto bench/results.jsonl).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+
+import httpx
+from sqlalchemy import create_engine, text
+
+LOAD_CAMPAIGN = "Prueba de Carga Landing"
+
+
+def visitor_headers(ip_header: str) -> dict:
+    """Cabecera con una IP aleatoria (un visitante distinto por petición)"""
+    if not ip_header:
+        return {}
+    return {ip_header: f"10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(1, 255)}"}
+
+
+def seed_tokens(db_url: str, count: int) -> list[str]:
+    """Crea `count` solicitudes pendientes en una campaña aparte y devuelve sus tokens"""
+    engine = create_engine(db_url)
+    tokens = [str(uuid.uuid4()) for _ in range(count)]
+    with engine.begin() as conn:
+        campaign_id = conn.execute(
+            text("INSERT INTO campaigns (name, description) VALUES (:n, 'Datos sintéticos de bench/') RETURNING id"),
+            {"n": LOAD_CAMPAIGN},
+        ).scalar_one()
+        terms = conn.execute(text("SELECT version FROM legal_terms ORDER BY valid_from DESC LIMIT 1")).scalar()
+        conn.execute(
+            text(
+                """
+                INSERT INTO habeas_requests (phone, name, token, status, expires_at, terms_version, campaign_id, language)
+                SELECT 'load-' || t.ord, 'Carga ' || t.ord, t.token::uuid, 'pending',
+                       NOW() + INTERVAL '1 day', :terms, :campaign_id, 'es'
+                FROM unnest(CAST(:tokens AS text[])) WITH ORDINALITY AS t(token, ord)
+                """
+            ),
+            {"tokens": tokens, "terms": terms, "campaign_id": campaign_id},
+        )
+    engine.dispose()
+    return tokens
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, method: str, tokens: list[str],
+                       requests_total: int, concurrency: int, ip_header: str = "") -> dict:
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    errors = 0
+    remaining = iter(range(requests_total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            token = random.choice(tokens)
+            started = time.perf_counter()
+            try:
+                if method == "GET":
+                    resp = await client.get(f"/auth/{token}", headers=visitor_headers(ip_header))
+                else:
+                    resp = await client.post(
+                        f"/auth/{token}", data={"decision": "accept", "terms_accepted": "on"},
+                        headers=visitor_headers(ip_header),
+                    )
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "method": method,
+        "requests": requests_total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 1) if latencies else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--seed", type=int, default=0, help="Solicitudes a sembrar en DATABASE_URL")
+    parser.add_argument("--tokens-file", help="Archivo con un token por línea (en vez de --seed)")
+    parser.add_argument("--requests", type=int, default=5000, help="Peticiones por escenario")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--label", default="", help="Etiqueta para comparar corridas (ej. antes/despues)")
+    parser.add_argument("--ip-header", default="X-Forwarded-For",
+                        help="Cabecera con la IP del visitante que confía la landing ('' = todas desde esta IP)")
+    parser.add_argument("--results", default=os.path.join(os.path.dirname(__file__), "results.jsonl"))
+    args = parser.parse_args()
+
+    if args.tokens_file:
+        with open(args.tokens_file) as f:
+            tokens = [line.strip() for line in f if line.strip()]
+    elif args.seed:
+        tokens = seed_tokens(os.environ["DATABASE_URL"], args.seed)
+    else:
+        parser.error("Indique --seed N o --tokens-file")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        for method in ("GET", "POST"):
+            result = await run_scenario(client, method, tokens, args.requests, args.concurrency, args.ip_header)
+            result["label"] = args.label
+            print(
+                f"[{args.label or '-'}] {method:4} {result['rps']:>8} req/s  "
+                f"p50={result['p50_ms']} ms  p95={result['p95_ms']} ms  p99={result['p99_ms']} ms  "
+                f"errores={result['errors']}  códigos={result['statuses']}"
+            )
+            with open(args.results, "a") as f:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+"""Verifica /metrics de la landing con un scrape local.
+
+Hace un scrape, lanza algunas visitas (un token válido opcional y uno inválido),
+vuelve a hacer scrape y reporta la diferencia de los contadores por resultado, los
+histogramas de consultas y render (promedio y p95 aproximado por buckets) y los
+gauges del pool. Termina con código 1 si falta alguna métrica esperada o si los
+contadores no reflejan las visitas. Cada visita llega con una IP distinta en
+--ip-header para que el cupo por IP de la landing no las cuente como rate_limited.
+
+    python bench/scrape_metrics.py --base-url http://localhost:8000
+    python bench/scrape_metrics.py --base-url http://localhost:8000 --token <uuid> --requests 200
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+EXPECTED_FAMILIES = [
+    "habeas_consent_requests",
+    "habeas_db_query_seconds",
+    "habeas_template_render_seconds",
+    "habeas_db_pool_size",
+    "habeas_db_pool_checked_out",
+    "habeas_db_pool_checked_in",
+    "habeas_db_pool_overflow",
+]
+
+
+def visitor_headers(ip_header: str) -> dict:
+    """Cabecera con una IP aleatoria (un visitante distinto por petición)"""
+    if not ip_header:
+        return {}
+    return {ip_header: f"10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(1, 255)}"}
+
+
+def scrape(client: httpx.Client) -> tuple[dict, float]:
+    """Muestras {(nombre, etiquetas): valor} y duración del scrape en ms"""
+    started = time.perf_counter()
+    response = client.get("/metrics")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    response.raise_for_status()
+    samples = {}
+    families = set()
+    for family in text_string_to_metric_families(response.text):
+        families.add(family.name)
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    samples["__families__"] = families
+    return samples, elapsed_ms
+
+
+def delta(before: dict, after: dict, name: str) -> dict:
+    """Diferencia por etiquetas de una serie entre dos scrapes"""
+    return {
+        labels: value - before.get((sample_name, labels), 0)
+        for (sample_name, labels), value in after.items()
+        if sample_name == name
+    }
+
+
+def histogram_summary(before: dict, after: dict, family: str) -> dict:
+    """{etiqueta: (observaciones, promedio ms, p95 ms aproximado)} entre los dos scrapes"""
+    counts = delta(before, after, f"{family}_count")
+    sums = delta(before, after, f"{family}_sum")
+    buckets = delta(before, after, f"{family}_bucket")
+    summary = {}
+    for labels, count in counts.items():
+        if not count:
+            continue
+        label = dict(labels)
+        bounds = sorted(
+            (float(dict(b)["le"]), value)
+            for b, value in buckets.items()
+            if {k: v for k, v in b if k != "le"} == label
+        )
+        p95 = next((le for le, cumulative in bounds if cumulative >= 0.95 * count), float("inf"))
+        summary[", ".join(label.values())] = (int(count), sums[labels] / count * 1000, p95 * 1000)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", help="Token válido para medir la vista del formulario")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--ip-header", default="X-Forwarded-For",
+                        help="Cabecera con la IP del visitante que confía la landing ('' = todas desde esta IP)")
+    args = parser.parse_args()
+
+    with httpx.Client(base_url=args.base_url, timeout=10) as client:
+        before, _ = scrape(client)
+        for _ in range(args.requests):
+            client.get(f"/auth/{uuid.uuid4()}", headers=visitor_headers(args.ip_header))
+            if args.token:
+                client.get(f"/auth/{args.token}", headers=visitor_headers(args.ip_header))
+        after, scrape_ms = scrape(client)
+
+    problems = [f"falta la métrica {name}" for name in EXPECTED_FAMILIES if name not in after["__families__"]]
+
+    print(f"Scrape de /metrics: {scrape_ms:.1f} ms\n")
+    print("Solicitudes por resultado (diferencia):")
+    requests_delta = delta(before, after, "habeas_consent_requests_total")
+    for labels, value in sorted(requests_delta.items()):
+        if value:
+            print(f"  {dict(labels)['method']:<5} {dict(labels)['outcome']:<18} {value:>8.0f}")
+    invalid = requests_delta.get((("method", "GET"), ("outcome", "invalid")), 0)
+    if invalid < args.requests:
+        problems.append(f"se esperaban {args.requests} GET inválidos y se contaron {invalid:.0f}")
+
+    for family in ("habeas_db_query_seconds", "habeas_template_render_seconds"):
+        print(f"\n{family}:")
+        for label, (count, mean_ms, p95_ms) in histogram_summary(before, after, family).items():
+            print(f"  {label:<22} n={count:<6} promedio={mean_ms:.2f} ms  p95<={p95_ms:.1f} ms")
+
+    print("\nPool de conexiones:")
+    for name in EXPECTED_FAMILIES[3:]:
+        print(f"  {name:<28} {after.get((name, ()), float('nan')):.0f}")
+
+    if problems:
+        print("\n❌ " + "\n❌ ".join(problems))
+        sys.exit(1)
+    print("\n✅ /metrics expone todas las métricas esperadas.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Resumen por campaña (tabla campaign_stats).
+
+Los triggers de habeas_requests y send_logs lo mantienen al día; este comando lo
+recalcula desde cero si hiciera falta (ej. tras cargar datos con los triggers
+desactivados). Bloquea las escrituras de solicitudes y envíos mientras corre.
+
+    python campaign_stats.py            # muestra el resumen
+    python campaign_stats.py --rebuild  # lo recalcula
+"""
+import argparse
+
+from sqlalchemy import create_engine, text
+
+from config import DB_URL
+from dashboard import fetch_campaign_stats
+
+
+def rebuild(conn) -> int:
+    """Recalcula campaign_stats en una transacción; devuelve las filas escritas"""
+    rows = conn.execute(text("SELECT rebuild_campaign_stats()")).scalar_one()
+    conn.commit()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="Recalcular desde habeas_requests y send_logs")
+    args = parser.parse_args()
+
+    engine = create_engine(DB_URL)
+    with engine.connect() as conn:
+        if args.rebuild:
+            print(f"✅ campaign_stats recalculada ({rebuild(conn)} filas).")
+        print(fetch_campaign_stats(conn).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+
+import requests
+
+
+# Configuración compartida entre el panel (app.py) y el despachador (dispatcher.py)
+DB_URL = os.getenv("DATABASE_URL")
+EVO_URL = os.getenv("EVOLUTION_API_URL")
+EVO_KEY = os.getenv("EVOLUTION_API_KEY")
+INSTANCE = os.getenv("WA_INSTANCE_NAME")
+# Pool de instancias para repartir campañas (por defecto solo WA_INSTANCE_NAME)
+INSTANCES = [
+    name.strip()
+    for name in os.getenv("WA_INSTANCE_NAMES", INSTANCE or "").split(",")
+    if name.strip()
+]
+PUBLIC_DOMAIN = os.getenv("PUBLIC_DOMAIN")
+
+# Despachador: cuántas filas reclama cada worker por ronda y cuánto duerme si la cola está vacía
+DISPATCH_BATCH_SIZE = int(os.getenv("DISPATCH_BATCH_SIZE", "20"))
+DISPATCH_IDLE_SECONDS = float(os.getenv("DISPATCH_IDLE_SECONDS", "5"))
+
+# Cliente HTTP de Evolution API: tiempos de espera (s) y tamaño del pool de conexiones
+EVO_CONNECT_TIMEOUT = float(os.getenv("EVOLUTION_CONNECT_TIMEOUT", "3"))
+EVO_READ_TIMEOUT = float(os.getenv("EVOLUTION_READ_TIMEOUT", "15"))
+EVO_POOL_SIZE = int(os.getenv("EVOLUTION_POOL_SIZE", "10"))
+
+# Envío concurrente: mensajes en vuelo y cupo de cada instancia (token bucket).
+# El cupo es por proceso despachador: con N réplicas, cada instancia recibe hasta N veces la tasa.
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "4"))
+SEND_RATE_PER_MINUTE = float(os.getenv("SEND_RATE_PER_MINUTE", "6"))
+SEND_BURST = int(os.getenv("SEND_BURST", "1"))
+# Cada cuántos segundos se consulta connectionState de las instancias del pool
+INSTANCE_HEALTH_INTERVAL = float(os.getenv("INSTANCE_HEALTH_INTERVAL", "30"))
+# Tras un envío rechazado se reutiliza el estado de la instancia consultado hace menos de esto
+INSTANCE_CHECK_TTL = float(os.getenv("INSTANCE_CHECK_TTL", "10"))
+
+# Minutos que un trabajo puede seguir en 'sending' antes de darlo por interrumpido
+# (debe superar lo que tarda un lote completo con el cupo configurado)
+SEND_LEASE_MINUTES = float(os.getenv("SEND_LEASE_MINUTES", "30"))
+
+# Reintentos de fallos transitorios (5xx, 429, timeouts): máximo de intentos por mensaje
+# y backoff exponencial con jitter entre RETRY_BASE_SECONDS y RETRY_MAX_SECONDS
+MAX_SEND_ATTEMPTS = int(os.getenv("MAX_SEND_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = float(os.getenv("RETRY_MAX_SECONDS", "3600"))
+
+# Recordatorios automáticos a solicitudes pendientes: días sin respuesta desde el último
+# envío, recordatorios máximos por solicitud (0 los desactiva) y cada cuánto se revisa
+REMINDER_AFTER_DAYS = int(os.getenv("REMINDER_AFTER_DAYS", "5"))
+REMINDER_MAX = int(os.getenv("REMINDER_MAX", "2"))
+REMINDER_CHECK_MINUTES = float(os.getenv("REMINDER_CHECK_MINUTES", "15"))
+
+# Resultados de envío en lote (write-behind): filas o segundos antes de escribir en la DB,
+# y journal local que permite recuperarlos si el worker muere antes de guardarlos
+OUTCOME_FLUSH_ROWS = int(os.getenv("OUTCOME_FLUSH_ROWS", "100"))
+OUTCOME_FLUSH_SECONDS = float(os.getenv("OUTCOME_FLUSH_SECONDS", "2"))
+OUTCOME_JOURNAL_DIR = os.getenv("OUTCOME_JOURNAL_DIR", "/var/lib/habeas/outcomes")
+OUTCOME_JOURNAL_FSYNC = os.getenv("OUTCOME_JOURNAL_FSYNC", "false").lower() == "true"
+
+# send_logs: guardar también el texto crudo de la respuesta de Evolution API (además del
+# resumen en JSONB), meses que quedan en la DB antes de archivarse y dónde se archivan
+SEND_LOG_RAW_BODY = os.getenv("SEND_LOG_RAW_BODY", "false").lower() == "true"
+SEND_LOGS_RETENTION_MONTHS = int(os.getenv("SEND_LOGS_RETENTION_MONTHS", "12"))
+SEND_LOGS_ARCHIVE_DIR = os.getenv("SEND_LOGS_ARCHIVE_DIR", "/var/lib/habeas/send_logs_archive")
+
+# Monitor de estado del panel: intervalo de consulta y días de historial guardados
+STATUS_POLL_SECONDS = float(os.getenv("STATUS_POLL_SECONDS", "15"))
+STATUS_LOG_RETENTION_DAYS = int(os.getenv("STATUS_LOG_RETENTION_DAYS", "30"))
+
+
+def discover_public_domain():
+    """Devuelve PUBLIC_DOMAIN o, si no está configurado, la URL HTTPS de Ngrok local"""
+    if PUBLIC_DOMAIN:
+        return PUBLIC_DOMAIN
+    try:
+        # Ngrok expone una API local en el puerto 4040. Intentamos consultarla.
+        # host.docker.internal apunta a tu máquina anfitriona desde Docker.
+        resp = requests.get("http://host.docker.internal:4040/api/tunnels", timeout=1)
+        if resp.status_code == 200:
+            data = resp.json()
+            # Buscamos el túnel que sea HTTPS
+            public_url = next((t["public_url"] for t in data["tunnels"] if t["proto"] == "https"), None)
+            if public_url:
+                print(f"✅ Ngrok detectado automáticamente: {public_url}")
+                return public_url
+    except Exception:
+        pass  # Si falla, simplemente seguimos y mostramos el error en el panel
+    return None
@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+
+# --- Consultas del panel "Estado de Solicitudes" ---
+# Compartidas por app.py y bench/bench_admin_queries.py. Los filtros de fecha son
+# rangos sobre sent_at (no sent_at::date) para que puedan usar los índices.
+
+PAGE_SIZE = 50
+TABLE_COLUMNS = (
+    "id, phone, name, status, sent_at, accepted_at, expires_at, terms_version, campaign_id, language"
+)
+OLD_PENDING_WHERE = "WHERE status = 'pending' AND sent_at < NOW() - INTERVAL '5 days'"
+
+# Destinatarios de los reenvíos según las confirmaciones del webhook (message_receipts)
+DELIVERED_EXISTS = (
+    "EXISTS (SELECT 1 FROM send_queue q JOIN message_receipts r ON r.message_id = q.message_id "
+    "WHERE q.request_id = habeas_requests.id AND r.status IN ('DELIVERY_ACK', 'READ', 'PLAYED'))"
+)
+DELIVERY_TARGETS = {
+    "Todos los pendientes": "",
+    "Entregados sin respuesta": f" AND {DELIVERED_EXISTS}",
+    "Nunca entregados": f" AND NOT {DELIVERED_EXISTS}",
+}
+
+
+def build_request_filters(statuses, date_from, date_to):
+    """Cláusula WHERE y parámetros comunes a KPIs, tabla, exportación y reenvíos"""
+    where = "WHERE 1=1"
+    params = {}
+
+    if statuses:
+        where += " AND status = ANY(:statuses)"
+        params["statuses"] = list(statuses)
+
+    if date_from:
+        where += " AND sent_at >= :date_from"
+        params["date_from"] = date_from
+
+    if date_to:
+        # Día completo incluido: sent_at < día siguiente a las 00:00
+        where += " AND sent_at < :date_to_next"
+        params["date_to_next"] = date_to + timedelta(days=1)
+
+    return where, params
+
+
+def status_counts_query(where: str) -> str:
+    return f"SELECT status, COUNT(*) FROM habeas_requests {where} GROUP BY status"
+
+
+def page_query(where: str, with_cursor: bool) -> str:
+    query = f"SELECT {TABLE_COLUMNS} FROM habeas_requests {where}"
+    if with_cursor:
+        query += " AND (sent_at, id) < (:cursor_sent_at, :cursor_id)"
+    return query + " ORDER BY sent_at DESC, id DESC LIMIT :limit"
+
+
+def page_params(params: dict, cursor) -> dict:
+    # Pedimos una fila de más solo para saber si hay página siguiente
+    result = dict(params, limit=PAGE_SIZE + 1)
+    if cursor:
+        result["cursor_sent_at"], result["cursor_id"] = cursor
+    return result
+
+
+def fetch_status_counts(conn, where: str, params: dict) -> pd.Series:
+    rows = conn.execute(text(status_counts_query(where)), params).fetchall()
+    return pd.Series(dict(rows), dtype="int64")
+
+
+def fetch_page(conn, where: str, params: dict, cursor):
+    """Una página de la tabla por keyset (sent_at, id) descendente"""
+    page = pd.read_sql(
+        text(page_query(where, cursor is not None)), conn, params=page_params(params, cursor)
+    )
+    return page.head(PAGE_SIZE), len(page) > PAGE_SIZE
+
+
+# --- Resumen por campaña (tabla campaign_stats, mantenida por triggers) ---
+# Una fila por (campaña, shard): las lecturas agregan unas pocas filas por campaña
+# sin importar cuántas solicitudes tenga.
+
+CAMPAIGN_STATS_QUERY = """
+    SELECT s.campaign_id, COALESCE(c.name, '(sin campaña)') AS campaign,
+           SUM(s.pending)::bigint AS pending, SUM(s.accepted)::bigint AS accepted,
+           SUM(s.rejected)::bigint AS rejected, SUM(s.failed)::bigint AS failed,
+           SUM(s.sends_ok)::bigint AS sends_ok, SUM(s.sends_failed)::bigint AS sends_failed,
+           MIN(s.first_activity_at) AS first_activity_at, MAX(s.last_activity_at) AS last_activity_at
+    FROM campaign_stats s
+    LEFT JOIN campaigns c ON c.id = s.campaign_id
+    {where}
+    GROUP BY s.campaign_id, c.name
+    ORDER BY MAX(s.last_activity_at) DESC NULLS LAST
+"""
+REQUEST_STATUSES = ["pending", "accepted", "rejected", "failed"]
+
+
+def fetch_campaign_stats(conn, campaign_id: int | None = None) -> pd.DataFrame:
+    """Resumen de todas las campañas (o de una) con total y tasa de aceptación"""
+    where, params = "", {}
+    if campaign_id is not None:
+        where, params = "WHERE s.campaign_id = :campaign_id", {"campaign_id": campaign_id}
+    stats = pd.read_sql(text(CAMPAIGN_STATS_QUERY.format(where=where)), conn, params=params)
+    stats["total"] = stats[REQUEST_STATUSES].sum(axis=1)
+    stats["accepted_pct"] = (stats["accepted"] / stats["total"].where(stats["total"] > 0)).fillna(0) * 100
+    return stats
+
+
+def rollup_status_counts(conn, statuses) -> pd.Series:
+    """Conteo por estado de todas las campañas desde campaign_stats (KPIs sin filtro de fecha)"""
+    row = conn.execute(
+        text("SELECT " + ", ".join(f"COALESCE(SUM({s}), 0)::bigint" for s in REQUEST_STATUSES) + " FROM campaign_stats")
+    ).fetchone()
+    counts = pd.Series(dict(zip(REQUEST_STATUSES, row)), dtype="int64")
+    if statuses:
+        counts = counts[counts.index.isin(statuses)]
+    return counts[counts > 0]
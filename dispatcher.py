@@ -0,0 +1,151 @@
+"""Despachador de envíos masivos.
+
+Proceso independiente del panel de Streamlit: drena la tabla send_queue y envía
+los mensajes por Evolution API. Se pueden levantar varias réplicas en paralelo.
+
+    python dispatcher.py
+"""
+import os
+import signal
+import socket
+import time
+
+from sqlalchemy import create_engine
+
+from config import (
+    DB_URL,
+    DISPATCH_BATCH_SIZE,
+    DISPATCH_IDLE_SECONDS,
+    INSTANCES,
+    MAX_SEND_ATTEMPTS,
+    REMINDER_AFTER_DAYS,
+    REMINDER_CHECK_MINUTES,
+    REMINDER_MAX,
+    SEND_CONCURRENCY,
+    SEND_LEASE_MINUTES,
+    SEND_RATE_PER_MINUTE,
+    discover_public_domain,
+)
+from evolution import DEFAULT_TEMPLATE, TEMPLATE_ERROR_PREFIX
+from instances import InstancePool
+from message_templates import TemplateError, render_batch
+from outcome_buffer import OutcomeBuffer
+from retry_policy import retry_delay
+from send_logs_archive import ensure_partitions
+from send_queue import claim_batch, recover_stale_jobs, release_jobs, schedule_reminders
+from sender import ConcurrentSender
+
+_stop = False
+
+
+def _request_stop(signum, frame):
+    global _stop
+    _stop = True
+    print("Señal de parada recibida, devolviendo a la cola lo no enviado...")
+
+
+def run_reminders(engine):
+    """Programa los recordatorios pendientes y asegura las próximas particiones de send_logs
+    (cualquier réplica puede hacerlo)"""
+    with engine.connect() as conn:
+        ensure_partitions(conn)
+        scheduled = schedule_reminders(conn, REMINDER_AFTER_DAYS, REMINDER_MAX)
+    if scheduled:
+        print(f"🔔 {scheduled} recordatorios encolados")
+
+
+def run_worker(engine, public_domain: str, worker_id: str):
+    pool = InstancePool()
+    pool.start()
+    # Al crearse reprocesa los journals de workers caídos
+    outcomes = OutcomeBuffer(engine, worker_id)
+    sender = ConcurrentSender(pool, before_send=outcomes.begin)
+    with engine.connect() as conn:
+        recover_stale_jobs(conn, SEND_LEASE_MINUTES)
+    next_reminders = 0.0
+    try:
+        while not _stop:
+            if time.monotonic() >= next_reminders:
+                next_reminders = time.monotonic() + REMINDER_CHECK_MINUTES * 60
+                try:
+                    run_reminders(engine)
+                except Exception as e:
+                    print(f"Error programando recordatorios: {e}")
+
+            if not pool.healthy():
+                print("⚠️ Ninguna instancia de WhatsApp conectada; esperando...")
+                time.sleep(pool.health_interval)
+                continue
+
+            with engine.connect() as conn:
+                claim_started = time.perf_counter()
+                jobs = claim_batch(conn, worker_id, DISPATCH_BATCH_SIZE)
+                if not jobs:
+                    stale = recover_stale_jobs(conn, SEND_LEASE_MINUTES)
+                    if stale:
+                        print(f"⚠️ {stale} envíos sin resultado tras {SEND_LEASE_MINUTES:g} min marcados como interrumpidos")
+                    time.sleep(DISPATCH_IDLE_SECONDS)
+                    continue
+
+                # Plantillas compiladas una vez por texto; las campañas sin plantilla propia usan la por defecto
+                messages = render_batch(jobs, public_domain, DEFAULT_TEMPLATE)
+                broken = {job.id for job in jobs if isinstance(messages[job.id], TemplateError)}
+                for job in jobs:
+                    if job.id in broken:
+                        # Plantilla inválida guardada antes de validarlas: falla permanente, no se envía
+                        outcomes.add(
+                            job.id, job.idempotency_key, job.attempts, None, None,
+                            f"{TEMPLATE_ERROR_PREFIX}: {messages[job.id]}",
+                        )
+                jobs = [job for job in jobs if job.id not in broken]
+                # Costo de DB de la reclamación, repartido entre los mensajes del lote
+                claim_ms = (time.perf_counter() - claim_started) * 1000 / max(1, len(jobs))
+
+                unsent = {job.id for job in jobs}
+                for result in sender.send_batch(jobs, messages, lambda: _stop):
+                    job = result.job
+                    if (result.status_code is not None and result.status_code != 201
+                            and not pool.check(result.instance)):
+                        # Evolution rechazó el envío porque la instancia se desconectó: no salió,
+                        # vuelve a la cola para otra instancia. Sin respuesta (None) no se sabe.
+                        outcomes.discard(job.id)
+                        continue
+                    if result.status_code == 429:
+                        pool.defer(result.instance, result.retry_after or pool.health_interval)
+                    # Fallos transitorios vuelven a la cola con backoff; los permanentes quedan en 'failed'
+                    retry_in = retry_delay(job.attempts, result.status_code, result.body, result.retry_after)
+                    outcomes.add(
+                        job.id, job.idempotency_key, job.attempts, result.instance, result.status_code, result.body, retry_in,
+                        http_ms=result.http_ms, wait_ms=result.wait_ms, db_ms=claim_ms,
+                    )
+                    unsent.discard(job.id)
+
+                if unsent:
+                    # Devolver a la cola lo reclamado y no enviado
+                    release_jobs(conn, unsent)
+    finally:
+        pool.stop()
+        sender.shutdown()
+        outcomes.close()
+
+
+def main():
+    public_domain = discover_public_domain()
+    if not public_domain:
+        raise SystemExit("PUBLIC_DOMAIN no está configurado; los enlaces enviados serían inválidos.")
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    print(
+        f"🚚 Despachador {worker_id} iniciado (lote={DISPATCH_BATCH_SIZE}, "
+        f"concurrencia={SEND_CONCURRENCY}, cupo={SEND_RATE_PER_MINUTE}/min por instancia, "
+        f"intentos={MAX_SEND_ATTEMPTS}, "
+        f"instancias={', '.join(INSTANCES)})"
+    )
+    run_worker(create_engine(DB_URL), public_domain, worker_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import EVO_CONNECT_TIMEOUT, EVO_KEY, EVO_POOL_SIZE, EVO_READ_TIMEOUT, EVO_URL, INSTANCE
+from message_templates import TemplateError, auth_link, compile_template
+
+
+DEFAULT_TEMPLATE = (
+    "Hola *{name}*,\n\n"
+    "Para continuar brindándote nuestro servicio, necesitamos actualizar tu autorización de tratamiento de datos.\n\n"
+    "Por favor, acepta los términos aquí: {auth_link}\n\n"
+    "Gracias."
+)
+
+TIMEOUT = (EVO_CONNECT_TIMEOUT, EVO_READ_TIMEOUT)
+TEMPLATE_ERROR_PREFIX = "Error en plantilla de mensaje"
+# Caracteres que se guardan de una respuesta que no es JSON (ej. el texto de un timeout)
+RESPONSE_ERROR_CHARS = 500
+
+
+def _build_session():
+    """Sesión con conexiones keep-alive reutilizables (segura para usar desde varios hilos)"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=EVO_POOL_SIZE, pool_maxsize=EVO_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"apikey": EVO_KEY})
+    return session
+
+
+session = _build_session()
+
+
+def _retry_after_seconds(response) -> float | None:
+    """Retry-After en segundos (admite segundos o fecha HTTP)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def send_whatsapp_message(phone, name, token, message_template, public_domain, instance=INSTANCE):
+    """Envía mensaje usando Evolution API con simulación humana"""
+    try:
+        message_body = compile_template(message_template).render(name, auth_link(public_domain, token))
+    except TemplateError as e:
+        return None, f"{TEMPLATE_ERROR_PREFIX}: {str(e)}"
+    status_code, body, _ = post_whatsapp_text(phone, message_body, instance)
+    return status_code, body
+
+
+def post_whatsapp_text(phone, message_body, instance=INSTANCE):
+    """Envía un mensaje ya armado; devuelve (status_code, body, Retry-After en s o None)"""
+    url = f"{EVO_URL}/message/sendText/{instance}"
+
+    payload = {
+        "number": phone,
+        "options": {"delay": 1200, "presence": "composing"},  # Simula escritura
+        "textMessage": {"text": message_body},
+    }
+
+    try:
+        response = session.post(url, json=payload, timeout=TIMEOUT)
+        return response.status_code, response.text, _retry_after_seconds(response)
+    except Exception as e:
+        return None, str(e), None
+
+
+def summarize_response(body: str | None) -> tuple[str | None, dict | None]:
+    """(message_id, resumen) de la respuesta de sendText para guardar en send_logs.
+
+    El resumen conserva el estado del mensaje o el error de Evolution API en lugar
+    del texto completo (que incluye el mensaje enviado).
+    """
+    if not body:
+        return None, None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return None, {"error": body[:RESPONSE_ERROR_CHARS]}
+    key = data.get("key")
+    message_id = key.get("id") if isinstance(key, dict) else None
+    summary = {
+        "status": data["status"] if isinstance(data.get("status"), str) else None,
+        "error": data.get("error"),
+        "detail": data.get("response"),
+    }
+    return message_id, {k: v for k, v in summary.items() if v is not None}
+
+
+def check_evolution_status(instance=INSTANCE):
+    """Verifica el estado de la instancia de WhatsApp"""
+    try:
+        url = f"{EVO_URL}/instance/connectionState/{instance}"
+        resp = session.get(url, timeout=(EVO_CONNECT_TIMEOUT, 2))
+        if resp.status_code == 200:
+            return resp.json().get("instance", {}).get("state", "unknown")
+    except Exception:
+        return "error"
+    return "unknown"
+
+
+def get_evolution_qr(instance=INSTANCE):
+    """Obtiene el QR si la instancia no está conectada (lanza excepción si la API falla)"""
+    # 1. Asegurar que la instancia existe
+    create_url = f"{EVO_URL}/instance/create"
+    session.post(create_url, json={"instanceName": instance}, timeout=TIMEOUT)
+
+    # 2. Obtener QR
+    connect_url = f"{EVO_URL}/instance/connect/{instance}"
+    resp = session.get(connect_url, timeout=TIMEOUT)
+    if resp.status_code == 200:
+        return resp.json().get("base64")
+    return None
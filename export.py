@@ -0,0 +1,98 @@
+import gzip
+import os
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+
+# --- Exportación de evidencia para auditorías ---
+# Las filas van de Postgres al archivo por trozos (COPY ... TO STDOUT para CSV,
+# cursor del lado del servidor para Parquet), así que la memoria no depende del
+# número de filas. Una fila por intento de envío, con la evidencia de la solicitud.
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "/tmp/habeas_exports")
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
+
+
+def evidence_query(where: str) -> str:
+    """Consulta de evidencia sobre las solicitudes que cumplen `where`"""
+    return f"""
+        WITH terms AS MATERIALIZED (
+            SELECT version, encode(sha256(convert_to(content, 'UTF8')), 'hex') AS terms_sha256
+            FROM legal_terms
+        )
+        SELECT h.id AS request_id, h.phone, h.name, h.status, h.sent_at, h.accepted_at,
+               h.ip_address, h.user_agent, h.terms_version, t.terms_sha256,
+               c.name AS campaign,
+               s.created_at AS send_created_at, s.response_status AS send_status,
+               s.instance_name AS send_instance
+        FROM (SELECT * FROM habeas_requests {where}) h
+        LEFT JOIN terms t ON t.version = h.terms_version
+        LEFT JOIN campaigns c ON c.id = h.campaign_id
+        LEFT JOIN send_logs s ON s.request_id = h.id
+        ORDER BY h.id, s.created_at
+    """
+
+
+def _export_path(extension: str) -> str:
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(EXPORT_DIR, f"habeas_evidencia_{stamp}.{extension}")
+
+
+def export_csv_gz(conn, where: str, params: dict) -> tuple[str, int]:
+    """COPY de la evidencia a un CSV comprimido con gzip; devuelve (ruta, filas)"""
+    # COPY no admite parámetros: psycopg2 los incrusta con el escape adecuado
+    compiled = text(evidence_query(where)).compile(dialect=conn.dialect)
+    cursor = conn.connection.cursor()
+    try:
+        query = cursor.mogrify(str(compiled), params).decode("utf-8")
+        path = _export_path("csv.gz")
+        with gzip.open(path, "wb") as f:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", f)
+        rows = cursor.rowcount
+    finally:
+        cursor.close()
+    conn.rollback()
+    return path, rows
+
+
+def export_parquet(conn, where: str, params: dict) -> tuple[str, int]:
+    """Evidencia a Parquet por lotes de EXPORT_CHUNK_ROWS filas; devuelve (ruta, filas)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("La exportación a Parquet requiere pyarrow (pip install pyarrow).") from e
+
+    # Esquema fijo: un lote con columnas vacías no debe cambiar los tipos del archivo
+    schema = pa.schema([
+        ("request_id", pa.int64()),
+        ("phone", pa.string()),
+        ("name", pa.string()),
+        ("status", pa.string()),
+        ("sent_at", pa.timestamp("us")),
+        ("accepted_at", pa.timestamp("us")),
+        ("ip_address", pa.string()),
+        ("user_agent", pa.string()),
+        ("terms_version", pa.string()),
+        ("terms_sha256", pa.string()),
+        ("campaign", pa.string()),
+        ("send_created_at", pa.timestamp("us")),
+        ("send_status", pa.int64()),
+        ("send_instance", pa.string()),
+    ])
+
+    path = _export_path("parquet")
+    rows = 0
+    # stream_results: cursor del lado del servidor, se traen EXPORT_CHUNK_ROWS filas a la vez
+    query = text(evidence_query(where)).execution_options(stream_results=True)
+    try:
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            for chunk in pd.read_sql(query, conn, params=params, chunksize=EXPORT_CHUNK_ROWS):
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                rows += len(chunk)
+    finally:
+        conn.rollback()
+    return path, rows
@@ -0,0 +1,265 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+
+# --- Ingesta masiva de contactos de campaña ---
+# El CSV se lee por trozos de CSV_CHUNK_ROWS filas con tipos explícitos, así que la
+# memoria depende del tamaño del trozo y no del archivo. En cada trozo los teléfonos
+# se normalizan y deduplican en pandas (operaciones vectorizadas, sin iterrows), se
+# cargan con COPY a una tabla temporal y se crean las solicitudes (y sus trabajos en
+# send_queue) con una sola sentencia.
+
+INGEST_COLUMNS = ["phone", "name", "language"]
+CSV_DTYPES = {column: "string" for column in INGEST_COLUMNS}
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "50000"))
+# Filas descartadas que se guardan para mostrar en el reporte
+REJECTED_SAMPLE_ROWS = 1000
+COUNTRY_CODE = "57"
+
+# Motivos de descarte que ve el operador en el reporte previo al envío
+REASON_EMPTY = "vacío"
+REASON_LETTERS = "contiene letras"
+REASON_FOREIGN = "no es un número colombiano"
+REASON_LENGTH = "longitud inválida"
+REASON_NOT_MOBILE = "no es un celular colombiano"
+
+# Celdas que pandas leyó como float: 5.73004289163e+11, 3004289163.0
+_FLOAT_PHONE = r"\d+\.\d+(?:[eE]\+?\d+)?|\d+[eE]\+?\d+"
+
+
+def normalize_phones(raw: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """Normaliza a E.164 colombiano sin '+' (57 + celular de 10 dígitos), como lo espera Evolution API.
+
+    Devuelve (teléfonos, motivo): el motivo es NA en los válidos y uno de los
+    REASON_* en los descartados.
+    """
+    phones = raw.astype("string").str.strip()
+    as_float = phones.str.fullmatch(_FLOAT_PHONE).fillna(False)
+    out_of_range = pd.Series(False, index=raw.index)
+    if as_float.any():
+        values = pd.to_numeric(phones[as_float].astype(object), errors="coerce")
+        # Más de 15 dígitos (ej. 1e30) no cabe en Int64 ni es un teléfono: se descarta solo esa fila
+        fits = pd.Series(np.isfinite(values) & (np.abs(values) < 1e15), index=values.index)
+        out_of_range = (~fits).reindex(raw.index, fill_value=False)
+        phones[as_float] = values.where(fits).round().astype("Int64").astype("string")
+
+    digits = phones.str.replace(r"\D", "", regex=True)
+    international = phones.str.startswith("+").fillna(False) | digits.str.startswith("00").fillna(False)
+    digits = digits.str.replace(r"^00", "", regex=True)
+    national_mobile = (~international & (digits.str.len() == 10) & digits.str.startswith("3")).fillna(False)
+    normalized = digits.where(~national_mobile, COUNTRY_CODE + digits)
+
+    valid = normalized.str.fullmatch(COUNTRY_CODE + r"3\d{9}").fillna(False)
+    wrong_length = (normalized.str.len() != 12).fillna(False)
+    colombian = normalized.str.startswith(COUNTRY_CODE).fillna(False)
+    letters = phones.str.contains(r"[A-Za-z]").fillna(False)
+    empty = digits.fillna("") == ""
+
+    # Del motivo más general al más específico: el último que aplica gana
+    reason = pd.Series(pd.NA, index=raw.index, dtype="string")
+    reason = reason.mask(~valid, REASON_NOT_MOBILE)
+    reason = reason.mask(~valid & wrong_length, REASON_LENGTH)
+    reason = reason.mask(~valid & international & ~colombian, REASON_FOREIGN)
+    reason = reason.mask(letters, REASON_LETTERS)
+    reason = reason.mask(empty, REASON_EMPTY)
+    reason = reason.mask(out_of_range, REASON_LENGTH)
+    return normalized.where(valid), reason
+
+
+def prepare_contacts(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, int]:
+    """Normaliza y deduplica el archivo; devuelve (contactos, descartados con motivo, duplicados)"""
+    phones, reason = normalize_phones(df["phone"])
+    contacts = pd.DataFrame(
+        {
+            "phone": phones,
+            "name": df["name"].astype("string").str.strip(),
+            "language": (
+                df["language"].astype("string").str.strip().str.lower()
+                if "language" in df.columns else "es"
+            ),
+        }
+    )
+    invalid = reason.notna()
+    rejected = pd.DataFrame({"phone": df["phone"][invalid], "name": df["name"][invalid], "reason": reason[invalid]})
+    contacts = contacts[~invalid]
+    # El mismo número escrito de varias formas cuenta una sola vez (se queda la primera fila)
+    deduped = contacts.drop_duplicates("phone")
+    return deduped, rejected, len(contacts) - len(deduped)
+
+
+def existing_phones(conn, campaign_id: int | None, phones: pd.Series) -> pd.Series:
+    """Máscara de los teléfonos que ya tienen solicitud en la campaña (una sola consulta)"""
+    if campaign_id is None or phones.empty:
+        return pd.Series(False, index=phones.index)
+    found = conn.execute(
+        text(
+            """
+            SELECT p.phone
+            FROM unnest(CAST(:phones AS text[])) AS p(phone)
+            WHERE EXISTS (
+                SELECT 1 FROM habeas_requests h
+                WHERE h.campaign_id = :campaign_id AND h.phone = p.phone
+            )
+            """
+        ),
+        {"phones": phones.tolist(), "campaign_id": campaign_id},
+    ).scalars().all()
+    conn.rollback()
+    return phones.isin(found)
+
+
+def csv_columns(file) -> list[str]:
+    """Encabezado del CSV (deja el archivo al inicio)"""
+    file.seek(0)
+    columns = list(pd.read_csv(file, nrows=0).columns)
+    file.seek(0)
+    return columns
+
+
+def read_contact_chunks(file, chunksize: int = CSV_CHUNK_ROWS):
+    """Genera (trozo, fracción leída del archivo) con solo las columnas de INGEST_COLUMNS"""
+    file.seek(0, os.SEEK_END)
+    size = file.tell() or 1
+    file.seek(0)
+    reader = pd.read_csv(
+        file,
+        chunksize=chunksize,
+        dtype=CSV_DTYPES,
+        usecols=lambda column: column in INGEST_COLUMNS,
+    )
+    with reader:
+        for chunk in reader:
+            # tell() avanza por bloques del parser: aproximado pero monótono
+            yield chunk, min(1.0, file.tell() / size)
+
+
+def send_report(conn, file, campaign_id: int | None, on_progress=None) -> dict:
+    """Reporte previo al envío: qué se descarta, por qué, y qué se enviará realmente.
+
+    Recorre el archivo por trozos; para detectar repetidos entre trozos solo guarda
+    los teléfonos válidos como enteros (8 bytes por número distinto).
+    """
+    seen = np.empty(0, dtype=np.int64)
+    reasons = []
+    samples = []
+    report = {"total": 0, "duplicates_in_file": 0, "already_in_campaign": 0, "to_send": 0}
+    for chunk, progress in read_contact_chunks(file):
+        contacts, rejected, in_chunk = prepare_contacts(chunk)
+        numbers = pd.to_numeric(contacts["phone"]).to_numpy(dtype=np.int64)
+        repeated = np.isin(numbers, seen)
+        seen = np.union1d(seen, numbers)
+        contacts = contacts[~repeated]
+        already = existing_phones(conn, campaign_id, contacts["phone"])
+
+        report["total"] += len(chunk)
+        report["duplicates_in_file"] += in_chunk + int(repeated.sum())
+        report["already_in_campaign"] += int(already.sum())
+        report["to_send"] += int((~already).sum())
+        reasons.append(rejected["reason"].value_counts())
+        if sum(len(sample) for sample in samples) < REJECTED_SAMPLE_ROWS:
+            samples.append(rejected)
+        if on_progress:
+            on_progress(progress)
+
+    rejected_sample = pd.concat(samples).head(REJECTED_SAMPLE_ROWS) if samples else pd.DataFrame()
+    by_reason = pd.concat(reasons).groupby(level=0).sum() if reasons else pd.Series(dtype="int64")
+    report["invalid"] = int(by_reason.sum())
+    report["invalid_by_reason"] = by_reason.sort_values(ascending=False)
+    report["rejected_sample"] = rejected_sample
+    return report
+
+
+def ingest_file(conn, file, campaign_id: int, terms_version: str, valid_days: int,
+                on_progress=None) -> dict:
+    """Registra y encola el CSV trozo a trozo; devuelve los conteos acumulados.
+
+    Cada trozo se confirma por separado: si el proceso se corta, volver a subir el
+    archivo solo agrega lo que falta (ON CONFLICT en (phone, campaign_id)).
+    """
+    totals = {"total": 0, "inserted": 0, "duplicates": 0}
+    for chunk, progress in read_contact_chunks(file):
+        contacts, _, _ = prepare_contacts(chunk)
+        result = ingest_contacts(conn, contacts, campaign_id, terms_version, valid_days)
+        for key in totals:
+            totals[key] += result[key]
+        if on_progress:
+            on_progress(progress)
+    return totals
+
+
+def _copy_to_staging(conn, contacts: pd.DataFrame):
+    conn.execute(
+        text(
+            "CREATE TEMP TABLE staging_contacts (phone TEXT, name TEXT, language TEXT) "
+            "ON COMMIT DROP"
+        )
+    )
+    buffer = io.StringIO()
+    contacts[INGEST_COLUMNS].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    # COPY va por el cursor psycopg2 de la misma conexión/transacción
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert("COPY staging_contacts (phone, name, language) FROM STDIN WITH CSV", buffer)
+    finally:
+        cursor.close()
+
+
+def ingest_contacts(conn, contacts: pd.DataFrame, campaign_id: int, terms_version: str,
+                    valid_days: int) -> dict:
+    """Crea las solicitudes de la campaña y las encola; devuelve los conteos para la UI.
+
+    `contacts` es la salida de prepare_contacts (teléfonos ya normalizados). Los
+    trabajos se encolan sin plantilla: el despachador usa la guardada en la campaña.
+    """
+    result = {"total": len(contacts), "inserted": 0, "duplicates": 0}
+    if contacts.empty:
+        return result
+
+    try:
+        _copy_to_staging(conn, contacts)
+        inserted = conn.execute(
+            text(
+                """
+                WITH batch AS (
+                    SELECT NOW() + make_interval(days => :days) AS expires_at
+                ),
+                ins AS (
+                    INSERT INTO habeas_requests (
+                        phone, name, token, status, expires_at,
+                        terms_version, campaign_id, language
+                    )
+                    SELECT DISTINCT ON (s.phone)
+                        s.phone, LEFT(NULLIF(s.name, ''), 100), gen_random_uuid(), 'pending', b.expires_at,
+                        :terms_version, :campaign_id, LEFT(COALESCE(NULLIF(s.language, ''), 'es'), 10)
+                    FROM staging_contacts s
+                    CROSS JOIN batch b
+                    ORDER BY s.phone
+                    ON CONFLICT (phone, campaign_id) DO NOTHING
+                    RETURNING id
+                ),
+                queued AS (
+                    INSERT INTO send_queue (request_id, campaign_id)
+                    SELECT id, :campaign_id FROM ins
+                )
+                SELECT COUNT(*) FROM ins
+                """
+            ),
+            {
+                "days": int(valid_days),
+                "terms_version": terms_version,
+                "campaign_id": campaign_id,
+            },
+        ).scalar_one()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    result["inserted"] = inserted
+    result["duplicates"] = len(contacts) - inserted
+    return result
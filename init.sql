@@ -4,9 +4,20 @@ CREATE TABLE IF NOT EXISTS campaigns (
     id SERIAL PRIMARY KEY,
     name VARCHAR(150) NOT NULL,
     description TEXT,
+    default_language VARCHAR(10) NOT NULL DEFAULT 'es', -- Variante de plantilla si el idioma del contacto no tiene
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Plantillas de mensaje validadas de cada campaña, una por idioma
+CREATE TABLE IF NOT EXISTS campaign_templates (
+    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+    language VARCHAR(10) NOT NULL,
+    body TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (campaign_id, language)
+);
+
 CREATE TABLE IF NOT EXISTS legal_terms (
     id SERIAL PRIMARY KEY,
     version VARCHAR(50) NOT NULL UNIQUE,
@@ -33,14 +44,274 @@ CREATE TABLE IF NOT EXISTS habeas_requests (
     UNIQUE(phone, campaign_id)
 );
 
+-- migrations/0011_send_logs_partitioned.sql la convierte en particionada por mes (con
+-- message_id y response JSONB). Se crea aquí con la forma original porque 0005 le construye
+-- un índice CONCURRENTLY, que Postgres no admite sobre tablas particionadas.
 CREATE TABLE IF NOT EXISTS send_logs (
     id SERIAL PRIMARY KEY,
     request_id INTEGER REFERENCES habeas_requests(id),
     response_status INTEGER,
     response_body TEXT,
+    instance_name VARCHAR(100), -- Instancia de Evolution API que hizo el envío
+    idempotency_key UUID, -- Clave del trabajo de send_queue que originó el envío
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Índices para los filtros del panel y los reintentos (ver migrations/0005_query_indexes.sql)
+CREATE INDEX IF NOT EXISTS habeas_requests_pending_sent_at_idx
+    ON habeas_requests (sent_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS habeas_requests_status_sent_at_idx
+    ON habeas_requests (status, sent_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS habeas_requests_sent_at_id_idx
+    ON habeas_requests (sent_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS habeas_requests_campaign_status_idx
+    ON habeas_requests (campaign_id, status);
+CREATE INDEX IF NOT EXISTS send_logs_request_created_idx
+    ON send_logs (request_id, created_at);
+
+-- Cola persistente de envíos: el panel encola y dispatcher.py la drena
+-- reclamando lotes con FOR UPDATE SKIP LOCKED (admite varios workers en paralelo)
+CREATE TYPE queue_status AS ENUM ('queued', 'sending', 'sent', 'failed');
+CREATE TYPE send_kind AS ENUM ('initial', 'reminder');
+
+CREATE TABLE IF NOT EXISTS send_queue (
+    id BIGSERIAL PRIMARY KEY,
+    request_id INTEGER NOT NULL REFERENCES habeas_requests(id),
+    campaign_id INTEGER REFERENCES campaigns(id),
+    message_template TEXT, -- NULL: plantilla de la campaña según el idioma de la solicitud
+    status queue_status NOT NULL DEFAULT 'queued',
+    kind send_kind NOT NULL DEFAULT 'initial', -- Envío original o recordatorio automático
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP NOT NULL DEFAULT NOW(), -- No se reclama antes (backoff de reintentos)
+    worker_id VARCHAR(100), -- Worker que reclamó el envío
+    instance_name VARCHAR(100), -- Instancia de Evolution API que lo envió
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    idempotency_key UUID NOT NULL DEFAULT gen_random_uuid(), -- Se renueva solo al reanudar un envío interrumpido
+    message_id VARCHAR(100), -- key.id del mensaje enviado (cruce con message_receipts)
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS send_queue_ready_idx ON send_queue (available_at, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS send_queue_campaign_status_idx ON send_queue (campaign_id, status);
+CREATE UNIQUE INDEX IF NOT EXISTS send_queue_idempotency_key_idx ON send_queue (idempotency_key);
+CREATE INDEX IF NOT EXISTS send_queue_request_idx ON send_queue (request_id);
+CREATE INDEX IF NOT EXISTS send_queue_sending_locked_idx ON send_queue (locked_at) WHERE status = 'sending';
+CREATE INDEX IF NOT EXISTS send_queue_message_id_idx ON send_queue (message_id) WHERE message_id IS NOT NULL;
+
+-- Confirmaciones de entrega/lectura del webhook de Evolution API (messages.update), por
+-- message_id; se cruzan con send_queue al consultar (ver migrations/0013_message_receipts.sql)
+CREATE TABLE IF NOT EXISTS message_receipts (
+    message_id VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL, -- SERVER_ACK, DELIVERY_ACK, READ, PLAYED, ERROR
+    remote_jid VARCHAR(100),
+    instance_name VARCHAR(100),
+    event_at TIMESTAMP,
+    received_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (message_id, status) -- Un evento repetido (reintento del webhook) no duplica
+);
+
+-- Telemetría de envío agregada por campaña y minuto (ver send_queue.complete_jobs)
+CREATE TABLE IF NOT EXISTS send_stats_minute (
+    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+    minute TIMESTAMP NOT NULL,
+    status_code INTEGER NOT NULL, -- 0: sin respuesta HTTP (timeout, error de conexión)
+    messages INTEGER NOT NULL DEFAULT 0,
+    http_ms_sum BIGINT NOT NULL DEFAULT 0,
+    wait_ms_sum BIGINT NOT NULL DEFAULT 0,
+    db_ms_sum BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (campaign_id, minute, status_code)
+);
+
+-- Histograma de latencia HTTP a Evolution API (bucket_ms = límite superior del bucket)
+CREATE TABLE IF NOT EXISTS send_latency_minute (
+    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+    minute TIMESTAMP NOT NULL,
+    bucket_ms INTEGER NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (campaign_id, minute, bucket_ms)
+);
+
+-- Resumen por campaña mantenido por triggers (ver migrations/0012_campaign_stats.sql).
+-- El trigger de send_logs lo crea esa migración, después de que 0011 la particione.
+CREATE TABLE IF NOT EXISTS campaign_stats (
+    campaign_id INTEGER NOT NULL,
+    shard SMALLINT NOT NULL,
+    pending BIGINT NOT NULL DEFAULT 0,
+    accepted BIGINT NOT NULL DEFAULT 0,
+    rejected BIGINT NOT NULL DEFAULT 0,
+    failed BIGINT NOT NULL DEFAULT 0,
+    sends_ok BIGINT NOT NULL DEFAULT 0, -- Intentos con respuesta 201
+    sends_failed BIGINT NOT NULL DEFAULT 0,
+    first_activity_at TIMESTAMP,
+    last_activity_at TIMESTAMP,
+    PRIMARY KEY (campaign_id, shard)
+);
+
+CREATE OR REPLACE FUNCTION campaign_stats_shard(request_id BIGINT)
+RETURNS SMALLINT AS $$
+    SELECT (request_id % 8)::smallint
+$$ language 'sql' IMMUTABLE;
+
+-- Suma deltas (+1 estado nuevo, -1 estado anterior) de solicitudes; las filas se
+-- bloquean en orden de (campaign_id, shard) para no provocar deadlocks entre lotes
+CREATE OR REPLACE FUNCTION campaign_stats_apply(campaign_ids INTEGER[], request_ids BIGINT[],
+                                                statuses request_status[], deltas INTEGER[])
+RETURNS VOID AS $$
+    INSERT INTO campaign_stats AS s (
+        campaign_id, shard, pending, accepted, rejected, failed, first_activity_at, last_activity_at
+    )
+    SELECT campaign_id, shard, pending, accepted, rejected, failed, NOW(), NOW()
+    FROM (
+        SELECT COALESCE(d.campaign_id, 0) AS campaign_id, campaign_stats_shard(d.request_id) AS shard,
+               COALESCE(SUM(d.delta) FILTER (WHERE d.status = 'pending'), 0) AS pending,
+               COALESCE(SUM(d.delta) FILTER (WHERE d.status = 'accepted'), 0) AS accepted,
+               COALESCE(SUM(d.delta) FILTER (WHERE d.status = 'rejected'), 0) AS rejected,
+               COALESCE(SUM(d.delta) FILTER (WHERE d.status = 'failed'), 0) AS failed
+        FROM unnest(campaign_ids, request_ids, statuses, deltas) AS d(campaign_id, request_id, status, delta)
+        GROUP BY 1, 2
+    ) AS agg
+    -- Un UPDATE que no cambió estado ni campaña se anula solo
+    WHERE pending <> 0 OR accepted <> 0 OR rejected <> 0 OR failed <> 0
+    ORDER BY campaign_id, shard
+    ON CONFLICT (campaign_id, shard) DO UPDATE
+    SET pending = s.pending + EXCLUDED.pending,
+        accepted = s.accepted + EXCLUDED.accepted,
+        rejected = s.rejected + EXCLUDED.rejected,
+        failed = s.failed + EXCLUDED.failed,
+        first_activity_at = COALESCE(s.first_activity_at, EXCLUDED.first_activity_at),
+        last_activity_at = EXCLUDED.last_activity_at
+$$ language 'sql';
+
+CREATE OR REPLACE FUNCTION campaign_stats_requests_inserted()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM campaign_stats_apply(array_agg(campaign_id), array_agg(id::bigint), array_agg(status), array_agg(1))
+    FROM new_rows;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION campaign_stats_requests_updated()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM campaign_stats_apply(array_agg(campaign_id), array_agg(id), array_agg(status), array_agg(delta))
+    FROM (
+        SELECT campaign_id, id::bigint AS id, status, 1 AS delta FROM new_rows
+        UNION ALL
+        SELECT campaign_id, id::bigint, status, -1 FROM old_rows
+    ) AS d;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION campaign_stats_requests_deleted()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM campaign_stats_apply(array_agg(campaign_id), array_agg(id::bigint), array_agg(status), array_agg(-1))
+    FROM old_rows;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION campaign_stats_sends_inserted()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO campaign_stats AS s (
+        campaign_id, shard, sends_ok, sends_failed, first_activity_at, last_activity_at
+    )
+    SELECT COALESCE(h.campaign_id, 0), campaign_stats_shard(n.request_id) + 8,
+           COUNT(*) FILTER (WHERE n.response_status = 201),
+           COUNT(*) FILTER (WHERE n.response_status IS DISTINCT FROM 201),
+           MIN(n.created_at), MAX(n.created_at)
+    FROM new_rows n
+    JOIN habeas_requests h ON h.id = n.request_id
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (campaign_id, shard) DO UPDATE
+    SET sends_ok = s.sends_ok + EXCLUDED.sends_ok,
+        sends_failed = s.sends_failed + EXCLUDED.sends_failed,
+        first_activity_at = LEAST(s.first_activity_at, EXCLUDED.first_activity_at),
+        last_activity_at = GREATEST(s.last_activity_at, EXCLUDED.last_activity_at);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Recalcula todo desde las tablas base (python campaign_stats.py --rebuild). Bloquea
+-- las escrituras en habeas_requests y send_logs mientras corre para no perder deltas.
+CREATE OR REPLACE FUNCTION rebuild_campaign_stats()
+RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    LOCK TABLE habeas_requests, send_logs IN SHARE MODE;
+    LOCK TABLE campaign_stats IN EXCLUSIVE MODE;
+    DELETE FROM campaign_stats;
+    INSERT INTO campaign_stats (
+        campaign_id, shard, pending, accepted, rejected, failed, sends_ok, sends_failed,
+        first_activity_at, last_activity_at
+    )
+    SELECT campaign_id, shard, SUM(pending), SUM(accepted), SUM(rejected), SUM(failed),
+           SUM(sends_ok), SUM(sends_failed), MIN(first_at), MAX(last_at)
+    FROM (
+        SELECT COALESCE(campaign_id, 0) AS campaign_id, campaign_stats_shard(id) AS shard,
+               COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+               COUNT(*) FILTER (WHERE status = 'accepted') AS accepted,
+               COUNT(*) FILTER (WHERE status = 'rejected') AS rejected,
+               COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+               0 AS sends_ok, 0 AS sends_failed,
+               MIN(sent_at) AS first_at, MAX(updated_at) AS last_at
+        FROM habeas_requests
+        GROUP BY 1, 2
+        UNION ALL
+        SELECT COALESCE(h.campaign_id, 0), campaign_stats_shard(s.request_id) + 8, 0, 0, 0, 0,
+               COUNT(*) FILTER (WHERE s.response_status = 201),
+               COUNT(*) FILTER (WHERE s.response_status IS DISTINCT FROM 201),
+               MIN(s.created_at), MAX(s.created_at)
+        FROM send_logs s
+        JOIN habeas_requests h ON h.id = s.request_id
+        GROUP BY 1, 2
+    ) AS parts
+    GROUP BY campaign_id, shard;
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER campaign_stats_requests_insert
+    AFTER INSERT ON habeas_requests
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION campaign_stats_requests_inserted();
+
+CREATE OR REPLACE TRIGGER campaign_stats_requests_update
+    AFTER UPDATE ON habeas_requests
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION campaign_stats_requests_updated();
+
+CREATE OR REPLACE TRIGGER campaign_stats_requests_delete
+    AFTER DELETE ON habeas_requests
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION campaign_stats_requests_deleted();
+
+-- Historial de connectionState de las instancias (cambios de estado y latencia)
+CREATE TABLE IF NOT EXISTS instance_status_log (
+    id BIGSERIAL PRIMARY KEY,
+    instance_name VARCHAR(100) NOT NULL,
+    state VARCHAR(30) NOT NULL,
+    previous_state VARCHAR(30), -- Distinto de state cuando la instancia cambió
+    latency_ms INTEGER,
+    checked_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS instance_status_log_instance_checked_idx
+    ON instance_status_log (instance_name, checked_at);
+CREATE INDEX IF NOT EXISTS instance_status_log_changes_idx
+    ON instance_status_log (checked_at) WHERE previous_state IS NOT NULL;
+
 -- Insertar términos legales por defecto para pruebas
 INSERT INTO legal_terms (version, content) 
 VALUES ('v1.0-test', 'Términos y condiciones de prueba para Habeas Data.')
@@ -59,4 +330,23 @@ $$ language 'plpgsql';
 CREATE OR REPLACE TRIGGER update_habeas_requests_modtime
     BEFORE UPDATE ON habeas_requests
     FOR EACH ROW
-    EXECUTE FUNCTION update_updated_at_column();
\ No newline at end of file
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE OR REPLACE TRIGGER update_send_queue_modtime
+    BEFORE UPDATE ON send_queue
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Avisar a la landing (LISTEN legal_terms_changed) para invalidar su caché de términos
+CREATE OR REPLACE FUNCTION notify_legal_terms_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('legal_terms_changed', COALESCE(NEW.version, OLD.version));
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER legal_terms_changed
+    AFTER INSERT OR UPDATE OR DELETE ON legal_terms
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_legal_terms_changed();
@@ -0,0 +1,104 @@
+import itertools
+import threading
+import time
+
+from config import INSTANCE_CHECK_TTL, INSTANCE_HEALTH_INTERVAL, INSTANCES, SEND_BURST, SEND_RATE_PER_MINUTE
+from evolution import check_evolution_status
+from sender import TokenBucket
+
+
+class InstancePool:
+    """Pool de instancias de Evolution API con cupo y estado de salud propios.
+
+    El estado se toma de connectionState; solo las instancias en "open" reciben
+    envíos. Los trabajos de la cola no se asignan a una instancia hasta el momento
+    de enviarlos, así que si una instancia cae el resto de la campaña fluye sola
+    hacia las sanas.
+    """
+
+    def __init__(self, names=INSTANCES, rate_per_minute: float = SEND_RATE_PER_MINUTE,
+                 burst: int = SEND_BURST, health_interval: float = INSTANCE_HEALTH_INTERVAL):
+        if not names:
+            raise ValueError("No hay instancias configuradas (WA_INSTANCE_NAMES / WA_INSTANCE_NAME).")
+        self.names = list(names)
+        self.buckets = {name: TokenBucket(rate_per_minute / 60.0, burst) for name in self.names}
+        self.states = {name: "unknown" for name in self.names}
+        self.checked_at = {name: float("-inf") for name in self.names}
+        self.health_interval = health_interval
+        self.lock = threading.Lock()
+        self._rotation = itertools.cycle(self.names)
+        self._stop = threading.Event()
+        self._monitor = None
+
+    def refresh(self):
+        """Consulta connectionState de todas las instancias"""
+        for name in self.names:
+            state = check_evolution_status(name)
+            with self.lock:
+                if state != self.states[name]:
+                    print(f"📱 Instancia {name}: {self.states[name]} -> {state}")
+                self.states[name] = state
+                self.checked_at[name] = time.monotonic()
+
+    def start(self):
+        """Refresca el estado en segundo plano cada `health_interval` segundos"""
+        self.refresh()
+
+        def loop():
+            while not self._stop.wait(self.health_interval):
+                self.refresh()
+
+        self._monitor = threading.Thread(target=loop, name="instance-health", daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def healthy(self):
+        with self.lock:
+            return [name for name in self.names if self.states[name] == "open"]
+
+    def mark_down(self, name: str, state: str = "error"):
+        """Saca una instancia de rotación hasta el próximo refresco que la vea abierta"""
+        with self.lock:
+            self.states[name] = state
+
+    def defer(self, name: str, seconds: float):
+        """Pausa los envíos por una instancia (límite de tasa de la API)"""
+        self.buckets[name].defer(seconds)
+
+    def check(self, name: str, max_age: float = INSTANCE_CHECK_TTL) -> bool:
+        """Si la instancia sigue conectada; solo consulta connectionState si el último
+        estado conocido tiene más de `max_age` segundos (un lote con muchos números
+        inválidos no duplica las llamadas a la API)"""
+        with self.lock:
+            if time.monotonic() - self.checked_at[name] < max_age:
+                return self.states[name] == "open"
+        state = check_evolution_status(name)
+        with self.lock:
+            self.states[name] = state
+            self.checked_at[name] = time.monotonic()
+        return state == "open"
+
+    def acquire(self, should_stop=lambda: False):
+        """Reserva un envío en la siguiente instancia sana con cupo disponible.
+
+        Reparte en rueda entre las instancias conectadas; si todas agotaron su cupo
+        espera lo mínimo necesario. Devuelve None si no hay instancias sanas o se pidió parar.
+        """
+        while not should_stop():
+            healthy = self.healthy()
+            if not healthy:
+                return None
+            waits = []
+            for _ in range(len(self.names)):
+                with self.lock:
+                    name = next(self._rotation)
+                if name not in healthy:
+                    continue
+                wait = self.buckets[name].try_acquire()
+                if wait == 0:
+                    return name
+                waits.append(wait)
+            time.sleep(min(waits) if waits else self.health_interval)
+        return None
@@ -0,0 +1,68 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+# Métricas de la landing de consentimiento expuestas en /metrics (formato Prometheus).
+# Contadores e histogramas cuestan un lock y una suma por observación; los gauges
+# del pool se leen solo cuando Prometheus hace scrape.
+
+CONSENT_REQUESTS = Counter(
+    "habeas_consent_requests_total",
+    "Solicitudes a /auth/{token} por método y resultado",
+    ["method", "outcome"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "habeas_db_query_seconds",
+    "Duración de las consultas de la landing",
+    ["query"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+# Peticiones que el filtro de token_guard.py resolvió en memoria (consultas ahorradas)
+DB_LOOKUPS_SAVED = Counter(
+    "habeas_db_lookups_saved_total",
+    "Peticiones a /auth/{token} respondidas sin consultar la DB, por motivo",
+    ["reason"],
+)
+WEBHOOK_RECEIPTS = Counter(
+    "habeas_webhook_receipts_total",
+    "Confirmaciones de entrega recibidas por webhook, por resultado (buffered, ignored, rejected)",
+    ["outcome"],
+)
+TEMPLATE_RENDER_SECONDS = Histogram(
+    "habeas_template_render_seconds",
+    "Duración de TemplateResponse (render de Jinja2) por plantilla",
+    ["template"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+
+@contextmanager
+def observe(histogram: Histogram, label: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(label).observe(time.perf_counter() - started)
+
+
+class PoolCollector:
+    """Ocupación del pool de conexiones del engine, leída en cada scrape"""
+
+    def __init__(self, engine):
+        self.pool = engine.sync_engine.pool
+
+    def collect(self):
+        gauges = {
+            "habeas_db_pool_size": ("Conexiones permanentes del pool", self.pool.size()),
+            "habeas_db_pool_checked_out": ("Conexiones prestadas en este momento", self.pool.checkedout()),
+            "habeas_db_pool_checked_in": ("Conexiones libres en el pool", self.pool.checkedin()),
+            "habeas_db_pool_overflow": ("Conexiones por encima de pool_size (negativo: huecos libres)", self.pool.overflow()),
+        }
+        for name, (documentation, value) in gauges.items():
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+
+def register_pool(engine):
+    REGISTRY.register(PoolCollector(engine))
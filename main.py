@@ -1,44 +1,271 @@
+import asyncio
+import hmac
+import ipaddress
+import math
 import os
-from datetime import datetime
 
 from fastapi import FastAPI, Form, Request
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import create_engine, text
+from markupsafe import Markup
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from landing_metrics import (
+    CONSENT_REQUESTS,
+    DB_LOOKUPS_SAVED,
+    DB_QUERY_SECONDS,
+    TEMPLATE_RENDER_SECONDS,
+    WEBHOOK_RECEIPTS,
+    observe,
+    register_pool,
+)
+from receipts import ReceiptBuffer, parse_receipts
+from static_assets import AssetFiles, PageGZipMiddleware, load_manifest
+from terms_cache import TermsCache, listen_for_changes
+from token_guard import NegativeCache, RateLimiter, parse_token
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 
+# Estáticos con nombre por contenido (ver static_assets.py); las páginas van comprimidas al vuelo
+STATIC_DIR = "static"
+static_manifest = load_manifest(STATIC_DIR)
+templates.env.globals["asset_url"] = lambda name: (
+    f"/static/{static_manifest[name]['path']}" if name in static_manifest else f"/static/{name}"
+)
+app.add_middleware(PageGZipMiddleware, minimum_size=1000)
+
 DB_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DB_URL)
+# Pool explícito: la landing recibe picos de miles de clics cuando sale una campaña
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
+
+def async_db_url(url: str) -> str:
+    """Convierte postgresql:// (o postgres://) al driver asyncpg"""
+    scheme, _, rest = url.partition("://")
+    return f"postgresql+asyncpg://{rest}" if scheme in ("postgres", "postgresql", "postgresql+psycopg2") else url
+
+
+def plain_db_url(url: str) -> str:
+    """DSN sin el driver de SQLAlchemy (postgresql+psycopg2:// → postgresql://), para asyncpg.connect"""
+    scheme, _, rest = url.partition("://")
+    return f"{scheme.split('+', 1)[0]}://{rest}"
+
+
+engine = create_async_engine(
+    async_db_url(DB_URL),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+)
+register_pool(engine)
+
+# Caché del texto legal por versión (idéntico para todos los destinatarios de una campaña)
+terms_cache = TermsCache(
+    maxsize=int(os.getenv("TERMS_CACHE_SIZE", "32")),
+    ttl=float(os.getenv("TERMS_CACHE_TTL", "300")),
+)
+
+# Filtro previo a la DB: tokens inválidos/expirados recientes y cupo de peticiones por IP
+negative_cache = NegativeCache(
+    maxsize=int(os.getenv("NEGATIVE_CACHE_SIZE", "100000")),
+    ttl=float(os.getenv("NEGATIVE_CACHE_TTL", "600")),
+)
+# Cupo por IP desactivado por defecto (0): detrás de ngrok o del proxy de Fly todas las
+# visitas llegan con la IP del proxy salvo que se configure LANDING_CLIENT_IP_HEADER
+LANDING_RATE_PER_MINUTE = float(os.getenv("LANDING_RATE_PER_MINUTE", "0"))
+rate_limiter = RateLimiter(
+    rate_per_minute=LANDING_RATE_PER_MINUTE,
+    burst=int(os.getenv("LANDING_RATE_BURST", "20")),
+) if LANDING_RATE_PER_MINUTE > 0 else None
+# Cabecera con la IP real del visitante que agrega el proxy de confianza (ej. Fly-Client-IP,
+# X-Forwarded-For); sin ella se usa la IP de la conexión
+CLIENT_IP_HEADER = os.getenv("LANDING_CLIENT_IP_HEADER", "")
+if rate_limiter and not CLIENT_IP_HEADER:
+    print("LANDING_RATE_PER_MINUTE activo sin LANDING_CLIENT_IP_HEADER: detrás de un proxy todas las visitas comparten cupo")
+
+# Webhook de Evolution API: confirmaciones de entrega acumuladas y guardadas en lote
+# Sin WEBHOOK_SECRET el webhook queda desactivado: cualquiera podría inventar confirmaciones
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+if not WEBHOOK_SECRET:
+    print("WEBHOOK_SECRET no está configurado: /webhooks/evolution responde 404")
+receipt_buffer = ReceiptBuffer(
+    max_rows=int(os.getenv("WEBHOOK_FLUSH_ROWS", "500")),
+    max_age=float(os.getenv("WEBHOOK_FLUSH_SECONDS", "1")),
+    max_pending=int(os.getenv("WEBHOOK_BUFFER_MAX", "100000")),
+)
+
+# (código HTTP, título, mensaje) de las páginas de token inválido o expirado
+TOKEN_ERRORS = {
+    ("GET", "invalid"): (404, "Token inválido", "El enlace proporcionado no es válido."),
+    ("POST", "invalid"): (404, "Token inválido o ya procesado", "El enlace proporcionado no es válido o tu respuesta ya fue registrada."),
+    ("GET", "expired"): (410, "Enlace expirado", "El enlace de autorización ha expirado. Solicita un nuevo enlace para continuar."),
+    ("POST", "expired"): (410, "Enlace expirado", "El tiempo límite para responder ha finalizado."),
+}
+
+
+async def get_terms(conn, terms_version):
+    """Devuelve (contenido, fragmento HTML) de la versión de términos, usando la caché"""
+    if not terms_version:
+        return None, None
+    cached = terms_cache.get(terms_version)
+    if cached:
+        return cached
+    with observe(DB_QUERY_SECONDS, "terms_lookup"):
+        content = (await conn.execute(
+            text("SELECT content FROM legal_terms WHERE version = :version"),
+            {"version": terms_version},
+        )).scalar()
+    if content is None:
+        return None, None
+    fragment = Markup(
+        templates.get_template("legal_terms.html").render(version=terms_version, legal_content=content)
+    )
+    terms_cache.put(terms_version, content, fragment)
+    return content, fragment
+
+
+def render(method: str, outcome: str, name: str, context: dict, status_code: int = 200):
+    """TemplateResponse con su tiempo de render y el resultado contado en /metrics"""
+    CONSENT_REQUESTS.labels(method, outcome).inc()
+    with observe(TEMPLATE_RENDER_SECONDS, name):
+        return templates.TemplateResponse(name, context, status_code=status_code)
+
+
+def token_error(method: str, outcome: str, request: Request, token: str | None = None):
+    """Página de token inválido/expirado; con `token` se recuerda en la caché negativa"""
+    if token is not None:
+        negative_cache.put(token, outcome)
+    status_code, title, message = TOKEN_ERRORS[(method, outcome)]
+    return render(method, outcome, "message.html", {"request": request, "title": title, "message": message}, status_code)
+
+
+def visitor_ip(request: Request) -> str | None:
+    """IP del visitante según CLIENT_IP_HEADER o, si no viene o no es una IP, la de la conexión"""
+    if CLIENT_IP_HEADER:
+        forwarded = request.headers.get(CLIENT_IP_HEADER)
+        if forwarded:
+            # En X-Forwarded-For el último valor es el que agregó nuestro proxy; los anteriores los manda el cliente
+            candidate = forwarded.rsplit(",", 1)[-1].strip()
+            try:
+                return str(ipaddress.ip_address(candidate))
+            except ValueError:
+                pass
+    return request.client.host if request.client else None
+
+
+def frontline(method: str, request: Request, token: str):
+    """(token canónico, None) si hay que consultar la DB; (None, respuesta) si se resuelve en memoria"""
+    retry_after = rate_limiter.allow(visitor_ip(request)) if rate_limiter else None
+    if retry_after is not None:
+        DB_LOOKUPS_SAVED.labels("rate_limited").inc()
+        response = render(
+            method, "rate_limited", "message.html",
+            {"request": request, "title": "Demasiadas solicitudes", "message": "Espera un momento e inténtalo de nuevo."},
+            status_code=429,
+        )
+        response.headers["Retry-After"] = str(math.ceil(retry_after))
+        return None, response
+    canonical = parse_token(token)
+    if canonical is None:
+        DB_LOOKUPS_SAVED.labels("malformed").inc()
+        return None, token_error(method, "invalid", request)
+    cached = negative_cache.get(canonical)
+    if cached is not None:
+        DB_LOOKUPS_SAVED.labels("negative_cache").inc()
+        return None, token_error(method, cached, request)
+    return canonical, None
+
+
+def closed_request_page(request: Request, token: str, result):
+    """Página del POST cuando la solicitud ya no admite respuesta: la decisión registrada
+    o, si sigue sin responder, enlace expirado (410)"""
+    if result.status == "accepted":
+        return render("POST", "already_accepted", "already_accepted.html", {
+            "request": request,
+            "name": result.name,
+            "accepted_at": result.accepted_at,
+            "token": token,
+            "allow_revoke": True,
+        })
+    if result.status == "rejected":
+        return render("POST", "already_rejected", "already_rejected.html", {"request": request, "name": result.name})
+    return token_error("POST", "expired", request, token)
+
+
+@app.on_event("startup")
+async def start_terms_listener():
+    app.state.terms_listener = asyncio.create_task(listen_for_changes(plain_db_url(DB_URL), terms_cache))
+
+
+@app.on_event("startup")
+async def start_receipt_writer():
+    app.state.receipt_writer = asyncio.create_task(receipt_buffer.run(
+        engine, lambda rows, seconds: DB_QUERY_SECONDS.labels("receipts_insert").observe(seconds)
+    ))
+
+
+@app.post("/webhooks/evolution")
+@app.post("/webhooks/evolution/{event}")  # Con WEBHOOK_BY_EVENTS Evolution agrega el evento a la URL
+async def evolution_webhook(request: Request, secret: str = "", event: str = ""):
+    """Recibe messages.update y responde sin esperar a la DB"""
+    if not WEBHOOK_SECRET:
+        return JSONResponse({"detail": "webhook disabled"}, status_code=404)
+    if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+        return JSONResponse({"detail": "forbidden"}, status_code=403)
+    try:
+        payload = await request.json()
+    except ValueError:
+        return JSONResponse({"detail": "invalid json"}, status_code=400)
+    receipts = parse_receipts(payload)
+    if not receipts:
+        WEBHOOK_RECEIPTS.labels("ignored").inc()
+        return {"received": 0}
+    if not receipt_buffer.add(receipts):
+        WEBHOOK_RECEIPTS.labels("rejected").inc(len(receipts))
+        return JSONResponse({"detail": "buffer full"}, status_code=503)
+    WEBHOOK_RECEIPTS.labels("buffered").inc(len(receipts))
+    return {"received": len(receipts)}
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 
 # Montar archivos estáticos (asegúrate de crear la carpeta 'static' y poner ahí tu PDF)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", AssetFiles(directory=STATIC_DIR, manifest=static_manifest), name="static")
 
 
 @app.get("/auth/{token}", response_class=HTMLResponse)
 async def show_consent(token: str, request: Request):
-    client_ip = request.client.host
+    token, rejected = frontline("GET", request, token)
+    if rejected:
+        return rejected
+    client_ip = visitor_ip(request)
     user_agent = request.headers.get("user-agent")
 
-    with engine.connect() as conn:
-        result = conn.execute(
-            text(
-                "SELECT h.id, h.name, h.status, h.accepted_at, h.ip_address, h.terms_version, h.expires_at, l.content "
-                "FROM habeas_requests h "
-                "LEFT JOIN legal_terms l ON h.terms_version = l.version "
-                "WHERE h.token = :token"
-            ),
-            {"token": token},
-        ).fetchone()
+    async with engine.connect() as conn:
+        with observe(DB_QUERY_SECONDS, "token_lookup"):
+            result = (await conn.execute(
+                text(
+                    "SELECT h.id, h.name, h.status, h.accepted_at, h.ip_address, h.terms_version, "
+                    "h.expires_at <= NOW() AS expired "
+                    "FROM habeas_requests h "
+                    "WHERE h.token = :token"
+                ),
+                {"token": token},
+            )).fetchone()
 
         if not result:
-            return templates.TemplateResponse(
-                "message.html",
-                {"request": request, "title": "Token inválido", "message": "El enlace proporcionado no es válido."},
-                status_code=404,
-            )
+            return token_error("GET", "invalid", request, token)
 
         (
             request_id,
@@ -47,22 +274,18 @@ async def show_consent(token: str, request: Request):
             accepted_at,
             ip_address,
             terms_version,
-            expires_at,
-            terms_content,
+            expired,
         ) = result
 
-        # Verificar expiración
-        if expires_at and datetime.now() > expires_at:
-            return templates.TemplateResponse(
-                "message.html",
-                {"request": request, "title": "Enlace expirado", "message": "El enlace de autorización ha expirado. Solicita un nuevo enlace para continuar."},
-                status_code=410,
-            )
+        # Verificar expiración (con el reloj de la DB, el mismo que usa el POST). Solo se
+        # recuerda si aún no respondió: el POST muestra la respuesta registrada
+        if expired:
+            return token_error("GET", "expired", request, token if status in ("pending", "failed") else None)
 
         # Vistas según estado actual
         if status == "accepted":
             # MEJORA: Permitir revocación. Pasamos un flag 'allow_revoke' para que la plantilla pueda mostrar un botón de "Revocar"
-            return templates.TemplateResponse("already_accepted.html", {
+            return render("GET", "already_accepted", "already_accepted.html", {
                 "request": request, 
                 "name": name, 
                 "accepted_at": accepted_at, 
@@ -71,92 +294,123 @@ async def show_consent(token: str, request: Request):
             })
 
         if status == "rejected":
-            return templates.TemplateResponse("already_rejected.html", {"request": request, "name": name})
+            return render("GET", "already_rejected", "already_rejected.html", {"request": request, "name": name})
 
         # Estado pending/failed: mostrar formulario de consentimiento
-        return templates.TemplateResponse("consent_form.html", {
+        terms_content, legal_fragment = await get_terms(conn, terms_version)
+        return render("GET", "form", "consent_form.html", {
             "request": request, 
             "name": name, 
             "token": token, 
             "client_ip": client_ip, 
             "user_agent": user_agent,
-            "legal_content": terms_content  # Pasamos el contenido legal a la plantilla
+            "legal_content": terms_content,  # Pasamos el contenido legal a la plantilla
+            "legal_fragment": legal_fragment,
         })
 
 
 @app.post("/auth/{token}", response_class=HTMLResponse)
 async def handle_consent(token: str, request: Request, decision: str = Form(...), terms_accepted: bool = Form(False)):
-    client_ip = request.client.host
+    token, rejected = frontline("POST", request, token)
+    if rejected:
+        return rejected
+    client_ip = visitor_ip(request)
     user_agent = request.headers.get("user-agent")
 
-    with engine.connect() as conn:
-        result = conn.execute(
-            text("SELECT h.id, h.name, h.status, h.expires_at, l.content FROM habeas_requests h LEFT JOIN legal_terms l ON h.terms_version = l.version WHERE h.token = :token"),
-            {"token": token},
-        ).fetchone()
-
-        if not result:
-            return templates.TemplateResponse(
-                "message.html",
-                {"request": request, "title": "Token inválido o ya procesado", "message": "El enlace proporcionado no es válido o tu respuesta ya fue registrada."},
-                status_code=404,
-            )
-
-        request_id, name, current_status, expires_at, terms_content = result
-
-        # MEJORA: Verificar expiración también al recibir el POST (Seguridad)
-        if expires_at and datetime.now() > expires_at:
-            return templates.TemplateResponse(
-                "message.html",
-                {"request": request, "title": "Enlace expirado", "message": "El tiempo límite para responder ha finalizado."},
-                status_code=410,
-            )
-
-        # VALIDACIÓN: Checkbox obligatorio solo para ACEPTAR
+    async with engine.connect() as conn:
+        # VALIDACIÓN: Checkbox obligatorio solo para ACEPTAR (se vuelve a mostrar el formulario)
         if decision == "accept" and not terms_accepted:
-            return templates.TemplateResponse("consent_form.html", {
+            with observe(DB_QUERY_SECONDS, "token_lookup"):
+                result = (await conn.execute(
+                    text(
+                        "SELECT name, status, accepted_at, terms_version, expires_at <= NOW() AS expired "
+                        "FROM habeas_requests WHERE token = :token"
+                    ),
+                    {"token": token},
+                )).fetchone()
+            if not result:
+                return token_error("POST", "invalid", request, token)
+            # Ya respondida o vencida: la misma página que el UPDATE condicional
+            if result.status in ("accepted", "rejected") or result.expired:
+                return closed_request_page(request, token, result)
+            terms_content, legal_fragment = await get_terms(conn, result.terms_version)
+            return render("POST", "missing_checkbox", "consent_form.html", {
                 "request": request, 
-                "name": name, 
+                "name": result.name, 
                 "token": token, 
                 "client_ip": client_ip, 
                 "user_agent": user_agent,
                 "legal_content": terms_content,
+                "legal_fragment": legal_fragment,
                 "error": "⚠️ Debes marcar la casilla para aceptar los términos."
             })
 
         new_status = "accepted" if decision == "accept" else "rejected"
 
         try:
-            conn.execute(
-                text(
-                    """
-                    UPDATE habeas_requests
-                    SET status = :status,
-                        accepted_at = :now,
-                        ip_address = :ip,
-                        user_agent = :ua,
-                        updated_at = NOW()
-                    WHERE id = :id
-                    """
-                ),
-                {
-                    "status": new_status,
-                    "now": datetime.now(),
-                    "ip": client_ip,
-                    "ua": user_agent,
-                    "id": request_id,
-                },
-            )
-            conn.commit()
+            # Transición atómica: solo desde pending/failed y con el enlace vigente según el reloj
+            # de la DB. Un doble clic o un segundo dispositivo no pisa la evidencia ya registrada.
+            with observe(DB_QUERY_SECONDS, "consent_update"):
+                updated = (await conn.execute(
+                    text(
+                        """
+                        UPDATE habeas_requests
+                        SET status = :status,
+                            accepted_at = NOW(),
+                            ip_address = :ip,
+                            user_agent = :ua,
+                            updated_at = NOW()
+                        WHERE token = :token
+                          AND status IN ('pending', 'failed')
+                          AND (expires_at IS NULL OR expires_at > NOW())
+                        RETURNING name
+                        """
+                    ),
+                    {
+                        "status": new_status,
+                        "ip": client_ip,
+                        "ua": user_agent,
+                        "token": token,
+                    },
+                )).fetchone()
+                await conn.commit()
 
-            if new_status == "accepted":
-                return templates.TemplateResponse("success.html", {"request": request, "name": name, "token": token})
-            else:
-                return templates.TemplateResponse("rejected.html", {"request": request})
+            if updated:
+                if new_status == "accepted":
+                    return render("POST", "accepted", "success.html", {"request": request, "name": updated.name, "token": token})
+                return render("POST", "rejected", "rejected.html", {"request": request})
+
+            # Camino lento (ninguna fila cambió): averiguar qué página mostrar
+            with observe(DB_QUERY_SECONDS, "token_lookup"):
+                result = (await conn.execute(
+                    text(
+                        "SELECT name, status, accepted_at, expires_at <= NOW() AS expired "
+                        "FROM habeas_requests WHERE token = :token"
+                    ),
+                    {"token": token},
+                )).fetchone()
+
+            if not result:
+                return token_error("POST", "invalid", request, token)
+            return closed_request_page(request, token, result)
 
         except Exception as e:
-            return templates.TemplateResponse(
-                "message.html",
+            return render(
+                "POST", "error", "message.html",
                 {"request": request, "title": "Error del Servidor", "message": "Ocurrió un error al procesar tu solicitud."},
                 status_code=500,
-            )
\ No newline at end of file
+            )
+
+
+@app.on_event("shutdown")
+async def dispose_engine():
+    app.state.terms_listener.cancel()
+    app.state.receipt_writer.cancel()
+    # Lo que quedó en memoria se guarda antes de cerrar el pool
+    while receipt_buffer.pending:
+        try:
+            await receipt_buffer.flush(engine)
+        except Exception as e:
+            print(f"Confirmaciones de entrega sin guardar al cerrar: {len(receipt_buffer.pending)} ({e})")
+            break
+    await engine.dispose()
@@ -0,0 +1,126 @@
+from functools import lru_cache
+from string import Formatter
+
+from sqlalchemy import text
+
+
+# --- Plantillas de mensaje de campaña ---
+# Se validan una vez al crear la campaña y se guardan en campaign_templates (una
+# variante por idioma). El despachador las compila una vez por texto y arma los
+# mensajes de cada lote sin volver a interpretar la plantilla.
+
+ALLOWED_FIELDS = {"name", "auth_link"}
+REQUIRED_FIELDS = {"auth_link"}
+DEFAULT_LANGUAGE = "es"
+
+
+class TemplateError(ValueError):
+    """Plantilla con variables desconocidas, llaves mal cerradas o sin {auth_link}"""
+
+
+class CompiledTemplate:
+    """Plantilla partida en (texto literal, variable) para renderizar sin str.format"""
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def render(self, name: str | None, auth_link: str) -> str:
+        values = {"name": name or "", "auth_link": auth_link}
+        return "".join(literal + (values[field] if field else "") for literal, field in self.parts)
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> CompiledTemplate:
+    """Valida la plantilla y la compila; lanza TemplateError con un mensaje para el operador"""
+    if not template or not template.strip():
+        raise TemplateError("La plantilla está vacía.")
+    try:
+        parsed = list(Formatter().parse(template))
+    except ValueError as e:
+        raise TemplateError(f"Llaves mal cerradas: {e}. Use {{{{ y }}}} para llaves literales.") from e
+
+    parts = []
+    fields = set()
+    for literal, field, spec, conversion in parsed:
+        if field is None:
+            parts.append((literal, None))
+            continue
+        if field not in ALLOWED_FIELDS:
+            allowed = ", ".join(f"{{{f}}}" for f in sorted(ALLOWED_FIELDS))
+            raise TemplateError(f"Variable desconocida {{{field}}}. Variables permitidas: {allowed}.")
+        if spec or conversion:
+            raise TemplateError(f"La variable {{{field}}} no admite formato ni conversión.")
+        fields.add(field)
+        parts.append((literal, field))
+
+    missing = REQUIRED_FIELDS - fields
+    if missing:
+        raise TemplateError(f"Falta la variable obligatoria {', '.join(f'{{{f}}}' for f in sorted(missing))}.")
+    return CompiledTemplate(parts)
+
+
+def auth_link(public_domain: str, token) -> str:
+    return f"{public_domain}/auth/{token}"
+
+
+def render_batch(jobs, public_domain: str, fallback_template: str) -> dict:
+    """Mensajes de un lote: {job.id: texto o TemplateError}.
+
+    Cada texto de plantilla se compila una sola vez (caché), aunque el lote mezcle
+    campañas e idiomas. Los trabajos sin plantilla usan `fallback_template`.
+    """
+    messages = {}
+    for job in jobs:
+        try:
+            compiled = compile_template(job.message_template or fallback_template)
+        except TemplateError as e:
+            messages[job.id] = e
+            continue
+        messages[job.id] = compiled.render(job.name, auth_link(public_domain, job.token))
+    return messages
+
+
+def validate_templates(templates: dict) -> dict:
+    """Valida todas las variantes {idioma: plantilla}; devuelve {idioma: error} de las inválidas"""
+    errors = {}
+    for language, template in templates.items():
+        try:
+            compile_template(template)
+        except TemplateError as e:
+            errors[language] = str(e)
+    return errors
+
+
+def save_campaign_templates(conn, campaign_id: int, templates: dict, default_language: str = DEFAULT_LANGUAGE):
+    """Reemplaza las variantes de la campaña por las recibidas (ya validadas).
+
+    Las que no vienen se borran en la misma transacción, para que claim_batch no siga
+    eligiendo un idioma que el operador quitó.
+    """
+    conn.execute(
+        text(
+            "DELETE FROM campaign_templates "
+            "WHERE campaign_id = :campaign_id AND NOT (language = ANY(CAST(:languages AS text[])))"
+        ),
+        {"campaign_id": campaign_id, "languages": list(templates)},
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO campaign_templates (campaign_id, language, body)
+            SELECT :campaign_id, v.language, v.body
+            FROM unnest(CAST(:languages AS text[]), CAST(:bodies AS text[])) AS v(language, body)
+            ON CONFLICT (campaign_id, language) DO UPDATE SET body = EXCLUDED.body, updated_at = NOW()
+            """
+        ),
+        {
+            "campaign_id": campaign_id,
+            "languages": list(templates),
+            "bodies": list(templates.values()),
+        },
+    )
+    conn.execute(
+        text("UPDATE campaigns SET default_language = :language WHERE id = :id"),
+        {"language": default_language, "id": campaign_id},
+    )
+    conn.commit()
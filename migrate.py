@@ -0,0 +1,143 @@
+"""Aplica las migraciones pendientes de migrations/ una sola vez.
+
+Se ejecuta al arrancar los contenedores (antes de Streamlit y del despachador),
+no en cada rerun del panel. La tabla schema_migrations registra qué archivos ya
+corrieron; un advisory lock evita que dos contenedores migren a la vez.
+
+    python migrate.py           # aplica lo pendiente
+    python migrate.py --status  # lista aplicadas y pendientes
+"""
+import argparse
+import glob
+import hashlib
+import os
+
+from sqlalchemy import create_engine, text
+
+from config import DB_URL
+from send_logs_archive import ensure_partitions
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION_MARKER = "-- migrate:no-transaction"
+# Clave arbitraria del advisory lock de migraciones
+MIGRATION_LOCK_ID = 7421001
+
+
+def split_sql_statements(sql: str):
+    """Separa sentencias simples (sin bloques $$) terminadas en ';'"""
+    for chunk in sql.split(";"):
+        body = "\n".join(line for line in chunk.splitlines() if not line.strip().startswith("--"))
+        if body.strip():
+            yield chunk.strip()
+
+
+def file_checksum(sql: str) -> str:
+    return hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+
+def migration_files():
+    return sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql")))
+
+
+def ensure_migrations_table(engine):
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version VARCHAR(255) PRIMARY KEY,
+                    checksum CHAR(64) NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+                """
+            )
+        )
+
+
+def applied_versions(engine) -> dict:
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT version, checksum FROM schema_migrations")).fetchall())
+
+
+def apply_migration_file(engine, path: str):
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+    version = os.path.basename(path)
+    checksum = file_checksum(sql)
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if sql.startswith(NO_TRANSACTION_MARKER):
+            # Ej. CREATE INDEX CONCURRENTLY: cada sentencia en autocommit
+            raw.driver_connection.autocommit = True
+            try:
+                for statement in split_sql_statements(sql):
+                    cursor.execute(statement)
+            finally:
+                raw.driver_connection.autocommit = False
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, checksum) VALUES (%s, %s)", (version, checksum)
+            )
+        else:
+            cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, checksum) VALUES (%s, %s)", (version, checksum)
+            )
+        raw.commit()
+        cursor.close()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def run_migrations(engine):
+    """Aplica en orden los archivos aún no registrados en schema_migrations"""
+    ensure_migrations_table(engine)
+    # Conexión en autocommit: el lock es de sesión y no debe dejar una transacción
+    # abierta que haga esperar a CREATE INDEX CONCURRENTLY
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            done = applied_versions(engine)
+            for path in migration_files():
+                version = os.path.basename(path)
+                if version in done:
+                    with open(path, encoding="utf-8") as f:
+                        if file_checksum(f.read()) != done[version]:
+                            print(f"⚠️ {version} cambió después de aplicarse; cree una migración nueva.")
+                    continue
+                print(f"Aplicando migración {version}...")
+                apply_migration_file(engine, path)
+            # Particiones de send_logs de los próximos meses también si el despachador no corre
+            with engine.connect() as conn:
+                ensure_partitions(conn)
+            print("✅ Esquema al día.")
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+def print_status(engine):
+    ensure_migrations_table(engine)
+    done = applied_versions(engine)
+    for path in migration_files():
+        version = os.path.basename(path)
+        print(f"{'✔' if version in done else '·'} {version}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="Solo mostrar el estado")
+    args = parser.parse_args()
+
+    engine = create_engine(DB_URL)
+    if args.status:
+        print_status(engine)
+    else:
+        run_migrations(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+-- La restricción única pasa de solo teléfono a (teléfono, campaña)
+ALTER TABLE habeas_requests DROP CONSTRAINT IF EXISTS habeas_requests_phone_key;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'habeas_requests_phone_campaign_id_key'
+    ) THEN
+        ALTER TABLE habeas_requests
+            ADD CONSTRAINT habeas_requests_phone_campaign_id_key UNIQUE (phone, campaign_id);
+    END IF;
+END $$;
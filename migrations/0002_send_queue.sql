@@ -0,0 +1,29 @@
+-- Cola persistente de envíos drenada por dispatcher.py
+DO $$
+BEGIN
+    CREATE TYPE queue_status AS ENUM ('queued', 'sending', 'sent', 'failed');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS send_queue (
+    id BIGSERIAL PRIMARY KEY,
+    request_id INTEGER NOT NULL REFERENCES habeas_requests(id),
+    campaign_id INTEGER REFERENCES campaigns(id),
+    message_template TEXT NOT NULL,
+    status queue_status NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id VARCHAR(100),
+    locked_at TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS send_queue_queued_idx ON send_queue (id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS send_queue_campaign_status_idx ON send_queue (campaign_id, status);
+
+CREATE OR REPLACE TRIGGER update_send_queue_modtime
+    BEFORE UPDATE ON send_queue
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
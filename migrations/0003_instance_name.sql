@@ -0,0 +1,3 @@
+-- Pool de instancias: qué instancia envió cada mensaje
+ALTER TABLE send_queue ADD COLUMN IF NOT EXISTS instance_name VARCHAR(100);
+ALTER TABLE send_logs ADD COLUMN IF NOT EXISTS instance_name VARCHAR(100);
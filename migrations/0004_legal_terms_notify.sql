@@ -0,0 +1,13 @@
+-- Invalidación de la caché de términos de la landing (LISTEN legal_terms_changed)
+CREATE OR REPLACE FUNCTION notify_legal_terms_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('legal_terms_changed', COALESCE(NEW.version, OLD.version));
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER legal_terms_changed
+    AFTER INSERT OR UPDATE OR DELETE ON legal_terms
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_legal_terms_changed();
@@ -0,0 +1,23 @@
+-- migrate:no-transaction
+-- Índices para los filtros del panel y los reintentos. CONCURRENTLY evita bloquear
+-- las escrituras de la landing mientras se construyen sobre tablas grandes.
+
+-- Reintentos: status = 'pending' AND sent_at < NOW() - INTERVAL '5 days'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habeas_requests_pending_sent_at_idx
+    ON habeas_requests (sent_at) WHERE status = 'pending';
+
+-- Panel: filtro por estado + rango de sent_at, paginado por (sent_at, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habeas_requests_status_sent_at_idx
+    ON habeas_requests (status, sent_at DESC, id DESC);
+
+-- Panel sin filtro de estado: paginado por (sent_at, id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habeas_requests_sent_at_id_idx
+    ON habeas_requests (sent_at DESC, id DESC);
+
+-- Conteos y reanudación por campaña
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habeas_requests_campaign_status_idx
+    ON habeas_requests (campaign_id, status);
+
+-- Historial de envíos de una solicitud
+CREATE INDEX CONCURRENTLY IF NOT EXISTS send_logs_request_created_idx
+    ON send_logs (request_id, created_at);
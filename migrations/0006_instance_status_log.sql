@@ -0,0 +1,14 @@
+-- Historial de connectionState de las instancias (cambios de estado y latencia)
+CREATE TABLE IF NOT EXISTS instance_status_log (
+    id BIGSERIAL PRIMARY KEY,
+    instance_name VARCHAR(100) NOT NULL,
+    state VARCHAR(30) NOT NULL,
+    previous_state VARCHAR(30),
+    latency_ms INTEGER,
+    checked_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS instance_status_log_instance_checked_idx
+    ON instance_status_log (instance_name, checked_at);
+CREATE INDEX IF NOT EXISTS instance_status_log_changes_idx
+    ON instance_status_log (checked_at) WHERE previous_state IS NOT NULL;
@@ -0,0 +1,10 @@
+-- Clave de idempotencia por mensaje: se anota en el journal antes del POST y queda en send_logs.
+-- Reanudar un envío interrumpido genera una clave nueva, así que resultados viejos no lo pisan.
+ALTER TABLE send_queue ADD COLUMN IF NOT EXISTS idempotency_key UUID NOT NULL DEFAULT gen_random_uuid();
+ALTER TABLE send_logs ADD COLUMN IF NOT EXISTS idempotency_key UUID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS send_queue_idempotency_key_idx ON send_queue (idempotency_key);
+-- Reanudar campañas busca solicitudes sin trabajo en la cola
+CREATE INDEX IF NOT EXISTS send_queue_request_idx ON send_queue (request_id);
+-- Barrido de trabajos 'sending' cuyo worker desapareció
+CREATE INDEX IF NOT EXISTS send_queue_sending_locked_idx ON send_queue (locked_at) WHERE status = 'sending';
@@ -0,0 +1,14 @@
+-- Reintentos programados (available_at) y recordatorios automáticos (kind)
+DO $$
+BEGIN
+    CREATE TYPE send_kind AS ENUM ('initial', 'reminder');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
+
+ALTER TABLE send_queue ADD COLUMN IF NOT EXISTS kind send_kind NOT NULL DEFAULT 'initial';
+ALTER TABLE send_queue ADD COLUMN IF NOT EXISTS available_at TIMESTAMP NOT NULL DEFAULT NOW();
+
+-- claim_batch toma los trabajos en cola ya disponibles, del más antiguo al más nuevo
+CREATE INDEX IF NOT EXISTS send_queue_ready_idx ON send_queue (available_at, id) WHERE status = 'queued';
+DROP INDEX IF EXISTS send_queue_queued_idx;
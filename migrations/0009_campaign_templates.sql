@@ -0,0 +1,14 @@
+-- Plantillas de mensaje validadas y guardadas con la campaña, una variante por idioma.
+-- Los trabajos de send_queue sin message_template usan la variante del idioma de la
+-- solicitud (o la del idioma por defecto de la campaña).
+CREATE TABLE IF NOT EXISTS campaign_templates (
+    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+    language VARCHAR(10) NOT NULL,
+    body TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (campaign_id, language)
+);
+
+ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS default_language VARCHAR(10) NOT NULL DEFAULT 'es';
+ALTER TABLE send_queue ALTER COLUMN message_template DROP NOT NULL;
@@ -0,0 +1,21 @@
+-- Telemetría de envío agregada por campaña y minuto (la escribe complete_jobs en la
+-- misma sentencia que cierra los trabajos); el panel la lee sin recorrer send_logs.
+CREATE TABLE IF NOT EXISTS send_stats_minute (
+    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+    minute TIMESTAMP NOT NULL,
+    status_code INTEGER NOT NULL, -- 0: sin respuesta HTTP (timeout, error de conexión)
+    messages INTEGER NOT NULL DEFAULT 0,
+    http_ms_sum BIGINT NOT NULL DEFAULT 0,
+    wait_ms_sum BIGINT NOT NULL DEFAULT 0,
+    db_ms_sum BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (campaign_id, minute, status_code)
+);
+
+-- Histograma de latencia HTTP a Evolution API (bucket_ms = límite superior del bucket)
+CREATE TABLE IF NOT EXISTS send_latency_minute (
+    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+    minute TIMESTAMP NOT NULL,
+    bucket_ms INTEGER NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (campaign_id, minute, bucket_ms)
+);
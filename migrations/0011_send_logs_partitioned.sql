@@ -0,0 +1,104 @@
+-- send_logs particionada por mes (created_at). Las particiones viejas se archivan a
+-- archivos comprimidos y se eliminan con send_logs_archive.py, así VACUUM e índices
+-- trabajan solo sobre los meses vivos. La respuesta de Evolution API queda resumida
+-- en message_id + response (JSONB); el texto crudo solo si SEND_LOG_RAW_BODY=true.
+
+-- Crea (si falta) la partición del mes que contiene `month`
+CREATE OR REPLACE FUNCTION create_send_logs_partition(month DATE)
+RETURNS VOID AS $$
+DECLARE
+    start_month DATE := date_trunc('month', month);
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF send_logs FOR VALUES FROM (%L) TO (%L)',
+        'send_logs_' || to_char(start_month, 'YYYY_MM'),
+        start_month,
+        start_month + INTERVAL '1 month'
+    );
+END;
+$$ language 'plpgsql';
+
+-- Particiones del mes actual y de los `months_ahead` siguientes (el despachador la llama periódicamente)
+CREATE OR REPLACE FUNCTION ensure_send_logs_partitions(months_ahead INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    PERFORM create_send_logs_partition((date_trunc('month', NOW()) + make_interval(months => n))::date)
+    FROM generate_series(0, months_ahead) AS n;
+END;
+$$ language 'plpgsql';
+
+-- Solo para migrar el historial: resume un response_body de texto (JSON o no)
+CREATE OR REPLACE FUNCTION pg_temp.summarize_send_response(body TEXT)
+RETURNS JSONB AS $$
+DECLARE
+    data JSONB;
+BEGIN
+    IF body IS NULL OR body = '' THEN
+        RETURN NULL;
+    END IF;
+    BEGIN
+        data := body::jsonb;
+    EXCEPTION
+        WHEN others THEN RETURN jsonb_build_object('error', left(body, 500));
+    END;
+    IF jsonb_typeof(data) <> 'object' THEN
+        RETURN jsonb_build_object('error', left(body, 500));
+    END IF;
+    RETURN jsonb_strip_nulls(jsonb_build_object(
+        'message_id', data->'key'->>'id',
+        'status', CASE WHEN jsonb_typeof(data->'status') = 'string' THEN data->>'status' END,
+        'error', data->>'error',
+        'detail', data->'response'
+    ));
+END;
+$$ language 'plpgsql';
+
+DO $$
+BEGIN
+    -- Ya convertida (init.sql la crea sin particionar; esta migración la convierte)
+    IF (SELECT relkind FROM pg_class WHERE oid = 'send_logs'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE send_logs RENAME TO send_logs_legacy;
+    ALTER TABLE send_logs_legacy RENAME CONSTRAINT send_logs_pkey TO send_logs_legacy_pkey;
+    ALTER SEQUENCE send_logs_id_seq RENAME TO send_logs_legacy_id_seq;
+    ALTER INDEX IF EXISTS send_logs_request_created_idx RENAME TO send_logs_legacy_request_created_idx;
+
+    CREATE TABLE send_logs (
+        id BIGSERIAL,
+        request_id INTEGER REFERENCES habeas_requests(id),
+        response_status INTEGER,
+        message_id VARCHAR(100),
+        response JSONB,
+        response_body TEXT,
+        instance_name VARCHAR(100),
+        idempotency_key UUID,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    CREATE INDEX send_logs_request_created_idx ON send_logs (request_id, created_at);
+    CREATE INDEX send_logs_message_id_idx ON send_logs (message_id) WHERE message_id IS NOT NULL;
+
+    PERFORM create_send_logs_partition(month::date)
+    FROM generate_series(
+        date_trunc('month', COALESCE((SELECT MIN(created_at) FROM send_logs_legacy), NOW())),
+        date_trunc('month', NOW()),
+        INTERVAL '1 month'
+    ) AS month;
+    PERFORM ensure_send_logs_partitions(3);
+
+    -- El historial conserva su texto crudo; lo nuevo solo si SEND_LOG_RAW_BODY=true
+    INSERT INTO send_logs (
+        id, request_id, response_status, message_id, response, response_body,
+        instance_name, idempotency_key, created_at
+    )
+    SELECT l.id, l.request_id, l.response_status, s.summary->>'message_id', s.summary - 'message_id',
+           l.response_body, l.instance_name, l.idempotency_key, COALESCE(l.created_at, NOW())
+    FROM send_logs_legacy l
+    CROSS JOIN LATERAL (SELECT pg_temp.summarize_send_response(l.response_body) AS summary) s;
+
+    PERFORM setval('send_logs_id_seq', COALESCE((SELECT MAX(id) FROM send_logs_legacy), 0) + 1, false);
+    DROP TABLE send_logs_legacy;
+END $$;
@@ -0,0 +1,178 @@
+-- Resumen por campaña que mantienen triggers por sentencia (con tablas de transición):
+-- solicitudes por estado, envíos exitosos/fallidos de send_logs y primera/última
+-- actividad. El panel lo lee en O(campañas) sin recorrer habeas_requests.
+-- Cada campaña se reparte en filas (shard = id % 8) para que los clics simultáneos
+-- de la landing no esperen todos el lock de la misma fila; las lecturas suman los shards.
+-- Los envíos usan los shards 8-15: así complete_jobs (que cambia estados e inserta en
+-- send_logs en la misma sentencia) bloquea dos grupos de filas disjuntos, siempre en el
+-- mismo orden, y dos despachadores no se bloquean en ciclo.
+-- campaign_id 0 agrupa las solicitudes sin campaña.
+CREATE TABLE IF NOT EXISTS campaign_stats (
+    campaign_id INTEGER NOT NULL,
+    shard SMALLINT NOT NULL,
+    pending BIGINT NOT NULL DEFAULT 0,
+    accepted BIGINT NOT NULL DEFAULT 0,
+    rejected BIGINT NOT NULL DEFAULT 0,
+    failed BIGINT NOT NULL DEFAULT 0,
+    sends_ok BIGINT NOT NULL DEFAULT 0, -- Intentos con respuesta 201
+    sends_failed BIGINT NOT NULL DEFAULT 0,
+    first_activity_at TIMESTAMP,
+    last_activity_at TIMESTAMP,
+    PRIMARY KEY (campaign_id, shard)
+);
+
+CREATE OR REPLACE FUNCTION campaign_stats_shard(request_id BIGINT)
+RETURNS SMALLINT AS $$
+    SELECT (request_id % 8)::smallint
+$$ language 'sql' IMMUTABLE;
+
+-- Suma deltas (+1 estado nuevo, -1 estado anterior) de solicitudes; las filas se
+-- bloquean en orden de (campaign_id, shard) para no provocar deadlocks entre lotes
+CREATE OR REPLACE FUNCTION campaign_stats_apply(campaign_ids INTEGER[], request_ids BIGINT[],
+                                                statuses request_status[], deltas INTEGER[])
+RETURNS VOID AS $$
+    INSERT INTO campaign_stats AS s (
+        campaign_id, shard, pending, accepted, rejected, failed, first_activity_at, last_activity_at
+    )
+    SELECT campaign_id, shard, pending, accepted, rejected, failed, NOW(), NOW()
+    FROM (
+        SELECT COALESCE(d.campaign_id, 0) AS campaign_id, campaign_stats_shard(d.request_id) AS shard,
+               COALESCE(SUM(d.delta) FILTER (WHERE d.status = 'pending'), 0) AS pending,
+               COALESCE(SUM(d.delta) FILTER (WHERE d.status = 'accepted'), 0) AS accepted,
+               COALESCE(SUM(d.delta) FILTER (WHERE d.status = 'rejected'), 0) AS rejected,
+               COALESCE(SUM(d.delta) FILTER (WHERE d.status = 'failed'), 0) AS failed
+        FROM unnest(campaign_ids, request_ids, statuses, deltas) AS d(campaign_id, request_id, status, delta)
+        GROUP BY 1, 2
+    ) AS agg
+    -- Un UPDATE que no cambió estado ni campaña se anula solo
+    WHERE pending <> 0 OR accepted <> 0 OR rejected <> 0 OR failed <> 0
+    ORDER BY campaign_id, shard
+    ON CONFLICT (campaign_id, shard) DO UPDATE
+    SET pending = s.pending + EXCLUDED.pending,
+        accepted = s.accepted + EXCLUDED.accepted,
+        rejected = s.rejected + EXCLUDED.rejected,
+        failed = s.failed + EXCLUDED.failed,
+        first_activity_at = COALESCE(s.first_activity_at, EXCLUDED.first_activity_at),
+        last_activity_at = EXCLUDED.last_activity_at
+$$ language 'sql';
+
+CREATE OR REPLACE FUNCTION campaign_stats_requests_inserted()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM campaign_stats_apply(array_agg(campaign_id), array_agg(id::bigint), array_agg(status), array_agg(1))
+    FROM new_rows;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION campaign_stats_requests_updated()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM campaign_stats_apply(array_agg(campaign_id), array_agg(id), array_agg(status), array_agg(delta))
+    FROM (
+        SELECT campaign_id, id::bigint AS id, status, 1 AS delta FROM new_rows
+        UNION ALL
+        SELECT campaign_id, id::bigint, status, -1 FROM old_rows
+    ) AS d;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION campaign_stats_requests_deleted()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM campaign_stats_apply(array_agg(campaign_id), array_agg(id::bigint), array_agg(status), array_agg(-1))
+    FROM old_rows;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION campaign_stats_sends_inserted()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO campaign_stats AS s (
+        campaign_id, shard, sends_ok, sends_failed, first_activity_at, last_activity_at
+    )
+    SELECT COALESCE(h.campaign_id, 0), campaign_stats_shard(n.request_id) + 8,
+           COUNT(*) FILTER (WHERE n.response_status = 201),
+           COUNT(*) FILTER (WHERE n.response_status IS DISTINCT FROM 201),
+           MIN(n.created_at), MAX(n.created_at)
+    FROM new_rows n
+    JOIN habeas_requests h ON h.id = n.request_id
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (campaign_id, shard) DO UPDATE
+    SET sends_ok = s.sends_ok + EXCLUDED.sends_ok,
+        sends_failed = s.sends_failed + EXCLUDED.sends_failed,
+        first_activity_at = LEAST(s.first_activity_at, EXCLUDED.first_activity_at),
+        last_activity_at = GREATEST(s.last_activity_at, EXCLUDED.last_activity_at);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+-- Recalcula todo desde las tablas base (python campaign_stats.py --rebuild). Bloquea
+-- las escrituras en habeas_requests y send_logs mientras corre para no perder deltas.
+CREATE OR REPLACE FUNCTION rebuild_campaign_stats()
+RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    LOCK TABLE habeas_requests, send_logs IN SHARE MODE;
+    LOCK TABLE campaign_stats IN EXCLUSIVE MODE;
+    DELETE FROM campaign_stats;
+    INSERT INTO campaign_stats (
+        campaign_id, shard, pending, accepted, rejected, failed, sends_ok, sends_failed,
+        first_activity_at, last_activity_at
+    )
+    SELECT campaign_id, shard, SUM(pending), SUM(accepted), SUM(rejected), SUM(failed),
+           SUM(sends_ok), SUM(sends_failed), MIN(first_at), MAX(last_at)
+    FROM (
+        SELECT COALESCE(campaign_id, 0) AS campaign_id, campaign_stats_shard(id) AS shard,
+               COUNT(*) FILTER (WHERE status = 'pending') AS pending,
+               COUNT(*) FILTER (WHERE status = 'accepted') AS accepted,
+               COUNT(*) FILTER (WHERE status = 'rejected') AS rejected,
+               COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+               0 AS sends_ok, 0 AS sends_failed,
+               MIN(sent_at) AS first_at, MAX(updated_at) AS last_at
+        FROM habeas_requests
+        GROUP BY 1, 2
+        UNION ALL
+        SELECT COALESCE(h.campaign_id, 0), campaign_stats_shard(s.request_id) + 8, 0, 0, 0, 0,
+               COUNT(*) FILTER (WHERE s.response_status = 201),
+               COUNT(*) FILTER (WHERE s.response_status IS DISTINCT FROM 201),
+               MIN(s.created_at), MAX(s.created_at)
+        FROM send_logs s
+        JOIN habeas_requests h ON h.id = s.request_id
+        GROUP BY 1, 2
+    ) AS parts
+    GROUP BY campaign_id, shard;
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER campaign_stats_requests_insert
+    AFTER INSERT ON habeas_requests
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION campaign_stats_requests_inserted();
+
+CREATE OR REPLACE TRIGGER campaign_stats_requests_update
+    AFTER UPDATE ON habeas_requests
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION campaign_stats_requests_updated();
+
+CREATE OR REPLACE TRIGGER campaign_stats_requests_delete
+    AFTER DELETE ON habeas_requests
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION campaign_stats_requests_deleted();
+
+CREATE OR REPLACE TRIGGER campaign_stats_sends_insert
+    AFTER INSERT ON send_logs
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION campaign_stats_sends_inserted();
+
+SELECT rebuild_campaign_stats();
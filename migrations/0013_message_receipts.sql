@@ -0,0 +1,17 @@
+-- Confirmaciones de entrega/lectura que Evolution API envía por webhook (messages.update).
+-- Se guardan por message_id tal como llegan, aunque el despachador aún no haya registrado
+-- ese id en send_queue (el resultado del envío se escribe en lote): el cruce se hace al
+-- consultar, así una confirmación temprana no se pierde.
+CREATE TABLE IF NOT EXISTS message_receipts (
+    message_id VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL, -- SERVER_ACK, DELIVERY_ACK, READ, PLAYED, ERROR
+    remote_jid VARCHAR(100),
+    instance_name VARCHAR(100),
+    event_at TIMESTAMP,
+    received_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (message_id, status) -- Un evento repetido (reintento del webhook) no duplica
+);
+
+-- key.id del mensaje que envió cada trabajo (respuesta de sendText)
+ALTER TABLE send_queue ADD COLUMN IF NOT EXISTS message_id VARCHAR(100);
+CREATE INDEX IF NOT EXISTS send_queue_message_id_idx ON send_queue (message_id) WHERE message_id IS NOT NULL;
@@ -0,0 +1,44 @@
+-- Partición DEFAULT de send_logs: si nadie creó la del mes (ej. el despachador estuvo
+-- detenido más allá de los meses que asegura), los envíos y el envío de prueba del
+-- panel siguen registrándose en vez de fallar.
+CREATE TABLE IF NOT EXISTS send_logs_default PARTITION OF send_logs DEFAULT;
+
+-- Crea (si falta) la partición del mes que contiene `month`. Las filas de ese mes que
+-- cayeron en send_logs_default se mueven a la partición nueva antes de adjuntarla
+-- (Postgres no permite crearla mientras la DEFAULT tenga filas de su rango).
+CREATE OR REPLACE FUNCTION create_send_logs_partition(month DATE)
+RETURNS VOID AS $$
+DECLARE
+    start_month DATE := date_trunc('month', month);
+    end_month DATE := start_month + INTERVAL '1 month';
+    partition_name TEXT := 'send_logs_' || to_char(start_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    IF NOT EXISTS (
+        SELECT 1 FROM send_logs_default WHERE created_at >= start_month AND created_at < end_month
+    ) THEN
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF send_logs FOR VALUES FROM (%L) TO (%L)',
+            partition_name, start_month, end_month
+        );
+        RETURN;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE send_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM send_logs_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        start_month, end_month, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE send_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_month, end_month
+    );
+END;
+$$ language 'plpgsql';
+
+-- Lo que ya esté en la DEFAULT pasa a su mes
+SELECT create_send_logs_partition(month::date)
+FROM (SELECT DISTINCT date_trunc('month', created_at) AS month FROM send_logs_default) AS months;
+SELECT ensure_send_logs_partitions(3);
@@ -0,0 +1,186 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+from config import OUTCOME_FLUSH_ROWS, OUTCOME_FLUSH_SECONDS, OUTCOME_JOURNAL_DIR, OUTCOME_JOURNAL_FSYNC
+from send_queue import complete_jobs, recover_worker_jobs
+
+JOURNAL_PREFIX = "outcomes-"
+
+
+def _read_journal(f):
+    """Devuelve (resultados, ids intentados sin resultado)"""
+    f.seek(0)
+    outcomes = []
+    attempted = set()
+    for line in f:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # Última línea a medio escribir cuando el proceso murió
+        if "intent" in entry:
+            attempted.add(entry["intent"])
+        else:
+            outcomes.append(entry)
+    attempted -= {o["job_id"] for o in outcomes}
+    return outcomes, attempted
+
+
+class OutcomeBuffer:
+    """Acumula resultados de envío y los guarda en lote (write-behind).
+
+    Cada resultado se agrega primero a un journal local (una línea JSON) y se
+    escribe en la DB cuando hay OUTCOME_FLUSH_ROWS pendientes o el más antiguo
+    supera OUTCOME_FLUSH_SECONDS. Si el worker muere, el siguiente que arranque
+    reprocesa los journals huérfanos; complete_jobs ignora lo ya aplicado.
+
+    Antes de cada POST se anota también la intención de envío (`begin`). Así, al
+    recuperar un journal se distingue lo que quizá salió (queda interrumpido, sin
+    reenvío automático) de lo que el worker reclamó pero nunca intentó (vuelve a la cola).
+    """
+
+    def __init__(self, engine, worker_id: str, journal_dir: str = OUTCOME_JOURNAL_DIR,
+                 max_rows: int = OUTCOME_FLUSH_ROWS, max_age: float = OUTCOME_FLUSH_SECONDS):
+        self.engine = engine
+        self.worker_id = worker_id
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.pending = []
+        self.inflight = {}  # job_id -> línea de intención aún sin resultado
+        self.flush_ms_per_row = 0.0
+        self.oldest = None
+        self.retry_at = 0.0  # Tras un error de DB no se reintenta el guardado antes de esto
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+
+        os.makedirs(journal_dir, exist_ok=True)
+        self.journal_dir = journal_dir
+        self.recover_orphans()
+        # El nombre lleva el worker_id para poder cerrar sus trabajos si muere
+        self.journal = open(os.path.join(journal_dir, f"{JOURNAL_PREFIX}{worker_id}.jsonl"), "a+", encoding="utf-8")
+        # El lock indica a otros workers que este journal tiene dueño vivo
+        fcntl.flock(self.journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="outcome-flusher", daemon=True)
+        self._flusher.start()
+
+    def recover_orphans(self):
+        """Aplica y borra los journals de workers que ya no están vivos"""
+        for path in glob.glob(os.path.join(self.journal_dir, f"{JOURNAL_PREFIX}*.jsonl")):
+            worker_id = os.path.basename(path)[len(JOURNAL_PREFIX):-len(".jsonl")]
+            with open(path, "r+", encoding="utf-8") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Otro worker vivo lo está usando
+                outcomes, attempted = _read_journal(f)
+                with self.engine.connect() as conn:
+                    applied = complete_jobs(conn, outcomes)
+                    interrupted, released = recover_worker_jobs(conn, worker_id, attempted)
+                if outcomes or interrupted or released:
+                    print(
+                        f"♻️ Journal {os.path.basename(path)}: {applied}/{len(outcomes)} resultados recuperados, "
+                        f"{interrupted} interrumpidos, {released} devueltos a la cola"
+                    )
+            os.remove(path)
+
+    def _write(self, line: str):
+        self.journal.write(line)
+        self.journal.flush()
+        if OUTCOME_JOURNAL_FSYNC:
+            os.fsync(self.journal.fileno())
+
+    def begin(self, job):
+        """Anota que el trabajo está por enviarse (se llama justo antes del POST)"""
+        line = json.dumps({"intent": job.id, "key": str(job.idempotency_key)}) + "\n"
+        with self.lock:
+            self._write(line)
+            self.inflight[job.id] = line
+
+    def discard(self, job_id: int):
+        """El envío falló sin entregarse y el trabajo vuelve a la cola"""
+        with self.lock:
+            self.inflight.pop(job_id, None)
+
+    def add(self, job_id: int, key, attempts: int, instance: str, status_code: int | None, body: str | None,
+            retry_in: float | None = None, **timings):
+        """Agrega el resultado del intento `attempts`; `timings` (http_ms, wait_ms, db_ms)
+        alimentan la telemetría.
+
+        Al db_ms recibido (ej. la reclamación del lote) se suma lo que costó por fila
+        el último guardado en la DB.
+        """
+        outcome = {
+            "job_id": job_id, "key": str(key), "attempts": attempts, "instance": instance,
+            "status_code": status_code, "body": body, "retry_in": retry_in,
+            **timings,
+        }
+        outcome["db_ms"] = int(outcome.get("db_ms", 0) + self.flush_ms_per_row)
+        with self.lock:
+            self._write(json.dumps(outcome) + "\n")
+            self.inflight.pop(job_id, None)
+            self.pending.append(outcome)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            if len(self.pending) >= self.max_rows and time.monotonic() >= self.retry_at:
+                self._try_flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        started = time.perf_counter()
+        with self.engine.connect() as conn:
+            complete_jobs(conn, self.pending)
+        self.flush_ms_per_row = (time.perf_counter() - started) * 1000 / len(self.pending)
+        # Ya está en la DB: el journal puede vaciarse, salvo los envíos aún en vuelo
+        self.journal.seek(0)
+        self.journal.truncate()
+        if self.inflight:
+            self._write("".join(self.inflight.values()))
+        self.pending = []
+        self.oldest = None
+
+    def _try_flush_locked(self) -> bool:
+        try:
+            self._flush_locked()
+            return True
+        except Exception as e:
+            # Los resultados siguen en memoria y en el journal; se reintenta tras max_age
+            print(f"Error guardando resultados: {e}")
+            self.retry_at = time.monotonic() + self.max_age
+            return False
+
+    def _flush_loop(self):
+        while not self._stop.wait(min(1.0, self.max_age)):
+            with self.lock:
+                if self.oldest is not None and time.monotonic() - self.oldest >= self.max_age:
+                    self._try_flush_locked()
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        with self.lock:
+            saved = self._try_flush_locked()
+            # Lo que siga reclamado por este worker: interrumpido si llegó a intentarse, si no a la
+            # cola. Los resultados que no se pudieron guardar cuentan como intentados: el journal
+            # queda y el próximo worker que arranque los aplica (complete_jobs acepta interrumpidos)
+            attempted = list(self.inflight) + [o["job_id"] for o in self.pending]
+            try:
+                with self.engine.connect() as conn:
+                    recover_worker_jobs(conn, self.worker_id, attempted)
+            except Exception as e:
+                print(f"Error cerrando los trabajos del worker: {e}")
+                saved = False
+            path = self.journal.name
+            self.journal.close()
+            if saved:
+                os.remove(path)
+            else:
+                print(f"Journal {os.path.basename(path)} conservado para recuperarlo al reiniciar")
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+# --- Webhook de Evolution API (messages.update) ---
+# La landing responde de inmediato y acumula las confirmaciones en memoria; una tarea
+# en segundo plano las inserta en lote en message_receipts. Un evento repetido choca
+# con la clave (message_id, status) y se ignora.
+
+# Estados numéricos de Baileys (payloads v1) a su nombre en v2
+STATUS_NAMES = {0: "ERROR", 1: "PENDING", 2: "SERVER_ACK", 3: "DELIVERY_ACK", 4: "READ", 5: "PLAYED"}
+# Estados que confirman que el mensaje llegó al teléfono
+DELIVERED_STATUSES = ("DELIVERY_ACK", "READ", "PLAYED")
+RECEIPT_EVENT = "messages.update"
+
+INSERT_RECEIPTS_SQL = """
+    INSERT INTO message_receipts (message_id, status, remote_jid, instance_name, event_at)
+    SELECT * FROM unnest(
+        CAST(:message_ids AS text[]),
+        CAST(:statuses AS text[]),
+        CAST(:remote_jids AS text[]),
+        CAST(:instances AS text[]),
+        CAST(:event_ats AS timestamp[])
+    )
+    ON CONFLICT (message_id, status) DO NOTHING
+"""
+
+
+# Epoch por encima de esto viene en milisegundos (1e11 s es el año 5138)
+_MILLISECONDS_EPOCH = 1e11
+
+
+def _event_time(payload: dict, update: dict):
+    """Hora del evento (timestamp de WhatsApp o date_time del webhook) o None; un valor
+    inválido no rechaza el evento (received_at guarda igual la hora de llegada)"""
+    stamp = update.get("messageTimestamp") or update.get("timestamp")
+    if isinstance(stamp, str) and stamp.isdigit():
+        stamp = int(stamp)
+    if isinstance(stamp, (int, float)) and not isinstance(stamp, bool):
+        if stamp > _MILLISECONDS_EPOCH:
+            stamp /= 1000
+        try:
+            return datetime.fromtimestamp(stamp, timezone.utc).replace(tzinfo=None)
+        except (ValueError, OverflowError, OSError):
+            pass
+    try:
+        parsed = datetime.fromisoformat(str(payload.get("date_time")).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_receipts(payload) -> list[tuple]:
+    """(message_id, status, remote_jid, instancia, event_at) de un webhook messages.update.
+
+    Acepta el formato de v2 (data con keyId y status en texto) y el de v1 (lista de
+    {key, update: {status: número}}). Solo cuenta lo enviado por nosotros (fromMe).
+    """
+    if not isinstance(payload, dict) or str(payload.get("event", "")).lower().replace("_", ".") != RECEIPT_EVENT:
+        return []
+    data = payload.get("data")
+    updates = data if isinstance(data, list) else [data]
+    instance = payload.get("instance")
+    receipts = []
+    for update in updates:
+        if not isinstance(update, dict):
+            continue
+        key = update.get("key") if isinstance(update.get("key"), dict) else {}
+        message_id = update.get("keyId") or key.get("id")
+        status = update.get("status", (update.get("update") or {}).get("status"))
+        status = STATUS_NAMES.get(status, status) if isinstance(status, int) else status
+        from_me = update.get("fromMe", key.get("fromMe", True))
+        if not message_id or not isinstance(status, str) or not from_me:
+            continue
+        receipts.append((
+            str(message_id)[:100],
+            status.upper()[:20],
+            (update.get("remoteJid") or key.get("remoteJid") or "")[:100] or None,
+            instance,
+            _event_time(payload, update),
+        ))
+    return receipts
+
+
+class ReceiptBuffer:
+    """Acumula confirmaciones y las guarda cada `max_rows` eventos o `max_age` segundos.
+
+    Lo que está en memoria se pierde si el proceso muere antes de guardarlo; `max_pending`
+    acota la memoria (el webhook responde 503 y Evolution API puede reintentar).
+    """
+
+    def __init__(self, max_rows: int = 500, max_age: float = 1.0, max_pending: int = 100_000):
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.oldest = None
+        self._wake = asyncio.Event()
+
+    def add(self, receipts) -> bool:
+        """False si el buffer está lleno (el evento no se aceptó)"""
+        if len(self.pending) + len(receipts) > self.max_pending:
+            return False
+        if receipts and self.oldest is None:
+            self.oldest = time.monotonic()
+        self.pending.extend(receipts)
+        if len(self.pending) >= self.max_rows:
+            self._wake.set()
+        return True
+
+    async def flush(self, engine) -> int:
+        batch = [self.pending.popleft() for _ in range(min(len(self.pending), self.max_rows))]
+        self.oldest = time.monotonic() if self.pending else None
+        if not batch:
+            return 0
+        columns = list(zip(*batch))
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(
+                    text(INSERT_RECEIPTS_SQL),
+                    {
+                        "message_ids": list(columns[0]),
+                        "statuses": list(columns[1]),
+                        "remote_jids": list(columns[2]),
+                        "instances": list(columns[3]),
+                        "event_ats": list(columns[4]),
+                    },
+                )
+        except BaseException:
+            # Se devuelven al frente para el siguiente intento (también si cancelan la tarea)
+            self.pending.extendleft(reversed(batch))
+            self.oldest = self.oldest or time.monotonic()
+            raise
+        return len(batch)
+
+    async def run(self, engine, on_flush=None):
+        """Tarea de fondo: guarda por tamaño o antigüedad hasta que la cancelen"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.max_age)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self.pending and (
+                len(self.pending) >= self.max_rows or time.monotonic() - self.oldest >= self.max_age
+            ):
+                started = time.perf_counter()
+                try:
+                    saved = await self.flush(engine)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error guardando confirmaciones de entrega: {e}")
+                    await asyncio.sleep(self.max_age)
+                    break
+                if on_flush:
+                    on_flush(saved, time.perf_counter() - started)
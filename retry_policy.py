@@ -0,0 +1,48 @@
+import random
+
+from config import MAX_SEND_ATTEMPTS, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS
+from evolution import TEMPLATE_ERROR_PREFIX
+
+
+# --- Clasificación de respuestas de Evolution API y espera entre reintentos ---
+# Transitorio: vale la pena reintentar (caída del servidor, límite de tasa, timeout).
+# Permanente: el mismo envío fallaría igual (número inválido, plantilla rota).
+
+SENT = "sent"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+# Además de 5xx. 401/403/404 (apikey, permisos, instancia o número desconocidos) son
+# permanentes: reintentarlos solo oculta la mala configuración; una instancia caída ya
+# la detecta el despachador con pool.check y devuelve el trabajo a la cola
+TRANSIENT_STATUS = {408, 425, 429}
+
+
+def classify(status_code: int | None, body: str | None) -> str:
+    if status_code == 201:
+        return SENT
+    if status_code is None:
+        # Sin respuesta HTTP: timeout o error de conexión, salvo plantilla inválida
+        if body and body.startswith(TEMPLATE_ERROR_PREFIX):
+            return PERMANENT
+        return TRANSIENT
+    if status_code >= 500 or status_code in TRANSIENT_STATUS:
+        return TRANSIENT
+    return PERMANENT
+
+
+def backoff_seconds(attempt: int, retry_after: float | None = None) -> float:
+    """Backoff exponencial con jitter completo; nunca antes de lo que pidió Retry-After"""
+    ceiling = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempt - 1))
+    delay = random.uniform(RETRY_BASE_SECONDS / 2, ceiling)
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def retry_delay(attempts: int, status_code: int | None, body: str | None,
+                retry_after: float | None = None) -> float | None:
+    """Segundos hasta el próximo intento, o None si el resultado es definitivo"""
+    if classify(status_code, body) != TRANSIENT or attempts >= MAX_SEND_ATTEMPTS:
+        return None
+    return backoff_seconds(attempts, retry_after)
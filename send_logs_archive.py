@@ -0,0 +1,132 @@
+"""Mantenimiento de las particiones mensuales de send_logs.
+
+Las particiones más viejas que SEND_LOGS_RETENTION_MONTHS se desprenden de la tabla
+(DETACH PARTITION: un lock breve de send_logs que hace esperar a los envíos en curso
+solo ese instante), se copian a un CSV comprimido en
+SEND_LOGS_ARCHIVE_DIR y se eliminan. Si el proceso se corta a mitad, la siguiente
+corrida retoma las tablas ya desprendidas.
+
+    python send_logs_archive.py --status        # particiones, filas y tamaño
+    python send_logs_archive.py --archive       # archiva lo anterior a la retención
+    python send_logs_archive.py --archive --months 6 --keep-tables
+"""
+import argparse
+import gzip
+import os
+from datetime import date
+
+from sqlalchemy import create_engine, text
+
+from config import DB_URL, SEND_LOGS_ARCHIVE_DIR, SEND_LOGS_RETENTION_MONTHS
+
+# Meses futuros con partición ya creada (el despachador los asegura periódicamente)
+PARTITIONS_AHEAD = 3
+PARTITION_PREFIX = "send_logs_"
+
+
+def ensure_partitions(conn, months_ahead: int = PARTITIONS_AHEAD):
+    """Crea las particiones del mes actual y de los siguientes que falten"""
+    conn.execute(text("SELECT ensure_send_logs_partitions(:months)"), {"months": months_ahead})
+    conn.commit()
+
+
+def list_partitions(conn):
+    """(tabla, mes, adjunta, filas estimadas, bytes) de cada partición, incluso las ya desprendidas"""
+    return conn.execute(
+        text(
+            """
+            SELECT c.relname, to_date(substr(c.relname, length(:prefix) + 1), 'YYYY_MM') AS month,
+                   c.relispartition AS attached, c.reltuples::bigint AS rows,
+                   pg_total_relation_size(c.oid) AS bytes
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema()
+              AND c.relkind = 'r'
+              AND c.relname ~ ('^' || :prefix || '[0-9]{4}_[0-9]{2}$')
+            ORDER BY month
+            """
+        ),
+        {"prefix": PARTITION_PREFIX},
+    ).fetchall()
+
+
+def archive_partition(engine, table: str, attached: bool, archive_dir: str, drop: bool = True) -> str:
+    """Desprende la partición, la copia a <archive_dir>/<tabla>.csv.gz y la elimina; devuelve la ruta"""
+    if attached:
+        # Sin CONCURRENTLY: Postgres no lo permite con la partición DEFAULT (send_logs_default).
+        # Toma un ACCESS EXCLUSIVE breve sobre send_logs; lock_timeout evita quedar en cola
+        # detrás de una consulta larga bloqueando a la vez los envíos que llegan después
+        with engine.begin() as conn:
+            conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+            conn.execute(text(f'ALTER TABLE send_logs DETACH PARTITION "{table}"'))
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{table}.csv.gz")
+    partial = path + ".part"
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        with open(partial, "wb") as out:
+            with gzip.GzipFile(fileobj=out, mode="wb") as f:
+                cursor.copy_expert(f'COPY "{table}" TO STDOUT WITH CSV HEADER', f)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(partial, path)
+        # Solo se elimina cuando el archivo ya está completo en disco
+        if drop:
+            cursor.execute(f'DROP TABLE "{table}"')
+        raw.commit()
+        cursor.close()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+    return path
+
+
+def archive_old_partitions(engine, retention_months: int = SEND_LOGS_RETENTION_MONTHS,
+                           archive_dir: str = SEND_LOGS_ARCHIVE_DIR, drop: bool = True):
+    """Archiva las particiones de meses anteriores a la retención; devuelve las rutas escritas"""
+    today = date.today()
+    months = today.year * 12 + today.month - 1 - retention_months
+    cutoff = date(months // 12, months % 12 + 1, 1)
+    with engine.connect() as conn:
+        partitions = list_partitions(conn)
+    paths = []
+    for table, month, attached, _, _ in partitions:
+        if month >= cutoff or (not attached and not drop):
+            continue
+        paths.append(archive_partition(engine, table, attached, archive_dir, drop))
+        print(f"📦 {table} → {paths[-1]}")
+    return paths
+
+
+def print_status(engine):
+    with engine.connect() as conn:
+        for table, month, attached, rows, size in list_partitions(conn):
+            state = "adjunta" if attached else "desprendida"
+            print(f"{table:<20} {state:<12} ~{max(rows, 0):>12} filas {size / 1024 / 1024:>10.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="Solo listar las particiones")
+    parser.add_argument("--archive", action="store_true", help="Archivar las particiones vencidas")
+    parser.add_argument("--months", type=int, default=SEND_LOGS_RETENTION_MONTHS, help="Meses que se conservan en la DB")
+    parser.add_argument("--dir", default=SEND_LOGS_ARCHIVE_DIR, help="Carpeta de los archivos comprimidos")
+    parser.add_argument("--keep-tables", action="store_true", help="Desprender y copiar sin eliminar las tablas")
+    args = parser.parse_args()
+
+    engine = create_engine(DB_URL)
+    with engine.connect() as conn:
+        ensure_partitions(conn)
+    if args.archive:
+        paths = archive_old_partitions(engine, args.months, args.dir, drop=not args.keep_tables)
+        print(f"✅ {len(paths)} particiones archivadas.")
+    else:
+        print_status(engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+import json
+
+from sqlalchemy import text
+
+from config import SEND_LOG_RAW_BODY
+from evolution import summarize_response
+from telemetry import LATENCY_BUCKETS_MS
+
+
+# --- Cola persistente de envíos (tabla send_queue) ---
+# El panel solo encola; dispatcher.py reclama lotes con FOR UPDATE SKIP LOCKED,
+# de modo que varios workers pueden drenar la misma campaña sin pisarse.
+
+QUEUE_STATUSES = ["queued", "sending", "sent", "failed"]
+# last_error de un trabajo que pudo haber salido sin que se registrara el resultado.
+# No se reenvía solo (a lo sumo una entrega); resume_campaign puede reencolarlo a pedido.
+INTERRUPTED_ERROR = "interrumpido: entrega desconocida"
+# Clave arbitraria del advisory lock que serializa la programación de recordatorios
+REMINDER_LOCK_ID = 7421002
+
+
+def _response_json(summary: dict | None) -> str | None:
+    return json.dumps(summary, ensure_ascii=False) if summary else None
+
+
+def log_send_result(conn, request_id: int, status_code: int | None, body: str | None,
+                    instance: str | None = None):
+    message_id, summary = summarize_response(body)
+    conn.execute(
+        text(
+            "INSERT INTO send_logs (request_id, response_status, message_id, response, response_body, instance_name) "
+            "VALUES (:request_id, :status, :message_id, CAST(:response AS jsonb), :body, :instance)"
+        ),
+        {
+            "request_id": request_id,
+            "status": status_code,
+            "message_id": message_id,
+            "response": _response_json(summary),
+            "body": body if SEND_LOG_RAW_BODY else None,
+            "instance": instance,
+        },
+    )
+    conn.commit()
+
+
+def enqueue_requests(conn, request_ids, message_template: str | None = None, kind: str = "initial") -> int:
+    """Encola las solicitudes indicadas (omite las que ya tienen un envío en curso).
+
+    Sin `message_template` cada envío usa la plantilla guardada de su campaña.
+    """
+    if not request_ids:
+        return 0
+    result = conn.execute(
+        text(
+            """
+            INSERT INTO send_queue (request_id, campaign_id, message_template, kind)
+            SELECT h.id, h.campaign_id, :template, CAST(:kind AS send_kind)
+            FROM habeas_requests h
+            WHERE h.id = ANY(:ids)
+              AND NOT EXISTS (
+                  SELECT 1 FROM send_queue q
+                  WHERE q.request_id = h.id AND q.status IN ('queued', 'sending')
+              )
+            """
+        ),
+        {"ids": [int(i) for i in request_ids], "template": message_template, "kind": kind},
+    )
+    conn.commit()
+    return result.rowcount
+
+
+def claim_batch(conn, worker_id: str, limit: int):
+    """Reclama hasta `limit` envíos pendientes para este worker"""
+    rows = conn.execute(
+        text(
+            """
+            UPDATE send_queue q
+            SET status = 'sending',
+                worker_id = :worker_id,
+                locked_at = NOW(),
+                attempts = q.attempts + 1
+            FROM habeas_requests h
+            WHERE q.id IN (
+                SELECT id FROM send_queue
+                WHERE status = 'queued' AND available_at <= NOW()
+                ORDER BY available_at, id
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            AND h.id = q.request_id
+            RETURNING q.id, q.request_id, q.campaign_id, q.idempotency_key, q.attempts, q.kind,
+                      h.phone, h.name, h.token,
+                      COALESCE(q.message_template, (
+                          -- Variante del idioma de la solicitud, si no la del idioma por defecto
+                          SELECT t.body
+                          FROM campaign_templates t
+                          JOIN campaigns c ON c.id = t.campaign_id
+                          WHERE t.campaign_id = q.campaign_id
+                          ORDER BY t.language = h.language DESC, t.language = c.default_language DESC
+                          LIMIT 1
+                      )) AS message_template
+            """
+        ),
+        {"worker_id": worker_id, "limit": limit},
+    ).fetchall()
+    conn.commit()
+    return rows
+
+
+def release_jobs(conn, job_ids):
+    """Devuelve a la cola trabajos reclamados que no alcanzaron a enviarse"""
+    conn.execute(
+        text(
+            "UPDATE send_queue SET status = 'queued', worker_id = NULL, locked_at = NULL, "
+            "attempts = attempts - 1 WHERE id = ANY(:ids) AND status = 'sending'"
+        ),
+        {"ids": list(job_ids)},
+    )
+    conn.commit()
+
+
+def complete_jobs(conn, outcomes) -> int:
+    """Cierra un lote de trabajos con una sola sentencia; devuelve cuántos se aplicaron.
+
+    `outcomes` son dicts con job_id, key (idempotency_key), attempts, status_code, body,
+    instance y retry_in: si trae segundos, el trabajo vuelve a la cola para reintentarse
+    en ese plazo y la solicitud no cambia de estado (el intento sí queda en send_logs).
+    Solo se aplican a trabajos que siguen en 'sending' (o que el barrido dio por
+    interrumpidos) con la misma clave y el mismo número de intento, así que reaplicar un
+    lote ya guardado (ej. al reprocesar el journal tras una caída) no duplica send_logs
+    ni cierra el reintento siguiente, que conserva la clave y puede estar en otro worker.
+
+    Los tiempos opcionales (http_ms, wait_ms, db_ms) de lo aplicado se suman a la
+    telemetría por campaña y minuto en la misma sentencia.
+
+    En send_logs y en last_error el cuerpo queda resumido (message_id + response JSONB);
+    el texto crudo solo en send_logs y con SEND_LOG_RAW_BODY. El message_id queda también en el trabajo para
+    cruzarlo con las confirmaciones del webhook (message_receipts).
+    """
+    if not outcomes:
+        return 0
+    summaries = [summarize_response(o["body"]) for o in outcomes]
+    result = conn.execute(
+        text(
+            """
+            WITH v AS (
+                SELECT *
+                FROM unnest(
+                    CAST(:job_ids AS bigint[]),
+                    CAST(:codes AS integer[]),
+                    CAST(:bodies AS text[]),
+                    CAST(:instances AS text[]),
+                    CAST(:keys AS uuid[]),
+                    CAST(:retry_in AS double precision[]),
+                    CAST(:http_ms AS integer[]),
+                    CAST(:wait_ms AS integer[]),
+                    CAST(:db_ms AS integer[]),
+                    CAST(:message_ids AS text[]),
+                    CAST(:responses AS jsonb[]),
+                    CAST(:attempts AS integer[])
+                ) AS v(job_id, response_status, response_body, instance_name, idempotency_key, retry_in,
+                       http_ms, wait_ms, db_ms, message_id, response, attempts)
+            ),
+            done AS (
+                UPDATE send_queue q
+                SET status = CASE
+                        WHEN v.response_status = 201 THEN 'sent'
+                        WHEN v.retry_in IS NOT NULL THEN 'queued'
+                        ELSE 'failed'
+                    END::queue_status,
+                    last_error = CASE WHEN v.response_status = 201 THEN NULL ELSE v.response::text END,
+                    available_at = CASE
+                        WHEN v.retry_in IS NOT NULL THEN NOW() + make_interval(secs => v.retry_in)
+                        ELSE q.available_at
+                    END,
+                    worker_id = CASE WHEN v.retry_in IS NOT NULL THEN NULL ELSE q.worker_id END,
+                    locked_at = CASE WHEN v.retry_in IS NOT NULL THEN NULL ELSE q.locked_at END,
+                    instance_name = v.instance_name,
+                    message_id = COALESCE(v.message_id, q.message_id)
+                FROM v
+                WHERE q.id = v.job_id
+                  AND (q.status = 'sending' OR q.last_error = :interrupted)
+                  AND q.idempotency_key = COALESCE(v.idempotency_key, q.idempotency_key)
+                  -- Journals anteriores a este campo no traen attempts
+                  AND q.attempts = COALESCE(v.attempts, q.attempts)
+                RETURNING q.request_id, q.campaign_id, v.response_status, v.response_body, v.instance_name,
+                          q.idempotency_key, v.retry_in, v.http_ms, v.wait_ms, v.db_ms, v.message_id, v.response
+            ),
+            requests_done AS (
+                -- sent_at refleja el último envío efectivo (base de los reintentos > 5 días)
+                UPDATE habeas_requests h
+                SET sent_at = CASE WHEN d.response_status = 201 THEN NOW() ELSE h.sent_at END,
+                    status = CASE
+                        WHEN d.response_status = 201 AND h.status = 'failed' THEN 'pending'
+                        WHEN d.response_status IS DISTINCT FROM 201 AND h.status = 'pending' THEN 'failed'
+                        ELSE h.status
+                    END::request_status
+                FROM done d
+                WHERE h.id = d.request_id AND d.retry_in IS NULL
+            ),
+            stats AS (
+                INSERT INTO send_stats_minute AS s (
+                    campaign_id, minute, status_code, messages, http_ms_sum, wait_ms_sum, db_ms_sum
+                )
+                SELECT campaign_id, date_trunc('minute', NOW()), COALESCE(response_status, 0), COUNT(*),
+                       COALESCE(SUM(http_ms), 0), COALESCE(SUM(wait_ms), 0), COALESCE(SUM(db_ms), 0)
+                FROM done
+                WHERE campaign_id IS NOT NULL
+                GROUP BY campaign_id, COALESCE(response_status, 0)
+                ON CONFLICT (campaign_id, minute, status_code) DO UPDATE
+                SET messages = s.messages + EXCLUDED.messages,
+                    http_ms_sum = s.http_ms_sum + EXCLUDED.http_ms_sum,
+                    wait_ms_sum = s.wait_ms_sum + EXCLUDED.wait_ms_sum,
+                    db_ms_sum = s.db_ms_sum + EXCLUDED.db_ms_sum
+            ),
+            latency AS (
+                INSERT INTO send_latency_minute AS l (campaign_id, minute, bucket_ms, messages)
+                SELECT d.campaign_id, date_trunc('minute', NOW()), b.bucket_ms, COUNT(*)
+                FROM done d
+                CROSS JOIN LATERAL (
+                    SELECT MIN(bound) AS bucket_ms
+                    FROM unnest(CAST(:latency_buckets AS integer[])) AS bound
+                    WHERE bound >= d.http_ms
+                ) b
+                WHERE d.campaign_id IS NOT NULL AND d.http_ms IS NOT NULL
+                GROUP BY d.campaign_id, b.bucket_ms
+                ON CONFLICT (campaign_id, minute, bucket_ms) DO UPDATE
+                SET messages = l.messages + EXCLUDED.messages
+            )
+            INSERT INTO send_logs (
+                request_id, response_status, message_id, response, response_body, instance_name, idempotency_key
+            )
+            SELECT request_id, response_status, message_id, response,
+                   CASE WHEN :raw_body THEN response_body END, instance_name, idempotency_key
+            FROM done
+            """
+        ),
+        {
+            "job_ids": [o["job_id"] for o in outcomes],
+            "codes": [o["status_code"] for o in outcomes],
+            "bodies": [o["body"] for o in outcomes],
+            "instances": [o["instance"] for o in outcomes],
+            "keys": [o.get("key") for o in outcomes],
+            "retry_in": [o.get("retry_in") for o in outcomes],
+            "http_ms": [o.get("http_ms") for o in outcomes],
+            "wait_ms": [o.get("wait_ms") for o in outcomes],
+            "db_ms": [o.get("db_ms") for o in outcomes],
+            "message_ids": [message_id for message_id, _ in summaries],
+            "responses": [_response_json(summary) for _, summary in summaries],
+            "attempts": [o.get("attempts") for o in outcomes],
+            "raw_body": SEND_LOG_RAW_BODY,
+            "latency_buckets": LATENCY_BUCKETS_MS,
+            "interrupted": INTERRUPTED_ERROR,
+        },
+    )
+    conn.commit()
+    return result.rowcount
+
+
+def recover_worker_jobs(conn, worker_id: str, attempted_job_ids) -> tuple[int, int]:
+    """Cierra los trabajos que un worker caído dejó en 'sending'; devuelve (interrumpidos, devueltos).
+
+    Los que alcanzó a intentar (intención en su journal, sin resultado) pudieron
+    entregarse: quedan en 'failed' con INTERRUPTED_ERROR. El resto nunca salió y
+    vuelve a la cola.
+    """
+    row = conn.execute(
+        text(
+            """
+            WITH interrupted AS (
+                UPDATE send_queue
+                SET status = 'failed', last_error = :interrupted, locked_at = NULL
+                WHERE worker_id = :worker_id AND status = 'sending' AND id = ANY(:ids)
+                RETURNING id
+            ),
+            released AS (
+                UPDATE send_queue
+                SET status = 'queued', worker_id = NULL, locked_at = NULL, attempts = attempts - 1
+                WHERE worker_id = :worker_id AND status = 'sending' AND NOT (id = ANY(:ids))
+                RETURNING id
+            )
+            SELECT (SELECT COUNT(*) FROM interrupted), (SELECT COUNT(*) FROM released)
+            """
+        ),
+        {"worker_id": worker_id, "ids": [int(i) for i in attempted_job_ids], "interrupted": INTERRUPTED_ERROR},
+    ).fetchone()
+    conn.commit()
+    return int(row[0]), int(row[1])
+
+
+def recover_stale_jobs(conn, lease_minutes: float) -> int:
+    """Marca como interrumpidos los trabajos en 'sending' más viejos que el lease.
+
+    Cubre workers que desaparecieron sin dejar journal (ej. volumen perdido): no se
+    sabe si el mensaje salió, así que no se reencolan.
+    """
+    result = conn.execute(
+        text(
+            "UPDATE send_queue SET status = 'failed', last_error = :interrupted, locked_at = NULL "
+            "WHERE status = 'sending' AND locked_at < NOW() - make_interval(mins => :lease)"
+        ),
+        {"interrupted": INTERRUPTED_ERROR, "lease": int(lease_minutes)},
+    )
+    conn.commit()
+    return result.rowcount
+
+
+def resume_campaign(conn, campaign_id: int, message_template: str | None = None,
+                    include_interrupted: bool = False) -> dict:
+    """Reanuda una campaña sin reenviar lo ya entregado; devuelve los conteos para la UI.
+
+    Encola las solicitudes pendientes o fallidas que nunca tuvieron trabajo en la cola
+    ni un envío exitoso (ej. cargadas antes de la cola o por un CSV repetido). Con
+    `include_interrupted` también reencola, con clave nueva, los trabajos interrumpidos.
+    """
+    row = conn.execute(
+        text(
+            """
+            WITH requeued AS (
+                UPDATE send_queue
+                SET status = 'queued', idempotency_key = gen_random_uuid(),
+                    last_error = NULL, worker_id = NULL, locked_at = NULL
+                WHERE campaign_id = :campaign_id AND status = 'failed'
+                  AND last_error = :interrupted AND :include_interrupted
+                RETURNING id
+            ),
+            missing AS (
+                INSERT INTO send_queue (request_id, campaign_id, message_template)
+                SELECT h.id, h.campaign_id, :template
+                FROM habeas_requests h
+                WHERE h.campaign_id = :campaign_id
+                  AND h.status IN ('pending', 'failed')
+                  AND NOT EXISTS (SELECT 1 FROM send_queue q WHERE q.request_id = h.id)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM send_logs s WHERE s.request_id = h.id AND s.response_status = 201
+                  )
+                RETURNING id
+            )
+            SELECT (SELECT COUNT(*) FROM requeued), (SELECT COUNT(*) FROM missing)
+            """
+        ),
+        {
+            "campaign_id": campaign_id,
+            "template": message_template,
+            "interrupted": INTERRUPTED_ERROR,
+            "include_interrupted": include_interrupted,
+        },
+    ).fetchone()
+    conn.commit()
+    return {"requeued": int(row[0]), "enqueued": int(row[1])}
+
+
+def interrupted_count(conn, campaign_id: int) -> int:
+    return conn.execute(
+        text(
+            "SELECT COUNT(*) FROM send_queue "
+            "WHERE campaign_id = :id AND status = 'failed' AND last_error = :interrupted"
+        ),
+        {"id": campaign_id, "interrupted": INTERRUPTED_ERROR},
+    ).scalar_one()
+
+
+def schedule_reminders(conn, after_days: int, max_reminders: int) -> int:
+    """Encola recordatorios para solicitudes pendientes sin respuesta; devuelve cuántos.
+
+    Toma las pendientes cuyo último envío efectivo (sent_at) tiene más de `after_days`
+    días, con el enlace aún vigente, sin envío en curso y con menos de `max_reminders`
+    recordatorios. Reutiliza la plantilla del último envío de cada solicitud (NULL: la
+    de la campaña). Un advisory
+    lock de transacción evita que dos despachadores programen el mismo recordatorio.
+    """
+    if max_reminders <= 0:
+        return 0
+    locked = conn.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": REMINDER_LOCK_ID}).scalar()
+    if not locked:
+        conn.rollback()
+        return 0
+    result = conn.execute(
+        text(
+            """
+            INSERT INTO send_queue (request_id, campaign_id, message_template, kind)
+            SELECT h.id, h.campaign_id, last.message_template, 'reminder'
+            FROM habeas_requests h
+            LEFT JOIN LATERAL (
+                SELECT message_template FROM send_queue q
+                WHERE q.request_id = h.id
+                ORDER BY q.id DESC
+                LIMIT 1
+            ) last ON TRUE
+            WHERE h.status = 'pending'
+              AND h.sent_at < NOW() - make_interval(days => :days)
+              AND (h.expires_at IS NULL OR h.expires_at > NOW())
+              AND NOT EXISTS (
+                  SELECT 1 FROM send_queue q
+                  WHERE q.request_id = h.id AND q.status IN ('queued', 'sending')
+              )
+              AND (
+                  SELECT COUNT(*) FROM send_queue q
+                  WHERE q.request_id = h.id AND q.kind = 'reminder'
+              ) < :max_reminders
+            """
+        ),
+        {"days": after_days, "max_reminders": max_reminders},
+    )
+    conn.commit()
+    return result.rowcount
+
+
+def campaign_progress(conn, campaign_id: int, kind: str = "initial") -> dict:
+    """Conteo de trabajos por estado para una campaña (por defecto sin recordatorios)"""
+    rows = conn.execute(
+        text(
+            "SELECT status, COUNT(*) FROM send_queue "
+            "WHERE campaign_id = :id AND kind = CAST(:kind AS send_kind) GROUP BY status"
+        ),
+        {"id": campaign_id, "kind": kind},
+    ).fetchall()
+    progress = {s: 0 for s in QUEUE_STATUSES}
+    progress.update({str(status): count for status, count in rows})
+    return progress
@@ -0,0 +1,103 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple
+
+from config import SEND_CONCURRENCY
+from evolution import post_whatsapp_text
+
+
+class TokenBucket:
+    """Limitador de tasa: `rate` fichas por segundo con ráfaga máxima `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Toma una ficha si hay; si no, devuelve los segundos que faltan para la próxima"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def defer(self, seconds: float):
+        """No entrega fichas durante `seconds` (ej. la API respondió 429 con Retry-After)"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def acquire(self) -> float:
+        """Bloquea hasta obtener una ficha; devuelve los segundos esperados"""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire()
+            if delay == 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+class SendResult(NamedTuple):
+    job: object
+    instance: str
+    status_code: int | None
+    body: str | None
+    retry_after: float | None
+    wait_ms: int  # Espera por cupo de la instancia (token bucket)
+    http_ms: int  # POST a Evolution API
+
+
+class ConcurrentSender:
+    """Envía mensajes con N hilos sobre la sesión HTTP compartida, repartidos en el pool de instancias"""
+
+    def __init__(self, pool, concurrency: int = SEND_CONCURRENCY, before_send=None):
+        self.pool = pool
+        self.before_send = before_send  # Se llama con el job justo antes del POST
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="sender")
+
+    def _send(self, job, message: str, should_stop):
+        started = time.perf_counter()
+        instance = self.pool.acquire(should_stop)
+        if instance is None:
+            return None
+        if self.before_send:
+            self.before_send(job)
+        posted = time.perf_counter()
+        status_code, body, retry_after = post_whatsapp_text(job.phone, message, instance)
+        return SendResult(
+            job, instance, status_code, body, retry_after,
+            wait_ms=int((posted - started) * 1000),
+            http_ms=int((time.perf_counter() - posted) * 1000),
+        )
+
+    def send_batch(self, jobs, messages: dict, should_stop=lambda: False):
+        """Genera un SendResult por mensaje a medida que terminan los envíos.
+
+        `messages` trae el texto ya armado de cada trabajo ({job.id: texto}).
+        Si `should_stop()` se vuelve verdadero se cancelan los envíos aún no iniciados.
+        Los trabajos cancelados o sin instancia sana disponible no aparecen en el resultado.
+        """
+        futures = {self.executor.submit(self._send, job, messages[job.id], should_stop): job for job in jobs}
+        for future in as_completed(futures):
+            if should_stop():
+                for pending in futures:
+                    pending.cancel()
+            if future.cancelled():
+                continue
+            result = future.result()
+            if result is None:
+                continue
+            yield result
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
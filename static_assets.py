@@ -0,0 +1,133 @@
+"""Archivos estáticos de la landing con nombre por contenido y variantes precomprimidas.
+
+Al construir la imagen se copia cada archivo de static/ como nombre.<hash>.ext, con
+sus variantes .gz y .br cuando ahorran al menos un 10 %, y se escribe manifest.json.
+Las plantillas enlazan con asset_url("politica.pdf"): la URL cambia cuando cambia el
+contenido, así que el navegador puede guardarla un año sin volver a pedirla.
+
+    python static_assets.py static   # lo ejecuta el Dockerfile
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+MANIFEST_NAME = "manifest.json"
+HASH_CHARS = 16
+# Una variante comprimida se guarda solo si pesa como mucho esto del original (ej. los PDF ya vienen comprimidos)
+MIN_COMPRESSION_RATIO = 0.9
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+# Sufijo de archivo de cada Content-Encoding, en orden de preferencia
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compress_variants(path: str, data: bytes, brotli=None):
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) <= len(data) * MIN_COMPRESSION_RATIO:
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+
+
+def build(directory: str) -> dict:
+    """Genera las copias con hash y sus variantes; devuelve el manifiesto {nombre: {path, etag}}"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("brotli no está instalado; solo se generan variantes .gz")
+    # Lo generado en una corrida anterior no se vuelve a procesar
+    generated = {MANIFEST_NAME}
+    for entry in load_manifest(directory).values():
+        generated.update(entry["path"] + suffix for suffix in ("", ".gz", ".br"))
+    manifest = {}
+    for name in sorted(os.listdir(directory)):
+        source = os.path.join(directory, name)
+        if not os.path.isfile(source) or name in generated:
+            continue
+        with open(source, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:HASH_CHARS]
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{digest}{ext}"
+        target = os.path.join(directory, hashed)
+        with open(target, "wb") as f:
+            f.write(data)
+        _compress_variants(target, data, brotli)
+        manifest[name] = {"path": hashed, "etag": digest}
+    with open(os.path.join(directory, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(directory: str) -> dict:
+    """Manifiesto de la imagen; vacío en desarrollo (se sirven los nombres originales)"""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles con Cache-Control inmutable para los nombres con hash, ETag por contenido
+    y negociación de las variantes .br/.gz (las peticiones con Range reciben el original)"""
+
+    def __init__(self, *, directory: str, manifest: dict, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.etags = {entry["path"]: entry["etag"] for entry in manifest.values()}
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        name = os.path.basename(full_path)
+        digest = self.etags.get(name)
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        path, encoding = full_path, None
+        if status_code == 200 and "range" not in request_headers:
+            accepted = {value.split(";")[0].strip() for value in request_headers.get("accept-encoding", "").split(",")}
+            for candidate, suffix in ENCODINGS:
+                if candidate in accepted and os.path.isfile(full_path + suffix):
+                    path, encoding = full_path + suffix, candidate
+                    stat_result = os.stat(path)
+                    break
+
+        headers = {"cache-control": IMMUTABLE if digest else REVALIDATE, "vary": "Accept-Encoding"}
+        if digest:
+            headers["etag"] = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+        if encoding:
+            headers["content-encoding"] = encoding
+        response = FileResponse(path, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class PageGZipMiddleware(GZipMiddleware):
+    """Comprime las páginas renderizadas; lo que está bajo `static_prefix` ya trae sus variantes"""
+
+    def __init__(self, app, static_prefix: str = "/static/", **kwargs):
+        super().__init__(app, **kwargs)
+        self.static_prefix = static_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.static_prefix):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+if __name__ == "__main__":
+    built = build(sys.argv[1] if len(sys.argv) > 1 else "static")
+    for original, entry in built.items():
+        print(f"{original} → {entry['path']}")
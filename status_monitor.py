@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import text
+
+from config import STATUS_LOG_RETENTION_DAYS, STATUS_POLL_SECONDS
+from evolution import check_evolution_status
+
+# Muestras de latencia en memoria por instancia (~6 h con el intervalo por defecto)
+HISTORY_SIZE = 1440
+
+
+class StatusMonitor:
+    """Consulta connectionState en segundo plano y guarda el último estado conocido.
+
+    El panel lee `latest` sin bloquear; cada consulta queda en instance_status_log
+    (con previous_state cuando la instancia cambió) para reconstruir caídas.
+    """
+
+    def __init__(self, engine, instances, interval: float = STATUS_POLL_SECONDS):
+        self.engine = engine
+        self.instances = list(instances)
+        self.interval = interval
+        self.latest = {}  # instancia -> (estado, checked_at, latency_ms)
+        self.history = {name: deque(maxlen=HISTORY_SIZE) for name in self.instances}
+        self.lock = threading.Lock()
+        self._last_prune = 0.0
+        self._thread = threading.Thread(target=self._loop, name="evolution-status", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while True:
+            try:
+                self.poll_now()
+                self._prune()
+            except Exception as e:
+                print(f"Monitor de estado: {e}")
+            time.sleep(self.interval)
+
+    def poll_now(self):
+        """Consulta todas las instancias una vez (el botón "Actualizar" del panel la llama directo)"""
+        samples = []
+        for name in self.instances:
+            started = time.perf_counter()
+            state = check_evolution_status(name)
+            latency_ms = int((time.perf_counter() - started) * 1000)
+            checked_at = datetime.now()
+            with self.lock:
+                previous = self.latest.get(name, (None,))[0]
+                self.latest[name] = (state, checked_at, latency_ms)
+                self.history[name].append((checked_at, latency_ms, state))
+            samples.append({
+                "instance": name,
+                "state": state,
+                "previous": previous if previous != state else None,
+                "latency": latency_ms,
+                "checked_at": checked_at,
+            })
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    "INSERT INTO instance_status_log (instance_name, state, previous_state, latency_ms, checked_at) "
+                    "VALUES (:instance, :state, :previous, :latency, :checked_at)"
+                ),
+                samples,
+            )
+
+    def _prune(self):
+        if time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM instance_status_log WHERE checked_at < NOW() - make_interval(days => :days)"),
+                {"days": STATUS_LOG_RETENTION_DAYS},
+            )
+
+    def snapshot(self):
+        """Último estado conocido e historial de latencia, sin tocar la red"""
+        with self.lock:
+            return dict(self.latest), {name: list(samples) for name, samples in self.history.items()}
+
+
+def recent_state_changes(conn, limit: int = 10):
+    return conn.execute(
+        text(
+            "SELECT instance_name, previous_state, state, checked_at FROM instance_status_log "
+            "WHERE previous_state IS NOT NULL ORDER BY checked_at DESC LIMIT :limit"
+        ),
+        {"limit": limit},
+    ).fetchall()
@@ -0,0 +1,95 @@
+from sqlalchemy import text
+
+
+# --- Telemetría del envío por campaña ---
+# Cada resultado lleva sus tiempos (espera por cupo, HTTP a Evolution, DB amortizada)
+# y complete_jobs los suma en send_stats_minute / send_latency_minute. El panel
+# calcula ritmo, ETA, errores y percentiles desde esas tablas agregadas.
+
+# Límites superiores (ms) del histograma de latencia HTTP; el último recoge el resto
+LATENCY_BUCKETS_MS = [50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 8000, 15000, 2147483647]
+TELEMETRY_WINDOW_MINUTES = 15
+
+
+def _percentile(buckets, fraction: float):
+    """Percentil aproximado (límite superior del bucket) desde [(bucket_ms, mensajes)]"""
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+    cumulative = 0
+    for bucket_ms, count in buckets:
+        cumulative += count
+        if cumulative >= fraction * total:
+            return bucket_ms
+    return buckets[-1][0]
+
+
+def campaign_telemetry(conn, campaign_id: int, window_minutes: int = TELEMETRY_WINDOW_MINUTES) -> dict:
+    """Ritmo, errores por código y latencias de los últimos `window_minutes` minutos"""
+    params = {"id": campaign_id, "minutes": window_minutes}
+    by_status = conn.execute(
+        text(
+            """
+            SELECT status_code, SUM(messages) AS messages, SUM(http_ms_sum) AS http_ms,
+                   SUM(wait_ms_sum) AS wait_ms, SUM(db_ms_sum) AS db_ms
+            FROM send_stats_minute
+            WHERE campaign_id = :id AND minute >= date_trunc('minute', NOW()) - make_interval(mins => :minutes)
+            GROUP BY status_code
+            ORDER BY status_code
+            """
+        ),
+        params,
+    ).fetchall()
+    buckets = conn.execute(
+        text(
+            """
+            SELECT bucket_ms, SUM(messages)
+            FROM send_latency_minute
+            WHERE campaign_id = :id AND minute >= date_trunc('minute', NOW()) - make_interval(mins => :minutes)
+            GROUP BY bucket_ms
+            ORDER BY bucket_ms
+            """
+        ),
+        params,
+    ).fetchall()
+    per_minute = conn.execute(
+        text(
+            """
+            SELECT minute, SUM(messages) FILTER (WHERE status_code = 201) AS sent,
+                   SUM(messages) FILTER (WHERE status_code <> 201) AS errors
+            FROM send_stats_minute
+            WHERE campaign_id = :id AND minute >= date_trunc('minute', NOW()) - make_interval(mins => :minutes)
+            GROUP BY minute
+            ORDER BY minute
+            """
+        ),
+        params,
+    ).fetchall()
+
+    # Minutos con actividad dentro de la ventana: una campaña recién iniciada no se diluye en 15
+    active_minutes = conn.execute(
+        text(
+            """
+            SELECT EXTRACT(EPOCH FROM NOW() - MIN(minute)) / 60
+            FROM send_stats_minute
+            WHERE campaign_id = :id AND minute >= date_trunc('minute', NOW()) - make_interval(mins => :minutes)
+            """
+        ),
+        params,
+    ).scalar()
+    active_minutes = min(window_minutes, max(1.0, float(active_minutes or 0)))
+
+    attempts = sum(row.messages for row in by_status)
+    sent = sum(row.messages for row in by_status if row.status_code == 201)
+    return {
+        "attempts": attempts,
+        "sent_per_minute": sent / active_minutes,
+        "error_rate": (attempts - sent) / attempts if attempts else 0.0,
+        "errors_by_status": {row.status_code: row.messages for row in by_status if row.status_code != 201},
+        "p50_ms": _percentile(buckets, 0.50),
+        "p95_ms": _percentile(buckets, 0.95),
+        "avg_http_ms": sum(row.http_ms for row in by_status) / attempts if attempts else None,
+        "avg_wait_ms": sum(row.wait_ms for row in by_status) / attempts if attempts else None,
+        "avg_db_ms": sum(row.db_ms for row in by_status) / attempts if attempts else None,
+        "per_minute": per_minute,
+    }
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import asyncpg
+from markupsafe import Markup
+
+# Canal que dispara el trigger de legal_terms (ver init.sql)
+TERMS_CHANNEL = "legal_terms_changed"
+
+
+class TermsCache:
+    """Caché LRU con TTL del texto legal y su fragmento HTML ya renderizado, por terms_version"""
+
+    def __init__(self, maxsize: int = 32, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, str, Markup]] = OrderedDict()
+
+    def get(self, version: str):
+        entry = self.entries.get(version)
+        if entry is None:
+            return None
+        stored_at, content, fragment = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[version]
+            return None
+        self.entries.move_to_end(version)
+        return content, fragment
+
+    def put(self, version: str, content: str, fragment: Markup):
+        self.entries[version] = (time.monotonic(), content, fragment)
+        self.entries.move_to_end(version)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, version: str | None = None):
+        if version is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(version, None)
+
+
+async def listen_for_changes(dsn: str, cache: TermsCache, retry_seconds: float = 5):
+    """Invalida la caché con LISTEN/NOTIFY; si la conexión cae, limpia todo y reconecta"""
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn)
+            await conn.add_listener(
+                TERMS_CHANNEL, lambda _conn, _pid, _channel, version: cache.invalidate(version or None)
+            )
+            while not conn.is_closed():
+                await asyncio.sleep(retry_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Escucha de {TERMS_CHANNEL} interrumpida: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        # Mientras no hubo escucha pudimos perder notificaciones
+        cache.invalidate()
+        await asyncio.sleep(retry_seconds)
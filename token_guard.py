@@ -0,0 +1,73 @@
+import time
+import uuid
+from collections import OrderedDict
+
+# Filtro en memoria delante de /auth/{token}: formato UUID, tokens que ya sabemos
+# inválidos o expirados y cupo por IP. Lo que se resuelve aquí no toca Postgres.
+# Los tokens expirados no vuelven a ser válidos (expires_at no se extiende) y uno
+# inexistente solo aparecería por colisión de gen_random_uuid().
+
+# Formas que acepta uuid.UUID: 32 hex, 36 con guiones, con llaves o prefijo urn:uuid:
+_UUID_LENGTHS = {32, 36, 38, 45}
+
+
+def parse_token(token: str) -> str | None:
+    """Token en forma canónica o None si no es un UUID"""
+    if len(token) not in _UUID_LENGTHS:
+        return None
+    try:
+        return str(uuid.UUID(token))
+    except ValueError:
+        return None
+
+
+class NegativeCache:
+    """Tokens inválidos o expirados con su resultado, LRU acotada y con TTL"""
+
+    def __init__(self, maxsize: int = 100_000, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, token: str) -> str | None:
+        entry = self.entries.get(token)
+        if entry is None:
+            return None
+        stored_at, outcome = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[token]
+            return None
+        self.entries.move_to_end(token)
+        return outcome
+
+    def put(self, token: str, outcome: str):
+        self.entries[token] = (time.monotonic(), outcome)
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class RateLimiter:
+    """Token bucket por IP; las IPs inactivas más antiguas se descartan al pasar de `max_clients`"""
+
+    def __init__(self, rate_per_minute: float = 60, burst: int = 20, max_clients: int = 50_000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # ip -> (tokens, updated_at)
+
+    def allow(self, client: str) -> float | None:
+        """None si la petición pasa; si no, segundos hasta el próximo cupo"""
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.buckets[client] = (tokens, now)
+        self.buckets.move_to_end(client)
+        while len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+        if allowed:
+            return None
+        return (1 - tokens) / self.rate if self.rate > 0 else 60.0